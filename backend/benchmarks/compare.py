@@ -0,0 +1,82 @@
+import argparse
+import json
+import sys
+from typing import Dict, Optional, Tuple
+
+# Metrics compared between runs, and whether higher values are better
+METRICS = (
+    ("p50", False),
+    ("p95", False),
+    ("p99", False),
+    ("throughput", True),
+    ("peak_rss_mb", False),
+)
+
+
+def _key(result: Dict) -> Tuple:
+    return (result["name"], tuple(sorted((key, str(value)) for key, value in result["params"].items())))
+
+
+def _value(result: Dict, metric: str) -> Optional[float]:
+    if metric in result["latency_ms"]:
+        return result["latency_ms"][metric]
+    return result.get(metric)
+
+
+def compare(baseline: Dict, current: Dict, threshold: float) -> int:
+    """
+    Print the change of every metric between two reports.
+
+    Returns:
+        Number of metrics that got worse by more than ``threshold`` percent
+    """
+    baseline_results = {_key(result): result for result in baseline["results"]}
+    regressions = 0
+    for result in current["results"]:
+        previous = baseline_results.get(_key(result))
+        params = " ".join(f"{key}={value}" for key, value in result["params"].items())
+        if previous is None:
+            print(f"{result['name']} {params}: not in the baseline")
+            continue
+        changes = []
+        for metric, higher_is_better in METRICS:
+            old, new = _value(previous, metric), _value(result, metric)
+            if not old or new is None:
+                continue
+            change = (new - old) / old * 100
+            worse = -change if higher_is_better else change
+            flag = ""
+            if worse > threshold:
+                flag = " REGRESSION"
+                regressions += 1
+            changes.append(f"{metric} {old:.2f} -> {new:.2f} ({change:+.1f}%){flag}")
+        print(f"{result['name']} {params}")
+        for change in changes:
+            print(f"    {change}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare two benchmark reports.")
+    parser.add_argument("baseline", help="Report from the reference run")
+    parser.add_argument("current", help="Report from the run being checked")
+    parser.add_argument("--threshold", type=float, default=10.0,
+                        help="Percent change counted as a regression")
+    args = parser.parse_args()
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    with open(args.current) as f:
+        current = json.load(f)
+    if baseline.get("suite") != current.get("suite"):
+        parser.error(f"Reports are from different suites: {baseline.get('suite')} and {current.get('suite')}")
+    if baseline["environment"].get("cpus") != current["environment"].get("cpus"):
+        print("Warning: the reports were produced on machines with different CPU counts")
+
+    regressions = compare(baseline, current, args.threshold)
+    print(f"{regressions} regression(s) above {args.threshold:g}%")
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,210 @@
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+from io import BytesIO
+from typing import Callable, Dict, List, Optional, Sequence
+
+import numpy as np
+from PIL import Image
+
+# Shared helpers for the benchmark scripts: timing loops, latency summaries,
+# peak memory, synthetic inputs and the JSON report format compared by
+# compare.py.
+
+REPORT_VERSION = 1
+
+
+def percentile(values: Sequence[float], q: float) -> Optional[float]:
+    if not len(values):
+        return None
+    return float(np.percentile(np.asarray(values, dtype=np.float64), q))
+
+
+def summarize(latencies: Sequence[float], elapsed: float, items: int, unit: str) -> Dict:
+    """
+    Summarize the latencies (in seconds) of a run.
+
+    Args:
+        latencies: Duration of every timed call or request
+        elapsed: Wall time of the whole run, for the throughput
+        items: Units of work done in that time (images, requests, ...)
+        unit: Name of those units, e.g. ``images/s``
+    """
+    latencies_ms = np.asarray(latencies, dtype=np.float64) * 1000
+    return {
+        "count": len(latencies_ms),
+        "latency_ms": {
+            "mean": float(latencies_ms.mean()) if len(latencies_ms) else None,
+            "min": float(latencies_ms.min()) if len(latencies_ms) else None,
+            "p50": percentile(latencies_ms, 50),
+            "p95": percentile(latencies_ms, 95),
+            "p99": percentile(latencies_ms, 99),
+            "max": float(latencies_ms.max()) if len(latencies_ms) else None,
+        },
+        "throughput": items / elapsed if elapsed > 0 else None,
+        "throughput_unit": unit,
+    }
+
+
+def measure(fn: Callable[[], object], iterations: int, warmup: int = 3,
+            max_seconds: Optional[float] = None) -> Dict:
+    """
+    Call ``fn`` repeatedly and time every call.
+
+    Stops after ``iterations`` calls, or earlier once ``max_seconds`` have
+    passed (but never before five calls), so slow cases stay bounded.
+
+    Returns:
+        Dictionary with the per-call ``latencies`` (seconds) and ``elapsed``
+    """
+    for _ in range(warmup):
+        fn()
+    latencies = []
+    started = time.perf_counter()
+    for _ in range(iterations):
+        call_started = time.perf_counter()
+        fn()
+        latencies.append(time.perf_counter() - call_started)
+        if max_seconds is not None and len(latencies) >= 5 and time.perf_counter() - started > max_seconds:
+            break
+    return {"latencies": latencies, "elapsed": time.perf_counter() - started}
+
+
+def reset_peak_rss(pid: Optional[int] = None):
+    """
+    Reset the peak RSS of this process, or of ``pid`` and its descendants,
+    so the next reading covers a single case. Only possible on Linux;
+    elsewhere peaks accumulate over the whole run.
+    """
+    for target in ["self"] if pid is None else process_tree(pid):
+        try:
+            with open(f"/proc/{target}/clear_refs", "w") as f:
+                f.write("5")
+        except OSError:
+            pass
+
+
+def _proc_status_kb(pid: int, field: str) -> Optional[int]:
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith(field + ":"):
+                    return int(line.split()[1])
+    except OSError:
+        return None
+    return None
+
+
+def process_tree(pid: int) -> List[int]:
+    """``pid`` and its descendants (e.g. gunicorn workers), on Linux."""
+    pids = [pid]
+    index = 0
+    while index < len(pids):
+        current = pids[index]
+        try:
+            with open(f"/proc/{current}/task/{current}/children") as f:
+                pids.extend(int(child) for child in f.read().split())
+        except OSError:
+            pass
+        index += 1
+    return pids
+
+
+def peak_rss_mb(pid: Optional[int] = None) -> Optional[float]:
+    """
+    Peak resident memory in MiB.
+
+    For another process, the peaks of it and its descendants are added up;
+    that is an upper bound, since they need not have peaked together.
+    """
+    if pid is None:
+        kb = _proc_status_kb(os.getpid(), "VmHWM")
+        if kb is None:
+            # ru_maxrss is in KiB on Linux but bytes on macOS
+            maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+            kb = maxrss // 1024 if sys.platform == "darwin" else maxrss
+        return kb / 1024
+    peaks = [_proc_status_kb(child, "VmHWM") for child in process_tree(pid)]
+    peaks = [kb for kb in peaks if kb is not None]
+    return sum(peaks) / 1024 if peaks else None
+
+
+def synthetic_image(width: int, height: int, seed: int = 0, quality: int = 90) -> bytes:
+    """
+    Encode a deterministic JPEG of the given size.
+
+    The content is smooth noise scaled up from a small random image, which
+    compresses and decodes more like a photo than per-pixel noise would.
+    """
+    rng = np.random.default_rng(seed)
+    small = rng.integers(0, 256, size=(16, 16, 3), dtype=np.uint8)
+    image = Image.fromarray(small).resize((width, height), Image.Resampling.BILINEAR)
+    buffer = BytesIO()
+    image.save(buffer, format="JPEG", quality=quality)
+    return buffer.getvalue()
+
+
+def parse_resolution(value: str) -> tuple:
+    width, height = value.lower().split("x")
+    return int(width), int(height)
+
+
+def environment() -> Dict:
+    """Describe the machine and code a report was produced on."""
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    try:
+        cpus = len(os.sched_getaffinity(0))
+    except AttributeError:
+        cpus = os.cpu_count()
+    return {
+        "git_commit": commit,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "machine": platform.machine(),
+        "cpus": cpus,
+        "env": {
+            name: os.environ[name]
+            for name in sorted(os.environ)
+            if name.startswith(("MODEL_", "BATCH_", "INFERENCE_"))
+        },
+    }
+
+
+def write_report(path: str, suite: str, config: Dict, results: List[Dict]):
+    """Write a benchmark report as JSON, creating the directory if needed."""
+    report = {
+        "version": REPORT_VERSION,
+        "suite": suite,
+        "created_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "environment": environment(),
+        "config": config,
+        "results": results,
+    }
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(path, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Wrote {len(results)} results to {path}")
+
+
+def print_result(result: Dict):
+    latency = result["latency_ms"]
+    params = " ".join(f"{key}={value}" for key, value in result["params"].items())
+    throughput = result["throughput"]
+    print(
+        f"{result['name']:<20} {params:<36} "
+        f"p50 {latency['p50'] or 0:8.2f}ms  p95 {latency['p95'] or 0:8.2f}ms  p99 {latency['p99'] or 0:8.2f}ms  "
+        f"{throughput or 0:9.1f} {result['throughput_unit']}"
+    )
@@ -0,0 +1,231 @@
+import argparse
+import asyncio
+import os
+import signal
+import subprocess
+import sys
+import time
+from collections import Counter
+from typing import Awaitable, Callable, Dict, List, Optional
+
+import httpx
+
+from benchmarks.harness import (
+    parse_resolution,
+    peak_rss_mb,
+    print_result,
+    reset_peak_rss,
+    summarize,
+    synthetic_image,
+    write_report,
+)
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def start_process(command: List[str], env: Dict[str, str], log_path: Optional[str]) -> subprocess.Popen:
+    output = open(log_path, "ab") if log_path else subprocess.DEVNULL
+    return subprocess.Popen(command, cwd=BACKEND_DIR, env=env, stdout=output, stderr=subprocess.STDOUT)
+
+
+def stop_process(process: subprocess.Popen, timeout: float = 30.0):
+    if process.poll() is None:
+        process.send_signal(signal.SIGTERM)
+        try:
+            process.wait(timeout)
+        except subprocess.TimeoutExpired:
+            process.kill()
+            process.wait()
+
+
+async def wait_until_ready(url: str, process: Optional[subprocess.Popen], timeout: float):
+    """Poll /readyz until the model is loaded."""
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient(timeout=5.0) as client:
+        while time.monotonic() < deadline:
+            if process is not None and process.poll() is not None:
+                raise RuntimeError(f"API exited with status {process.returncode} before becoming ready")
+            try:
+                response = await client.get(f"{url}/readyz")
+                if response.status_code == 200:
+                    return
+                if response.json().get("status") == "failed":
+                    raise RuntimeError(f"Model failed to load: {response.json().get('error')}")
+            except httpx.TransportError:
+                pass
+            await asyncio.sleep(0.5)
+    raise TimeoutError(f"API at {url} was not ready after {timeout:.0f}s")
+
+
+async def run_load(send: Callable[[httpx.AsyncClient, int], Awaitable[httpx.Response]], concurrency: int,
+                   duration: float, max_requests: Optional[int], timeout: float) -> Dict:
+    """
+    Keep ``concurrency`` requests in flight for ``duration`` seconds.
+
+    Each virtual user sends its next request as soon as the previous one
+    completes (a closed loop), so latency is measured under a fixed load.
+    """
+    latencies: List[float] = []
+    statuses: Counter = Counter()
+    sent = 0
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+
+    async with httpx.AsyncClient(timeout=timeout, limits=limits) as client:
+        deadline = time.monotonic() + duration
+
+        async def user():
+            nonlocal sent
+            while time.monotonic() < deadline and (max_requests is None or sent < max_requests):
+                index = sent
+                sent += 1
+                started = time.perf_counter()
+                try:
+                    response = await send(client, index)
+                    statuses[str(response.status_code)] += 1
+                    if response.status_code < 400:
+                        latencies.append(time.perf_counter() - started)
+                except httpx.HTTPError as e:
+                    statuses[type(e).__name__] += 1
+
+        started = time.perf_counter()
+        await asyncio.gather(*(user() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+
+    return {"latencies": latencies, "elapsed": elapsed, "statuses": dict(statuses)}
+
+
+def analyze_image_sender(url: str, resolution: str, distinct: int):
+    width, height = parse_resolution(resolution)
+    # Different images per request, so the result cache can't answer them
+    images = [synthetic_image(width, height, seed=seed) for seed in range(distinct)]
+
+    def send(client: httpx.AsyncClient, index: int):
+        content = images[index % len(images)]
+        return client.post(f"{url}/analyze-image", files={"file": ("leaf.jpg", content, "image/jpeg")})
+
+    return send
+
+
+def chat_sender(url: str):
+    def send(client: httpx.AsyncClient, index: int):
+        # A unique question per request, so the response cache can't answer it
+        message = f"How do I treat early blight on my tomato plants? (request {index})"
+        return client.post(f"{url}/chat", json={"message": message, "language": "en"})
+
+    return send
+
+
+async def run_scenarios(args, url: str, server: Optional[subprocess.Popen]) -> List[Dict]:
+    scenarios = []
+    if "analyze-image" in args.scenarios:
+        sender = analyze_image_sender(url, args.resolution, args.distinct_images)
+        scenarios.append(("http_analyze_image", {"resolution": args.resolution}, sender))
+    if "chat" in args.scenarios:
+        scenarios.append(("http_chat", {}, chat_sender(url)))
+
+    results = []
+    for name, params, sender in scenarios:
+        for concurrency in args.concurrency:
+            if server is not None:
+                reset_peak_rss(server.pid)
+            run = await run_load(sender, concurrency, args.duration, args.requests, args.timeout)
+            result = {
+                "name": name,
+                "params": {**params, "concurrency": concurrency},
+                **summarize(run["latencies"], run["elapsed"], len(run["latencies"]), "requests/s"),
+                "statuses": run["statuses"],
+                "errors": sum(count for status, count in run["statuses"].items()
+                              if not (status.isdigit() and int(status) < 400)),
+                "peak_rss_mb": peak_rss_mb(server.pid) if server is not None else None,
+            }
+            print_result(result)
+            results.append(result)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Load test /analyze-image and /chat, with OpenAI replaced by a local stub."
+    )
+    parser.add_argument("--output", default=os.path.join("benchmarks", "results", "load.json"))
+    parser.add_argument("--url", help="Test an API that is already running instead of starting one")
+    parser.add_argument("--port", type=int, default=8090, help="Port for the API started by the harness")
+    parser.add_argument("--gunicorn", action="store_true",
+                        help="Start the API under gunicorn (gunicorn.conf.py) instead of python main.py")
+    parser.add_argument("--keep-caches", action="store_true",
+                        help="Leave the image and chat caches on (they are disabled by default)")
+    parser.add_argument("--server-log", help="File to append the started processes' output to")
+    parser.add_argument("--scenarios", nargs="+", choices=["analyze-image", "chat"],
+                        default=["analyze-image", "chat"])
+    parser.add_argument("--concurrency", nargs="+", type=int, default=[1, 8, 32],
+                        help="Requests kept in flight; each level is a separate run")
+    parser.add_argument("--duration", type=float, default=20.0, help="Seconds per run")
+    parser.add_argument("--requests", type=int, help="Stop a run after this many requests")
+    parser.add_argument("--timeout", type=float, default=60.0, help="Per-request timeout in seconds")
+    parser.add_argument("--resolution", default="640x480", help="Uploaded image size, as WIDTHxHEIGHT")
+    parser.add_argument("--distinct-images", type=int, default=64, help="Different images to cycle through")
+    parser.add_argument("--stub-port", type=int, default=8091)
+    parser.add_argument("--stub-latency-ms", type=float, default=300.0)
+    parser.add_argument("--stub-jitter-ms", type=float, default=0.0)
+    parser.add_argument("--stub-tokens", type=int, default=50)
+    parser.add_argument("--stub-token-delay-ms", type=float, default=10.0)
+    parser.add_argument("--ready-timeout", type=float, default=180.0,
+                        help="Seconds to wait for the API to load the model")
+    args = parser.parse_args()
+
+    stub = server = None
+    url = args.url.rstrip("/") if args.url else f"http://127.0.0.1:{args.port}"
+    try:
+        if not args.url:
+            stub = start_process([
+                sys.executable, "-m", "benchmarks.openai_stub",
+                "--port", str(args.stub_port),
+                "--latency-ms", str(args.stub_latency_ms),
+                "--jitter-ms", str(args.stub_jitter_ms),
+                "--tokens", str(args.stub_tokens),
+                "--token-delay-ms", str(args.stub_token_delay_ms),
+            ], dict(os.environ), args.server_log)
+
+            env = dict(os.environ)
+            env.update({
+                "PORT": str(args.port),
+                "CHAT_PROVIDER": "openai",
+                "OPENAI_BASE_URL": f"http://127.0.0.1:{args.stub_port}/v1",
+                "OPENAI_API_KEY": "benchmark",
+            })
+            if not args.keep_caches:
+                env.update({"IMAGE_CACHE_MAX_ENTRIES": "0", "CHAT_CACHE_BACKEND": "none"})
+            if args.gunicorn:
+                command = [sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py", "main:app"]
+            else:
+                command = [sys.executable, "main.py"]
+            server = start_process(command, env, args.server_log)
+
+        print(f"Waiting for the API at {url}...")
+        asyncio.run(wait_until_ready(url, server, args.ready_timeout))
+        results = asyncio.run(run_scenarios(args, url, server))
+    finally:
+        for process in (server, stub):
+            if process is not None:
+                stop_process(process)
+
+    config = {
+        "url": args.url,
+        "server": None if args.url else ("gunicorn" if args.gunicorn else "uvicorn"),
+        "caches": None if args.url else args.keep_caches,
+        "duration": args.duration,
+        "requests": args.requests,
+        "resolution": args.resolution,
+        "distinct_images": args.distinct_images,
+        "stub": None if args.url else {
+            "latency_ms": args.stub_latency_ms,
+            "jitter_ms": args.stub_jitter_ms,
+            "tokens": args.stub_tokens,
+            "token_delay_ms": args.stub_token_delay_ms,
+        },
+    }
+    write_report(args.output, "load", config, results)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+import argparse
+import os
+from typing import Dict, List
+
+import numpy as np
+
+from benchmarks.harness import (
+    measure,
+    parse_resolution,
+    peak_rss_mb,
+    print_result,
+    reset_peak_rss,
+    summarize,
+    synthetic_image,
+    write_report,
+)
+from models.plant_disease_model import IMAGE_SIZE, PlantDiseaseModel
+
+DEFAULT_RESOLUTIONS = ["224x224", "640x480", "1280x960", "4032x3024"]
+DEFAULT_BATCH_SIZES = [1, 2, 4, 8, 16, 32, 64]
+
+
+def _result(name: str, params: Dict, run: Dict, items_per_call: int, unit: str) -> Dict:
+    result = {
+        "name": name,
+        "params": params,
+        **summarize(run["latencies"], run["elapsed"], items_per_call * len(run["latencies"]), unit),
+        "peak_rss_mb": peak_rss_mb(),
+    }
+    print_result(result)
+    return result
+
+
+def bench_preprocess(resolutions: List[str], iterations: int, max_seconds: float) -> List[Dict]:
+    """Decode and preprocess_image, timed separately, for JPEGs of each resolution."""
+    results = []
+    for resolution in resolutions:
+        width, height = parse_resolution(resolution)
+        content = synthetic_image(width, height)
+        params = {"resolution": resolution, "bytes": len(content)}
+
+        decode_times, preprocess_times = [], []
+
+        def prepare():
+            _, decode_seconds, preprocess_seconds = PlantDiseaseModel.prepare_image_timed(content)
+            decode_times.append(decode_seconds)
+            preprocess_times.append(preprocess_seconds)
+
+        reset_peak_rss()
+        run = measure(prepare, iterations, max_seconds=max_seconds)
+        # Drop the warm-up calls recorded by prepare()
+        count = len(run["latencies"])
+        for name, times in (("decode", decode_times[-count:]), ("preprocess_image", preprocess_times[-count:])):
+            results.append(_result(name, params, {"latencies": times, "elapsed": sum(times)}, 1, "images/s"))
+    return results
+
+
+def bench_predict(model: PlantDiseaseModel, batch_sizes: List[int], iterations: int,
+                  max_seconds: float) -> List[Dict]:
+    """Raw model prediction on random preprocessed batches."""
+    results = []
+    rng = np.random.default_rng(0)
+    for batch_size in batch_sizes:
+        batch = rng.random((batch_size, IMAGE_SIZE[1], IMAGE_SIZE[0], 3), dtype=np.float32)
+        reset_peak_rss()
+        run = measure(lambda: model.predict_batch(batch), iterations, max_seconds=max_seconds)
+        results.append(_result("predict", {"batch_size": batch_size}, run, batch_size, "images/s"))
+    return results
+
+
+def bench_analyze(model: PlantDiseaseModel, resolutions: List[str], iterations: int,
+                  max_seconds: float) -> List[Dict]:
+    """analyze_image end to end, from encoded bytes to the analysis dictionary."""
+    results = []
+    for resolution in resolutions:
+        width, height = parse_resolution(resolution)
+        content = synthetic_image(width, height)
+        reset_peak_rss()
+        run = measure(lambda: model.analyze_image(content), iterations, max_seconds=max_seconds)
+        results.append(_result("analyze_image", {"resolution": resolution}, run, 1, "images/s"))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark preprocessing and inference in-process.")
+    parser.add_argument("--output", default=os.path.join("benchmarks", "results", "model.json"))
+    parser.add_argument("--backend", help="Model backend (default: MODEL_BACKEND or keras)")
+    parser.add_argument("--resolutions", nargs="+", default=DEFAULT_RESOLUTIONS,
+                        help="Synthetic image sizes, as WIDTHxHEIGHT")
+    parser.add_argument("--batch-sizes", nargs="+", type=int, default=DEFAULT_BATCH_SIZES)
+    parser.add_argument("--iterations", type=int, default=50, help="Timed calls per case")
+    parser.add_argument("--max-seconds", type=float, default=20.0,
+                        help="Stop a case early after this long")
+    parser.add_argument("--only", nargs="+", choices=["preprocess", "predict", "analyze"],
+                        help="Run only these benchmarks")
+    args = parser.parse_args()
+    selected = set(args.only or ["preprocess", "predict", "analyze"])
+
+    results = []
+    if "preprocess" in selected:
+        results += bench_preprocess(args.resolutions, args.iterations, args.max_seconds)
+    if selected & {"predict", "analyze"}:
+        print("Loading model...")
+        model = PlantDiseaseModel(backend=args.backend)
+        if "predict" in selected:
+            results += bench_predict(model, args.batch_sizes, args.iterations, args.max_seconds)
+        if "analyze" in selected:
+            results += bench_analyze(model, args.resolutions, args.iterations, args.max_seconds)
+
+    config = {
+        "backend": args.backend or os.getenv("MODEL_BACKEND", "keras"),
+        "resolutions": args.resolutions,
+        "batch_sizes": args.batch_sizes,
+        "iterations": args.iterations,
+        "max_seconds": args.max_seconds,
+    }
+    write_report(args.output, "model", config, results)
+
+
+if __name__ == "__main__":
+    main()
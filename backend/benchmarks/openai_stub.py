@@ -0,0 +1,108 @@
+import argparse
+import asyncio
+import json
+import random
+import time
+import uuid
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+# A stand-in for the OpenAI chat completions API, so /chat can be load
+# tested without network access, cost or rate limits. Point the API at it
+# with OPENAI_BASE_URL=http://127.0.0.1:<port>/v1 and any OPENAI_API_KEY.
+#
+# Every completion waits ``latency`` (plus up to ``jitter``) before the
+# first token, then streams ``tokens`` words ``token_delay`` apart; the
+# non-streaming endpoint waits for the same total time.
+
+WORDS = (
+    "Remove affected leaves and improve air circulation around the plant. "
+    "Water at the base in the morning and apply a copper-based fungicide if symptoms spread."
+).split()
+
+
+def create_app(latency: float, jitter: float, tokens: int, token_delay: float) -> FastAPI:
+    app = FastAPI(title="OpenAI stub")
+
+    def first_token_delay() -> float:
+        return latency + random.uniform(0, jitter)
+
+    def words():
+        return [WORDS[i % len(WORDS)] + " " for i in range(tokens)]
+
+    def usage(request_body) -> dict:
+        prompt = sum(len(str(m.get("content", "")).split()) for m in request_body.get("messages", []))
+        return {"prompt_tokens": prompt, "completion_tokens": tokens, "total_tokens": prompt + tokens}
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+        created = int(time.time())
+        model = body.get("model", "stub")
+
+        if not body.get("stream"):
+            await asyncio.sleep(first_token_delay() + token_delay * tokens)
+            return JSONResponse({
+                "id": completion_id,
+                "object": "chat.completion",
+                "created": created,
+                "model": model,
+                "choices": [{
+                    "index": 0,
+                    "message": {"role": "assistant", "content": "".join(words())},
+                    "finish_reason": "stop",
+                }],
+                "usage": usage(body),
+            })
+
+        include_usage = (body.get("stream_options") or {}).get("include_usage", False)
+
+        def event(choices: list, **extra) -> str:
+            payload = {
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "created": created,
+                "model": model,
+                "choices": choices,
+                **extra,
+            }
+            return f"data: {json.dumps(payload)}\n\n"
+
+        def chunk(delta: dict, finish_reason=None) -> str:
+            return event([{"index": 0, "delta": delta, "finish_reason": finish_reason}])
+
+        async def events():
+            await asyncio.sleep(first_token_delay())
+            yield chunk({"role": "assistant", "content": ""})
+            for word in words():
+                yield chunk({"content": word})
+                await asyncio.sleep(token_delay)
+            yield chunk({}, finish_reason="stop")
+            if include_usage:
+                yield event([], usage=usage(body))
+            yield "data: [DONE]\n\n"
+
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve a fake OpenAI chat completions API.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--latency-ms", type=float, default=300.0, help="Delay before the first token")
+    parser.add_argument("--jitter-ms", type=float, default=0.0, help="Random extra delay, up to this much")
+    parser.add_argument("--tokens", type=int, default=50, help="Words per completion")
+    parser.add_argument("--token-delay-ms", type=float, default=10.0, help="Delay between streamed words")
+    args = parser.parse_args()
+
+    app = create_app(args.latency_ms / 1000, args.jitter_ms / 1000, args.tokens, args.token_delay_ms / 1000)
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,259 @@
+import argparse
+import json
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+import numpy as np
+
+from models.plant_disease_model import PlantDiseaseModel
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png")
+
+
+def walk_images(root: str) -> Iterator[str]:
+    """
+    Yield image paths under ``root`` without listing the whole tree up front.
+
+    Directories are visited depth-first with entries sorted by name, so the
+    order is stable between runs.
+    """
+    stack = [root]
+    while stack:
+        directory = stack.pop()
+        try:
+            with os.scandir(directory) as it:
+                entries = sorted(it, key=lambda entry: entry.name)
+        except OSError as e:
+            print(f"Skipping {directory}: {str(e)}", file=sys.stderr)
+            continue
+        subdirectories = []
+        for entry in entries:
+            if entry.is_dir(follow_symlinks=False):
+                subdirectories.append(entry.path)
+            elif entry.name.lower().endswith(IMAGE_EXTENSIONS):
+                yield entry.path
+        stack.extend(reversed(subdirectories))
+
+
+def decode(path: str) -> Tuple[str, Optional[np.ndarray], Optional[str]]:
+    """Decode and preprocess one image in a worker process."""
+    try:
+        return path, PlantDiseaseModel.prepare_image(path)[0], None
+    except Exception as e:
+        return path, None, str(e)
+
+
+def decode_in_pool(executor: ProcessPoolExecutor, paths: Iterable[str], max_in_flight: int):
+    """
+    Decode images in a process pool, yielding results in input order.
+
+    Unlike ``Executor.map`` this only keeps ``max_in_flight`` images
+    submitted at a time, so arbitrarily long path iterators are fine.
+    """
+    pending = deque()
+    for path in paths:
+        pending.append(executor.submit(decode, path))
+        if len(pending) >= max_in_flight:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+
+class Checkpoint:
+    """Append-only list of processed paths, used to resume interrupted runs."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.done: Set[str] = set()
+        if os.path.exists(path):
+            with open(path) as f:
+                self.done = {line.rstrip("\n") for line in f if line.strip()}
+        self._file = open(path, "a")
+
+    def mark(self, paths: List[str]):
+        self._file.write("".join(f"{path}\n" for path in paths))
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def close(self):
+        self._file.close()
+
+
+class JsonlWriter:
+    def __init__(self, path: str):
+        self._file = open(path, "a")
+
+    def write(self, records: List[Dict]):
+        self._file.write("".join(json.dumps(record) + "\n" for record in records))
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def close(self):
+        self._file.close()
+
+
+class ParquetWriter:
+    """Write each batch as a numbered part file in the output directory."""
+
+    COLUMNS = (
+        "path", "status", "plant_type", "disease", "confidence", "severity", "error",
+        "alternatives", "analysis"
+    )
+
+    def __init__(self, path: str):
+        try:
+            import pyarrow
+            import pyarrow.parquet
+        except ImportError:
+            raise SystemExit("Parquet output requires pyarrow: pip install pyarrow")
+        self._pa = pyarrow
+        self._pq = pyarrow.parquet
+        # Every part gets the same schema, whichever fields its records have
+        self.schema = pyarrow.schema([
+            (column, pyarrow.float64() if column == "confidence" else pyarrow.string())
+            for column in self.COLUMNS
+        ])
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+        self._part = len([name for name in os.listdir(path) if name.endswith(".parquet")])
+
+    def write(self, records: List[Dict]):
+        rows = [
+            {column: record.get(column) for column in self.COLUMNS}
+            for record in records
+        ]
+        for row in rows:
+            for column in ("alternatives", "analysis"):
+                if row[column] is not None:
+                    row[column] = json.dumps(row[column])
+        table = self._pa.Table.from_pylist(rows, schema=self.schema)
+        part_path = os.path.join(self.path, f"part-{self._part:06d}.parquet")
+        self._pq.write_table(table, part_path)
+        self._part += 1
+
+    def close(self):
+        pass
+
+
+def analyze_batch(model: PlantDiseaseModel, decoded: List[Tuple], full: bool, top_k: int = 1) -> List[Dict]:
+    """Run one model batch and turn each row into an output record."""
+    images = [image for _, image, _ in decoded if image is not None]
+    if images:
+        classes, confidences = model.top_k(model.predict_batch(np.stack(images)), top_k)
+
+    records = []
+    index = 0
+    for path, image, error in decoded:
+        if image is None:
+            records.append({"path": path, "status": "failed", "error": error})
+            continue
+        row = index
+        index += 1
+        try:
+            analysis = model.analysis_for(classes[row], confidences[row])
+        except Exception as e:
+            records.append({"path": path, "status": "failed", "error": str(e)})
+            continue
+        record = {
+            "path": path,
+            "status": "success",
+            "plant_type": analysis["plant_type"],
+            "disease": analysis["disease"],
+            "confidence": analysis["confidence"],
+            "severity": analysis["severity"],
+        }
+        if full:
+            record["analysis"] = analysis
+        elif "alternatives" in analysis:
+            record["alternatives"] = analysis["alternatives"]
+        records.append(record)
+    return records
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Analyze every image under a directory and stream the results to a file."
+    )
+    parser.add_argument("input_dir", help="Directory to scan recursively")
+    parser.add_argument("output", help="JSON Lines file, or a directory for Parquet output")
+    parser.add_argument("--format", choices=["jsonl", "parquet"], default="jsonl")
+    parser.add_argument("--batch-size", type=int, default=64)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1,
+                        help="Decode processes")
+    parser.add_argument("--checkpoint", help="Checkpoint file (default: <output>.checkpoint)")
+    parser.add_argument("--full", action="store_true",
+                        help="Include the full analysis (treatment, monitoring, ...) in each record")
+    parser.add_argument("--top-k", type=int, default=1,
+                        help="Also record the next most likely diagnoses as alternatives")
+    parser.add_argument("--backend", help="Model backend (default: MODEL_BACKEND or keras)")
+    parser.add_argument("--log-every", type=float, default=10.0,
+                        help="Seconds between progress reports")
+    args = parser.parse_args()
+    if args.top_k < 1:
+        parser.error("--top-k must be at least 1")
+
+    checkpoint = Checkpoint(args.checkpoint or args.output.rstrip("/") + ".checkpoint")
+    if checkpoint.done:
+        print(f"Resuming: {len(checkpoint.done)} images already processed")
+
+    writer = ParquetWriter(args.output) if args.format == "parquet" else JsonlWriter(args.output)
+
+    # Start the decode workers before TensorFlow is loaded, so they are not
+    # forked from a process with TensorFlow's thread pools running
+    executor = ProcessPoolExecutor(max_workers=args.workers)
+    executor.submit(os.getpid).result()
+
+    print("Loading model...")
+    model = PlantDiseaseModel(backend=args.backend)
+    if args.top_k > len(model.class_names):
+        print(f"--top-k is larger than the number of classes, using {len(model.class_names)}")
+        args.top_k = len(model.class_names)
+
+    paths = (path for path in walk_images(args.input_dir) if path not in checkpoint.done)
+    decoded_stream = decode_in_pool(executor, paths, max_in_flight=args.batch_size * 2)
+
+    processed = failed = 0
+    started = last_report = time.monotonic()
+    batch: List[Tuple] = []
+
+    def flush():
+        nonlocal processed, failed
+        records = analyze_batch(model, batch, args.full, args.top_k)
+        # Results are written before the checkpoint, so an interruption can at
+        # worst repeat the last batch, never skip it
+        writer.write(records)
+        checkpoint.mark([record["path"] for record in records])
+        processed += len(records)
+        failed += sum(record["status"] == "failed" for record in records)
+        batch.clear()
+
+    try:
+        for item in decoded_stream:
+            batch.append(item)
+            if len(batch) >= args.batch_size:
+                flush()
+            now = time.monotonic()
+            if now - last_report >= args.log_every:
+                rate = processed / (now - started)
+                print(f"Processed {processed} images ({failed} failed), {rate:.1f} images/s")
+                last_report = now
+        if batch:
+            flush()
+    except KeyboardInterrupt:
+        print("Interrupted; rerun the same command to resume")
+    finally:
+        executor.shutdown(cancel_futures=True)
+        writer.close()
+        checkpoint.close()
+
+    elapsed = time.monotonic() - started
+    rate = processed / elapsed if elapsed else 0.0
+    print(f"Done: {processed} images ({failed} failed) in {elapsed:.1f}s, {rate:.1f} images/s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+import argparse
+import os
+import sys
+
+import numpy as np
+import tensorflow as tf
+
+from models.plant_disease_model import IMAGE_SIZE, PlantDiseaseModel
+from models.runtimes import MODEL_PATHS, MODELS_DIR, load_runtime
+
+INPUT_SPEC = tf.TensorSpec([None, IMAGE_SIZE[1], IMAGE_SIZE[0], 3], tf.float32, name="image")
+
+
+def load_keras_model(model_path=None):
+    """Load the Keras model saved by setup_model.py, without optimizer state."""
+    model_path = model_path or os.path.join(MODELS_DIR, MODEL_PATHS["keras"])
+    if not os.path.exists(model_path):
+        raise FileNotFoundError(f"Model not found at {model_path}. Please run setup_model.py to create the model.")
+    return tf.keras.models.load_model(model_path, compile=False)
+
+
+def serving_function(model):
+    """Trace the model for a fixed 224x224 RGB input and a dynamic batch size."""
+    @tf.function(input_signature=[INPUT_SPEC])
+    def serve(image):
+        return {"probabilities": model(image, training=False)}
+    return serve
+
+
+def export_savedmodel(model, output_path):
+    """Export a frozen SavedModel with a single serving_default signature."""
+    serve = serving_function(model)
+    tf.saved_model.save(model, output_path, signatures={"serving_default": serve})
+    return output_path
+
+
+def export_tflite(model, output_path, converter_hook=None):
+    """
+    Convert the model to a TensorFlow Lite flatbuffer.
+
+    Args:
+        model: Keras model to convert
+        output_path: Where to write the .tflite file
+        converter_hook: Optional callable that configures the converter
+            before conversion (used for quantization)
+    """
+    concrete = serving_function(model).get_concrete_function()
+    converter = tf.lite.TFLiteConverter.from_concrete_functions([concrete], model)
+    if converter_hook is not None:
+        converter_hook(converter)
+    with open(output_path, "wb") as f:
+        f.write(converter.convert())
+    return output_path
+
+
+def sample_batch(image_dir=None, count=8, seed=0):
+    """Build a batch of real images from ``image_dir``, or random ones if not given."""
+    if image_dir:
+        paths = sorted(
+            os.path.join(image_dir, name) for name in os.listdir(image_dir)
+            if name.lower().endswith((".jpg", ".jpeg", ".png"))
+        )[:count]
+        if not paths:
+            raise ValueError(f"No images found in {image_dir}")
+        return np.concatenate([PlantDiseaseModel.prepare_image(path) for path in paths])
+    rng = np.random.default_rng(seed)
+    return rng.random((count, IMAGE_SIZE[1], IMAGE_SIZE[0], 3), dtype=np.float32)
+
+
+def verify_parity(model, backend, model_path, batch, tolerance=1e-4):
+    """
+    Check that an exported runtime matches the Keras model.
+
+    Returns:
+        Tuple of (passed, max absolute difference, top-1 agreement)
+    """
+    expected = model.predict(batch, verbose=0)
+    actual = load_runtime(backend, model_path).predict(batch)
+    max_diff = float(np.max(np.abs(expected - actual)))
+    agreement = float(np.mean(np.argmax(expected, axis=1) == np.argmax(actual, axis=1)))
+    return max_diff <= tolerance, max_diff, agreement
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export the plant disease model for serving.")
+    parser.add_argument("--format", choices=["tflite", "savedmodel"], default="tflite")
+    parser.add_argument("--model-path",
+                        help="Keras model to export and verify against (defaults to the one made by setup_model.py)")
+    parser.add_argument("--output", help="Output path (defaults to the standard location in models/)")
+    parser.add_argument("--verify", action="store_true",
+                        help="Compare predictions against the Keras model after exporting")
+    parser.add_argument("--tolerance", type=float, default=1e-4,
+                        help="Maximum absolute difference in probabilities allowed by --verify")
+    parser.add_argument("--images", help="Directory of sample images used by --verify")
+    args = parser.parse_args()
+
+    output_path = args.output or os.path.join(MODELS_DIR, MODEL_PATHS[args.format])
+
+    print("Loading Keras model...")
+    model = load_keras_model(args.model_path)
+
+    print(f"Exporting {args.format} model to: {output_path}")
+    if args.format == "tflite":
+        export_tflite(model, output_path)
+    else:
+        export_savedmodel(model, output_path)
+    print("Export completed successfully!")
+
+    if args.verify:
+        batch = sample_batch(args.images)
+        passed, max_diff, agreement = verify_parity(
+            model, args.format, output_path, batch, args.tolerance
+        )
+        print(f"Max absolute difference: {max_diff:.2e} (tolerance {args.tolerance:.0e})")
+        print(f"Top-1 agreement: {agreement:.2%}")
+        if not passed:
+            print("Parity check FAILED")
+            sys.exit(1)
+        print("Parity check passed")
+
+
+if __name__ == "__main__":
+    main()
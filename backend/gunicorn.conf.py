@@ -0,0 +1,48 @@
+# Production server: gunicorn managing several uvicorn workers.
+#
+#     gunicorn -c gunicorn.conf.py main:app
+#
+# Settings are taken from environment variables so the same file works
+# locally, in Docker and on Railway.
+import os
+
+
+def _available_cpus() -> int:
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+bind = f"0.0.0.0:{os.getenv('PORT', 8000)}"
+worker_class = "uvicorn.workers.UvicornWorker"
+# Every worker holds its own copy of the model, so memory grows with the
+# worker count; keep the default small and raise it where memory allows
+workers = int(os.getenv("WEB_CONCURRENCY", 0)) or min(_available_cpus(), 2)
+
+# Split the cores between workers rather than giving every worker's TFLite
+# interpreter all of them
+os.environ.setdefault("MODEL_NUM_THREADS", str(max(_available_cpus() // workers, 1)))
+
+# Import the application once in the master and fork the workers from it,
+# so code and read-only data are shared copy-on-write and import errors
+# stop the server before any worker starts. The model itself is loaded
+# after the fork, in each worker's lifespan, because TensorFlow is not
+# fork-safe, so each worker keeps a private copy of the model, whatever the
+# backend (TFLite and XNNPACK copy the weights too). To keep a single copy,
+# run inference_server.py alongside and set MODEL_BACKEND=remote: the
+# workers then never load TensorFlow and send their batches to that process
+# instead.
+preload_app = True
+
+# On SIGTERM, stop accepting connections and give in-flight requests this
+# long to finish before workers are killed
+graceful_timeout = int(os.getenv("GRACEFUL_TIMEOUT", 30))
+timeout = int(os.getenv("WORKER_TIMEOUT", 120))
+keepalive = int(os.getenv("KEEPALIVE", 5))
+
+# Heartbeat files on tmpfs, so a slow disk cannot get workers killed
+worker_tmp_dir = "/dev/shm" if os.path.isdir("/dev/shm") else None
+
+accesslog = None
+errorlog = "-"
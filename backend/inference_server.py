@@ -0,0 +1,208 @@
+import argparse
+import asyncio
+import logging
+import os
+import signal
+import stat
+from typing import Optional
+
+import numpy as np
+from dotenv import load_dotenv
+
+from models.plant_disease_model import IMAGE_SIZE, PlantDiseaseModel
+from models.runtimes import (
+    INFERENCE_MAGIC,
+    INFERENCE_SOCKET,
+    REQUEST_HEADER,
+    RESPONSE_HEADER,
+    STATUS_ERROR,
+    STATUS_OK,
+)
+from services.batch_scheduler import BatchScheduler
+from services.logging_config import configure_logging
+
+logger = logging.getLogger(__name__)
+
+IMAGE_SHAPE = (IMAGE_SIZE[1], IMAGE_SIZE[0], 3)
+
+
+class InferenceProtocol(asyncio.BufferedProtocol):
+    """
+    One API worker's connection to the inference server.
+
+    The event loop reads straight into buffers owned by the connection: the
+    fixed-size header, then the images, into a float32 array reused between
+    requests. Requests are handled one at a time; reading is paused until
+    the predictions for the current one have been written back, so the
+    array is never overwritten while it is still queued for the model.
+    """
+
+    def __init__(self, model: PlantDiseaseModel, scheduler: BatchScheduler, max_images: int):
+        self.model = model
+        self.scheduler = scheduler
+        self.max_images = max_images
+        self.transport: Optional[asyncio.Transport] = None
+        self._header = bytearray(REQUEST_HEADER.size)
+        self._storage = np.empty((0, *IMAGE_SHAPE), dtype=np.float32)
+        self._batch: Optional[np.ndarray] = None
+        self._target = memoryview(self._header)
+        self._received = 0
+
+    def connection_made(self, transport: asyncio.Transport):
+        self.transport = transport
+        logger.debug("Inference client connected")
+
+    def connection_lost(self, exc: Optional[Exception]):
+        self.transport = None
+        logger.debug("Inference client disconnected")
+
+    def get_buffer(self, sizehint: int) -> memoryview:
+        return self._target[self._received:]
+
+    def buffer_updated(self, nbytes: int):
+        self._received += nbytes
+        if self._received < len(self._target):
+            return
+        if self._batch is None:
+            self._read_header()
+        else:
+            self.transport.pause_reading()
+            asyncio.ensure_future(self._predict(self._batch))
+
+    def _expect_header(self):
+        self._batch = None
+        self._target = memoryview(self._header)
+        self._received = 0
+
+    def _read_header(self):
+        magic, count, *shape = REQUEST_HEADER.unpack(self._header)
+        if magic != INFERENCE_MAGIC:
+            self._reply_error("Not an inference request")
+            self.transport.close()
+            return
+        if count == 0:
+            self._reply(np.empty((0, self.model.model.num_classes), dtype=np.float32), self.model.version)
+            self._expect_header()
+            return
+        if tuple(shape) != IMAGE_SHAPE or count > self.max_images:
+            # The images can't be skipped without reading them, so give up
+            # on the connection; the client reconnects
+            self._reply_error(
+                f"Expected at most {self.max_images} images of shape {IMAGE_SHAPE}, "
+                f"got {count} of shape {tuple(shape)}"
+            )
+            self.transport.close()
+            return
+
+        if len(self._storage) < count:
+            self._storage = np.empty((count, *IMAGE_SHAPE), dtype=np.float32)
+        self._batch = self._storage[:count]
+        self._target = memoryview(self._batch).cast("B")
+        self._received = 0
+
+    async def _predict(self, batch: np.ndarray):
+        try:
+            predictions = await self.scheduler.submit(batch)
+        except Exception as e:
+            logger.exception("Error running inference")
+            self._reply_error(str(e))
+        else:
+            self._reply(np.ascontiguousarray(predictions, dtype=np.float32))
+        if self.transport is not None and not self.transport.is_closing():
+            self._expect_header()
+            self.transport.resume_reading()
+
+    def _reply(self, predictions: np.ndarray, text: str = ""):
+        encoded = text.encode()
+        rows, columns = predictions.shape
+        header = RESPONSE_HEADER.pack(INFERENCE_MAGIC, STATUS_OK, rows, columns, len(encoded))
+        payload = memoryview(predictions).cast("B") if predictions.size else b""
+        self._write(header, payload, encoded)
+
+    def _reply_error(self, message: str):
+        encoded = message.encode()
+        self._write(RESPONSE_HEADER.pack(INFERENCE_MAGIC, STATUS_ERROR, 0, 0, len(encoded)), encoded)
+
+    def _write(self, *chunks):
+        if self.transport is not None and not self.transport.is_closing():
+            self.transport.writelines([chunk for chunk in chunks if len(chunk)])
+
+
+def _remove_stale_socket(path: str):
+    try:
+        mode = os.stat(path).st_mode
+    except FileNotFoundError:
+        return
+    if not stat.S_ISSOCK(mode):
+        raise FileExistsError(f"{path} exists and is not a socket")
+    os.unlink(path)
+
+
+def _load_and_warm_up(backend: Optional[str], model_path: Optional[str],
+                      quantization: Optional[str], batch_size: int) -> PlantDiseaseModel:
+    model = PlantDiseaseModel(backend=backend, model_path=model_path, quantization=quantization)
+    model.warm_up(batch_size)
+    return model
+
+
+async def serve(args):
+    model = await asyncio.to_thread(
+        _load_and_warm_up, args.backend, args.model_path, args.quantization, args.max_batch_size
+    )
+    scheduler = BatchScheduler(
+        model.predict_batch,
+        max_batch_size=args.max_batch_size,
+        max_wait_ms=args.max_wait_ms,
+    )
+    await scheduler.start()
+
+    # Listen only once the model is ready, so clients waiting to connect
+    # can rely on the server being able to answer
+    _remove_stale_socket(args.socket)
+    loop = asyncio.get_running_loop()
+    server = await loop.create_unix_server(
+        lambda: InferenceProtocol(model, scheduler, args.max_request_images),
+        path=args.socket,
+    )
+    logger.info(f"Inference server for model {model.version} listening on {args.socket}")
+
+    stop = asyncio.Event()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(signum, stop.set)
+    try:
+        await stop.wait()
+    finally:
+        logger.info("Shutting down inference server")
+        server.close()
+        await scheduler.stop()
+        _remove_stale_socket(args.socket)
+
+
+def main():
+    load_dotenv()
+    configure_logging()
+
+    parser = argparse.ArgumentParser(
+        description="Serve the plant disease model to API workers over a Unix socket."
+    )
+    parser.add_argument("--socket", default=os.getenv("INFERENCE_SOCKET", INFERENCE_SOCKET),
+                        help="Socket path (default: INFERENCE_SOCKET or %(default)s)")
+    parser.add_argument("--backend", help="Model backend (default: MODEL_BACKEND or keras)")
+    parser.add_argument("--model-path", help="Model artifact (default: MODEL_PATH or the backend's default)")
+    parser.add_argument("--quantization", help="Quantized TFLite variant (default: MODEL_QUANTIZATION or none)")
+    parser.add_argument("--max-batch-size", type=int, default=int(os.getenv("BATCH_MAX_SIZE", 16)),
+                        help="Images per model batch, across all clients")
+    parser.add_argument("--max-wait-ms", type=float, default=float(os.getenv("BATCH_MAX_WAIT_MS", 10)),
+                        help="How long a batch waits for more images")
+    parser.add_argument("--max-request-images", type=int, default=256,
+                        help="Largest number of images accepted in one request")
+    args = parser.parse_args()
+
+    if (args.backend or os.getenv("MODEL_BACKEND")) == "remote":
+        parser.error("The inference server needs a local backend; pass --backend keras, savedmodel or tflite")
+
+    asyncio.run(serve(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,27 +1,120 @@
-from fastapi import FastAPI, UploadFile, File, HTTPException, Form, Body
+from fastapi import FastAPI, UploadFile, File, HTTPException, Form, Body, Query
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
-from typing import List
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+from contextlib import asynccontextmanager
+from typing import Dict, List, Optional, Tuple
 import uvicorn
 import os
+import json
+import asyncio
+import zipfile
+import numpy as np
 from dotenv import load_dotenv
 from models.plant_disease_model import PlantDiseaseModel
 from services.chat_service import ChatService
-import tempfile
+from services.batch_scheduler import BatchScheduler
+from services.inference_pool import InferencePool, QueueFullError
+from services.image_cache import ImageResultCache, content_hash, create_image_cache
+from services.single_flight import SingleFlight
+from services.metrics import CONTENT_TYPE, INFERENCE_PENDING, REGISTRY, STAGE_SECONDS, MetricsMiddleware
+from services.logging_config import RequestIdMiddleware, configure_logging
 import logging
 
 # Load environment variables
 load_dotenv()
 
+# Structured logs, written by a background thread (see services/logging_config.py)
+configure_logging()
+
+logger = logging.getLogger(__name__)
+
+# Services are created in the lifespan so the server binds its port right
+# away; the model is loaded in the background (see load_model)
+plant_model: Optional[PlantDiseaseModel] = None
+chat_service: Optional[ChatService] = None
+chat_error: Optional[str] = None
+image_cache: Optional[ImageResultCache] = None
+model_error: Optional[str] = None
+
+# Decode and preprocess uploads off the event loop, with a bounded queue
+INFERENCE_QUEUE_SIZE = int(os.getenv("INFERENCE_QUEUE_SIZE", 64))
+INFERENCE_RETRY_AFTER = os.getenv("INFERENCE_RETRY_AFTER", "1")
+inference_pool = InferencePool(
+    kind=os.getenv("INFERENCE_EXECUTOR", "thread"),
+    max_workers=int(os.getenv("INFERENCE_WORKERS", 0)) or None,
+    max_queue_size=INFERENCE_QUEUE_SIZE,
+)
+
+# Group concurrent image requests into a single model batch
+def predict_batch(batch):
+    return plant_model.predict_batch(batch)
+
+batch_scheduler = BatchScheduler(
+    predict_batch,
+    max_batch_size=int(os.getenv("BATCH_MAX_SIZE", 16)),
+    max_wait_ms=float(os.getenv("BATCH_MAX_WAIT_MS", 10)),
+    max_queue_size=INFERENCE_QUEUE_SIZE,
+)
+
+# Identical images uploaded at the same time share one analysis
+image_single_flight = SingleFlight("image")
+
+def _load_and_warm_up() -> PlantDiseaseModel:
+    model = PlantDiseaseModel()
+    model.warm_up()
+    return model
+
+async def load_model():
+    """Load and warm up the model in a worker thread, then mark the API ready."""
+    global plant_model, model_error
+    try:
+        logger.info("Loading plant disease model in the background...")
+        plant_model = await asyncio.to_thread(_load_and_warm_up)
+        logger.info("Plant disease model loaded and warmed up")
+    except Exception as e:
+        model_error = str(e)
+        logger.error(f"Failed to load plant disease model: {model_error}")
+
+# Limits for /analyze-images, so memory stays bounded however much is uploaded
+MAX_BATCH_FILES = int(os.getenv("MAX_BATCH_FILES", 200))
+MAX_IMAGE_BYTES = int(os.getenv("MAX_IMAGE_BYTES", 20 * 1024 * 1024))
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png")
+
+# Largest top_k accepted by the analysis endpoints. This many classes are
+# kept per image (and cached), so any smaller top_k is served from them.
+MAX_TOP_K = int(os.getenv("MAX_TOP_K", 5))
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    global chat_service, chat_error, image_cache
+    # A misconfigured chat provider (e.g. no OpenAI key) only disables chat;
+    # image analysis keeps working
+    try:
+        chat_service = ChatService()
+    except Exception as e:
+        chat_error = str(e)
+        logger.error(f"Chat is unavailable: {chat_error}")
+    image_cache = create_image_cache()
+    inference_pool.start()
+    await batch_scheduler.start()
+    model_task = asyncio.create_task(load_model())
+    yield
+    model_task.cancel()
+    await batch_scheduler.stop()
+    inference_pool.shutdown()
+    if chat_service is not None:
+        await chat_service.aclose()
+    if image_cache is not None:
+        image_cache.close()
+
 app = FastAPI(
     title="GreenBot API",
     description="API for plant disease detection and chatbot assistance",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
-# Initialize services
-plant_model = PlantDiseaseModel()
-chat_service = ChatService()
+app.add_middleware(MetricsMiddleware)
 
 # Configure CORS
 app.add_middleware(
@@ -30,60 +123,337 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Request-ID"],
 )
 
-logger = logging.getLogger(__name__)
+# Added last so it wraps everything else and every log line gets the ID
+app.add_middleware(RequestIdMiddleware)
 
 @app.get("/")
 async def root():
     return {"message": "Welcome to GreenBot API"}
 
+@app.get("/healthz")
+async def healthz():
+    """Liveness probe: the process is up and serving requests."""
+    return {"status": "ok"}
+
+@app.get("/readyz")
+async def readyz():
+    """Readiness probe: the model is loaded and warmed up."""
+    if plant_model is not None:
+        return {
+            "status": "ready",
+            "model_backend": plant_model.backend,
+            "knowledge_base_version": plant_model.knowledge_base.version
+        }
+    if model_error is not None:
+        return JSONResponse(status_code=503, content={"status": "failed", "error": model_error})
+    return JSONResponse(status_code=503, content={"status": "loading"})
+
+@app.get("/inference/stats")
+async def inference_stats():
+    return {
+        "pool": inference_pool.stats(),
+        "batcher": batch_scheduler.stats(),
+        "cache": image_cache.stats() if image_cache is not None else {"enabled": False},
+        "coalescing": image_single_flight.stats()
+    }
+
+@app.get("/metrics")
+async def metrics():
+    """Prometheus metrics in the text exposition format."""
+    INFERENCE_PENDING.labels("pool").set(inference_pool.stats()["pending"])
+    INFERENCE_PENDING.labels("batcher").set(batch_scheduler.stats()["queue_depth"])
+    return Response(content=REGISTRY.render(), media_type=CONTENT_TYPE)
+
+def _require_model():
+    if plant_model is None:
+        raise HTTPException(
+            status_code=503,
+            detail="The model is still loading, please retry shortly",
+            headers={"Retry-After": INFERENCE_RETRY_AFTER}
+        )
+
+def _require_chat():
+    if chat_service is None:
+        raise HTTPException(status_code=503, detail=f"Chat is unavailable: {chat_error}")
+
+async def _cached_analysis(content: bytes) -> Tuple[str, Optional[List]]:
+    """
+    Look up a previous analysis of the same image bytes.
+    
+    Only the top MAX_TOP_K classes and their probabilities are cached; the
+    response is rendered from the model's templates, which are cheap to
+    fill in.
+    
+    Returns:
+        Tuple of (content digest, cached [classes, confidences] or None)
+    """
+    digest = await asyncio.to_thread(content_hash, content)
+    if image_cache is None:
+        return digest, None
+    return digest, image_cache.get(digest, plant_model.version)
+
+async def _prepare_image(content: bytes) -> np.ndarray:
+    """Decode and preprocess an upload in the inference pool, recording the worker's timings."""
+    image, decode_seconds, preprocess_seconds = await inference_pool.run(
+        PlantDiseaseModel.prepare_image_timed, content
+    )
+    STAGE_SECONDS.labels("decode").observe(decode_seconds)
+    STAGE_SECONDS.labels("preprocess").observe(preprocess_seconds)
+    return image
+
+def _store_analysis(digest: str, classes: np.ndarray, confidences: np.ndarray):
+    if image_cache is not None:
+        image_cache.set(digest, plant_model.version, [classes.tolist(), confidences.tolist()])
+
+async def _analyze_upload(content: bytes, digest: str) -> Tuple[np.ndarray, np.ndarray]:
+    """Classify one upload and cache its top MAX_TOP_K classes and confidences."""
+    # Preprocess the image and wait for its slot in the next model batch
+    processed_image = await _prepare_image(content)
+    predictions = await batch_scheduler.submit(processed_image)
+    with STAGE_SECONDS.labels("postprocess").time():
+        top_classes, top_confidences = plant_model.top_k(predictions, MAX_TOP_K)
+    _store_analysis(digest, top_classes[0], top_confidences[0])
+    return top_classes[0], top_confidences[0]
+
 @app.post("/analyze-image")
-async def analyze_image(file: UploadFile = File(...)):
+async def analyze_image(
+    file: UploadFile = File(...),
+    top_k: int = Query(1, ge=1, le=MAX_TOP_K, description="Number of diagnoses to return")
+):
+    _require_model()
     try:
-        # Create a temporary file to save the uploaded image
-        temp_file_path = f"temp_{file.filename}"
-        with open(temp_file_path, "wb") as buffer:
+        with STAGE_SECONDS.labels("upload_read").time():
             content = await file.read()
-            buffer.write(content)
+        digest, cached = await _cached_analysis(content)
+        if cached is not None:
+            classes, confidences = cached
+        else:
+            classes, confidences = await image_single_flight.do(
+                (plant_model.version, digest), lambda: _analyze_upload(content, digest)
+            )
         
-        try:
-            # Analyze the image
-            result = plant_model.analyze_image(temp_file_path)
-            
-            # Clean up the temporary file
-            os.remove(temp_file_path)
-            
-            if "error" in result:
-                raise Exception(result["error"])
-                
-            return result
-        except Exception as e:
-            # Ensure temporary file is cleaned up even if analysis fails
-            if os.path.exists(temp_file_path):
-                os.remove(temp_file_path)
-            raise e
+        # The response is pre-serialized, so skip FastAPI's JSON encoding
+        with STAGE_SECONDS.labels("render").time():
+            content = plant_model.render_analysis(classes[:top_k], confidences[:top_k])
+        return Response(content=content, media_type="application/json")
             
+    except QueueFullError:
+        raise HTTPException(
+            status_code=503,
+            detail="Image analysis is busy, please retry shortly",
+            headers={"Retry-After": INFERENCE_RETRY_AFTER}
+        )
     except Exception as e:
-        print(f"Error in analyze_image endpoint: {str(e)}")
-        import traceback
-        traceback.print_exc()
+        logger.exception(f"Error in analyze_image endpoint: {str(e)}")
         raise HTTPException(
             status_code=500,
             detail=f"Failed to analyze image: {str(e)}"
         )
 
+def _is_zip(file: UploadFile) -> bool:
+    return (file.filename or "").lower().endswith(".zip") or file.content_type in (
+        "application/zip", "application/x-zip-compressed"
+    )
+
+def _list_batch_entries(files: List[UploadFile]) -> Tuple[List[Tuple], List[zipfile.ZipFile]]:
+    """
+    Expand the uploads into (filename, upload, zip member) entries.
+    
+    Zip archives are opened from the spooled upload without extracting
+    anything; only their central directory is read here. An upload that
+    cannot be opened is kept as an entry whose upload is the error. On any
+    other error the archives opened so far are closed before it is raised.
+    """
+    entries = []
+    archives = []
+    try:
+        for file in files:
+            if not _is_zip(file):
+                entries.append((file.filename, file, None))
+                continue
+            try:
+                archive = zipfile.ZipFile(file.file)
+            except zipfile.BadZipFile:
+                entries.append((file.filename, ValueError("Invalid zip archive"), None))
+                continue
+            archives.append(archive)
+            for info in archive.infolist():
+                if not info.is_dir() and info.filename.lower().endswith(IMAGE_EXTENSIONS):
+                    entries.append((info.filename, archive, info))
+    except BaseException:
+        for archive in archives:
+            archive.close()
+        raise
+    return entries, archives
+
+async def _read_batch_entry(upload, member) -> bytes:
+    if isinstance(upload, zipfile.ZipFile):
+        if member.file_size > MAX_IMAGE_BYTES:
+            raise ValueError("Image is too large")
+        return await asyncio.to_thread(upload.read, member)
+    content = await upload.read(MAX_IMAGE_BYTES + 1)
+    if len(content) > MAX_IMAGE_BYTES:
+        raise ValueError("Image is too large")
+    return content
+
+async def _decode_batch_entry(upload, member) -> Tuple[str, Optional[Tuple], Optional[np.ndarray]]:
+    """Return (digest, cached classification, image); only one of the last two is set."""
+    if isinstance(upload, Exception):
+        raise upload
+    with STAGE_SECONDS.labels("upload_read").time():
+        content = await _read_batch_entry(upload, member)
+    digest, cached = await _cached_analysis(content)
+    if cached is not None:
+        return digest, cached, None
+    return digest, None, await _prepare_image(content)
+
+async def _analyze_chunk(chunk: List[Tuple], top_k: int) -> List[Dict]:
+    """Decode a chunk of images concurrently and run them as one model batch."""
+    decoded = await asyncio.gather(
+        *[_decode_batch_entry(upload, member) for _, upload, member in chunk],
+        return_exceptions=True
+    )
+    images = [
+        item[2] for item in decoded
+        if not isinstance(item, BaseException) and item[2] is not None
+    ]
+    batch_error = None
+    if images:
+        try:
+            predictions = await batch_scheduler.submit(np.concatenate(images))
+            with STAGE_SECONDS.labels("postprocess").time():
+                top_classes, top_confidences = plant_model.top_k(predictions, MAX_TOP_K)
+        except QueueFullError:
+            raise
+        except Exception as e:
+            # Report the failure against every image of the batch rather
+            # than failing the whole request
+            logger.exception(f"Error analyzing a batch of {len(images)} images: {str(e)}")
+            batch_error = e
+    
+    results = []
+    index = 0
+    for (filename, _, _), item in zip(chunk, decoded):
+        failure = item
+        if not isinstance(item, BaseException):
+            digest, cached, _ = item
+            try:
+                if cached is not None:
+                    classes, confidences = cached
+                elif batch_error is not None:
+                    raise batch_error
+                else:
+                    classes, confidences = top_classes[index], top_confidences[index]
+                    index += 1
+                    _store_analysis(digest, classes, confidences)
+                result = plant_model.analysis_for(classes[:top_k], confidences[:top_k])
+                results.append({"filename": filename, "status": "success", "result": result})
+                continue
+            except Exception as e:
+                failure = e
+        if isinstance(failure, QueueFullError):
+            error = "Server busy, please retry"
+        else:
+            error = f"Failed to analyze image: {str(failure)}"
+        results.append({"filename": filename, "status": "failed", "error": error})
+    return results
+
+@app.post("/analyze-images")
+async def analyze_images(
+    files: List[UploadFile] = File(...),
+    top_k: int = Query(1, ge=1, le=MAX_TOP_K, description="Number of diagnoses to return per image")
+):
+    """
+    Analyze many images in one request.
+    
+    Accepts any number of image files and/or zip archives of images, up to
+    MAX_BATCH_FILES images in total. Images are processed in chunks of the
+    model batch size: each chunk is decoded concurrently and predicted as
+    one batch, so memory use does not grow with the number of files.
+    Results are returned in upload order, with per-file errors.
+    """
+    _require_model()
+    entries, archives = _list_batch_entries(files)
+    try:
+        if len(entries) > MAX_BATCH_FILES:
+            raise HTTPException(
+                status_code=413,
+                detail=f"Too many images: {len(entries)} (maximum {MAX_BATCH_FILES})"
+            )
+        
+        results = []
+        chunk_size = batch_scheduler.max_batch_size
+        for start in range(0, len(entries), chunk_size):
+            results.extend(await _analyze_chunk(entries[start:start + chunk_size], top_k))
+        
+        # Plain JSON data only, so skip FastAPI's recursive encoder
+        return JSONResponse(content={
+            "count": len(results),
+            "succeeded": sum(result["status"] == "success" for result in results),
+            "results": results
+        })
+    except QueueFullError:
+        raise HTTPException(
+            status_code=503,
+            detail="Image analysis is busy, please retry shortly",
+            headers={"Retry-After": INFERENCE_RETRY_AFTER}
+        )
+    finally:
+        for archive in archives:
+            archive.close()
+
+@app.get("/chat/cache/stats")
+async def chat_cache_stats():
+    if chat_service is None or chat_service.cache is None:
+        return {"enabled": False}
+    return {"enabled": True, **chat_service.cache.stats()}
+
+@app.get("/chat/sessions/stats")
+async def chat_session_stats():
+    if chat_service is None or chat_service.sessions is None:
+        return {"enabled": False}
+    return {"enabled": True, **chat_service.sessions.stats()}
+
+@app.post("/chat/sessions")
+async def create_chat_session():
+    """
+    Start a conversation.
+    
+    Chat requests carrying the returned ``session_id`` are answered with
+    the conversation's earlier turns; requests without one are stateless.
+    """
+    _require_chat()
+    if chat_service.sessions is None:
+        raise HTTPException(status_code=404, detail="Chat sessions are disabled")
+    return {"session_id": chat_service.sessions.new_id()}
+
+def _session_id(session_id: Optional[str]) -> Optional[str]:
+    """The conversation a chat request continues, or None for a stateless request."""
+    if chat_service.sessions is None:
+        return None
+    return session_id
+
 @app.post("/chat")
-async def chat(message: str = Body(...), language: str = Body("en")):
+async def chat(
+    message: str = Body(...),
+    language: str = Body("en"),
+    session_id: Optional[str] = Body(None, max_length=64)
+):
+    _require_chat()
+    session_id = _session_id(session_id)
     try:
         logger.info(f"Received chat request - Message: {message[:50]}..., Language: {language}")
-        response = await chat_service.get_response(message, language)
+        response = await chat_service.get_response(message, language, session_id)
         logger.info("Successfully got response from chat service")
         return JSONResponse(
             content={
                 "status": "success",
                 "response": response,
-                "language": language
+                "language": language,
+                "session_id": session_id
             }
         )
     except Exception as e:
@@ -93,12 +463,68 @@ async def chat(message: str = Body(...), language: str = Body("en")):
             content={
                 "status": "error",
                 "response": str(e),
-                "language": language
+                "language": language,
+                "session_id": session_id
             }
         )
 
+def _sse_event(data: Dict, event: Optional[str] = None) -> str:
+    """Format a Server-Sent Events message."""
+    message = f"data: {json.dumps(data)}\n\n"
+    return f"event: {event}\n{message}" if event else message
+
+@app.post("/chat/stream")
+async def chat_stream(
+    message: str = Body(...),
+    language: str = Body("en"),
+    session_id: Optional[str] = Body(None, max_length=64)
+):
+    """
+    Stream the chat response as Server-Sent Events.
+    
+    Each token is sent as a ``data: {"token": ...}`` event while it arrives,
+    followed by a final ``done`` event carrying the same envelope as /chat.
+    If the client disconnects the stream is cancelled, which stops the
+    chat provider's generation.
+    """
+    _require_chat()
+    session_id = _session_id(session_id)
+    logger.info(f"Received chat stream request - Message: {message[:50]}..., Language: {language}")
+    
+    async def event_stream():
+        chunks = []
+        stream = chat_service.stream_response(message, language, session_id)
+        try:
+            async for token in stream:
+                chunks.append(token)
+                yield _sse_event({"token": token})
+            yield _sse_event({
+                "status": "success",
+                "response": "".join(chunks),
+                "language": language,
+                "session_id": session_id
+            }, event="done")
+        except Exception as e:
+            yield _sse_event({
+                "status": "error",
+                "response": chat_service.error_message(e),
+                "language": language,
+                "session_id": session_id
+            }, event="done")
+        finally:
+            await stream.aclose()
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 if __name__ == "__main__":
-    # Get port from environment variable or use default
+    # Single-process server for development; production runs gunicorn with
+    # several workers (see gunicorn.conf.py)
     port = int(os.getenv("PORT", 8000))
-    # Run the server
-    uvicorn.run("main:app", host="0.0.0.0", port=port, reload=True) 
\ No newline at end of file
+    # Restart on code changes only when asked, the file watcher is not free
+    reload = os.getenv("RELOAD", "false").lower() in ("1", "true", "yes")
+    # log_config=None leaves logging as configured by configure_logging
+    uvicorn.run("main:app", host="0.0.0.0", port=port, reload=reload, log_config=None) 
\ No newline at end of file
@@ -0,0 +1,144 @@
+import json
+from typing import Dict, List, Optional, Sequence, Tuple
+
+# Everything in an analysis except the confidence itself depends only on the
+# predicted class and on which of these bands the confidence falls in. Each
+# band is (lower bound, severity, stage, monitoring schedule, recommendations),
+# checked from the top; the last one catches everything else.
+SEVERITY_BANDS = (
+    (
+        0.9, "severe", "advanced",
+        {
+            "daily": "Check for new symptoms and document changes",
+            "weekly": "Apply treatment and assess effectiveness",
+            "monthly": "Evaluate overall plant health and recovery"
+        },
+        (
+            "Begin treatment immediately",
+            "Isolate affected plants if possible",
+            "Document symptom progression daily"
+        ),
+    ),
+    (
+        0.7, "moderate", "mid-stage",
+        {
+            "daily": "Monitor for symptom progression",
+            "weekly": "Apply preventive measures",
+            "monthly": "Assess treatment effectiveness"
+        },
+        (
+            "Start treatment as soon as possible",
+            "Monitor plant health closely",
+            "Implement preventive measures"
+        ),
+    ),
+    (
+        float("-inf"), "mild", "early",
+        {
+            "daily": "Check for new symptoms",
+            "weekly": "Apply preventive measures",
+            "monthly": "Monitor overall plant health"
+        },
+        (
+            "Monitor for symptom progression",
+            "Implement preventive measures",
+            "Consider early treatment options"
+        ),
+    ),
+)
+
+
+def severity_band(confidence: float) -> int:
+    """Index into SEVERITY_BANDS for a confidence score."""
+    for band, (lower, *_) in enumerate(SEVERITY_BANDS):
+        if confidence > lower:
+            return band
+    return len(SEVERITY_BANDS) - 1
+
+
+def _dumps(value) -> bytes:
+    return json.dumps(value, separators=(",", ":")).encode()
+
+
+class AnalysisTemplate:
+    """
+    Precomputed analysis for one (class, severity band) pair.
+
+    The nested structures are shared by every response built from the
+    template, so they are stored as tuples and must not be modified.
+    """
+
+    __slots__ = ("head", "tail", "prefix", "suffix")
+
+    def __init__(self, head: Dict, tail: Dict):
+        self.head = head
+        self.tail = tail
+        # The JSON around the confidence value, so rendering is a concatenation
+        self.prefix = _dumps(head)[:-1] + b',"confidence":'
+        self.suffix = b"," + _dumps(tail)[1:]
+
+    def to_dict(self, confidence: float, alternatives: Optional[List[Dict]] = None) -> Dict:
+        result = {**self.head, "confidence": confidence, **self.tail}
+        if alternatives is not None:
+            result["alternatives"] = alternatives
+        return result
+
+    def to_json(self, confidence: float, alternatives: Optional[List[Dict]] = None) -> bytes:
+        if alternatives is None:
+            return self.prefix + _dumps(confidence) + self.suffix
+        return (
+            self.prefix + _dumps(confidence) + self.suffix[:-1]
+            + b',"alternatives":' + _dumps(alternatives) + b"}"
+        )
+
+
+def _compile(plant_type: str, disease: str, disease_info: Dict, band: Tuple) -> AnalysisTemplate:
+    _, severity, stage, monitoring, recommendations = band
+    symptoms = tuple(disease_info.get("symptoms", ()))
+    causes = tuple(disease_info.get("causes", ()))
+    treatment = tuple(disease_info.get("treatment", ()))
+    prevention = tuple(disease_info.get("prevention", ()))
+    return AnalysisTemplate(
+        head={"plant_type": plant_type, "disease": disease},
+        tail={
+            "severity": severity,
+            "analysis": {
+                "visual_symptoms": symptoms,
+                "stage": stage,
+                "risk_factors": causes,
+                "treatment_plan": {
+                    "immediate_actions": treatment,
+                    "long_term_measures": prevention
+                },
+                "monitoring_schedule": monitoring,
+                "prevention_measures": prevention
+            },
+            "recommendations": recommendations + treatment
+        },
+    )
+
+
+class AnalysisTemplates:
+    """
+    All analysis templates for a label map, indexed by class and band.
+
+    ``disease_info`` holds the knowledge base entry for each class, in the
+    same order as ``class_names``.
+
+    Built once when the model is loaded; per request only the confidence is
+    filled in.
+    """
+
+    def __init__(self, class_names: Sequence[str], disease_info: Sequence[Dict]):
+        self.templates: List[Tuple[AnalysisTemplate, ...]] = []
+        # Plant type and disease of each class, for listing alternatives
+        self.labels: List[Dict] = []
+        for class_name, info in zip(class_names, disease_info):
+            plant_type, disease = class_name.split("___")
+            self.labels.append({"plant_type": plant_type, "disease": disease})
+            self.templates.append(tuple(
+                _compile(plant_type, disease, info, band) for band in SEVERITY_BANDS
+            ))
+
+    def get(self, class_index: int, confidence: float) -> AnalysisTemplate:
+        return self.templates[class_index][severity_band(confidence)]
@@ -0,0 +1,87 @@
+import json
+import logging
+import os
+import time
+from typing import Dict, List, Optional, Sequence
+
+from models.analysis_templates import AnalysisTemplate, AnalysisTemplates
+
+logger = logging.getLogger(__name__)
+
+KNOWLEDGE_BASE_PATH = os.path.join(os.path.dirname(__file__), "disease_knowledge.json")
+
+
+class KnowledgeBase:
+    """
+    Disease information loaded from a versioned JSON file.
+
+    The file maps class labels (as in the model's label map) to symptoms,
+    causes, treatment and prevention. Entries are resolved against the label
+    map once at load time, so a lookup is a list index by class.
+
+    The file is watched for changes: at most every ``check_interval``
+    seconds a lookup stats it, and a newer file is loaded and swapped in.
+    A file that fails to load is reported and the previous data kept.
+    """
+
+    def __init__(self, class_names: Sequence[str], path: Optional[str] = None, check_interval: float = 5.0):
+        self.path = path or KNOWLEDGE_BASE_PATH
+        self.class_names = list(class_names)
+        self.check_interval = check_interval
+        self.version = None
+        self.entries: List[Dict] = []
+        self.templates: Optional[AnalysisTemplates] = None
+        self._mtime = None
+        self._checked_at = time.monotonic()
+        self.load()
+
+    def load(self):
+        """Read the file and rebuild the per-class entries and templates."""
+        mtime = os.stat(self.path).st_mtime_ns
+        with open(self.path) as f:
+            data = json.load(f)
+        diseases = data["diseases"]
+
+        unknown = sorted(set(diseases) - set(self.class_names))
+        if unknown:
+            logger.warning(f"Knowledge base entries without a model class: {', '.join(unknown)}")
+
+        entries = [diseases.get(class_name, {}) for class_name in self.class_names]
+        templates = AnalysisTemplates(self.class_names, entries)
+
+        # Readers only go through self.templates, so swapping it last is enough
+        self.version = data.get("version")
+        self.entries = entries
+        self.templates = templates
+        self._mtime = mtime
+        logger.info(f"Loaded knowledge base version {self.version}: "
+                    f"{sum(bool(entry) for entry in entries)}/{len(entries)} classes covered")
+
+    def reload_if_changed(self) -> bool:
+        """Reload the file if it changed since it was loaded. Returns True on reload."""
+        now = time.monotonic()
+        if now - self._checked_at < self.check_interval:
+            return False
+        self._checked_at = now
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+        except OSError as e:
+            logger.error(f"Knowledge base unavailable, keeping version {self.version}: {str(e)}")
+            return False
+        if mtime == self._mtime:
+            return False
+        try:
+            self.load()
+        except (OSError, ValueError, KeyError) as e:
+            logger.error(f"Error reloading knowledge base, keeping version {self.version}: {str(e)}")
+            # Don't retry the same broken file on every check
+            self._mtime = mtime
+            return False
+        return True
+
+    def template(self, class_index: int, confidence: float) -> AnalysisTemplate:
+        self.reload_if_changed()
+        return self.templates.get(class_index, confidence)
+
+    def get(self, class_index: int) -> Dict:
+        return self.entries[class_index]
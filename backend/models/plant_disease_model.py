@@ -1,45 +1,114 @@
 from PIL import Image
 import numpy as np
 import os
-from typing import Dict, List, Tuple
+from typing import BinaryIO, Dict, List, Optional, Sequence, Tuple, Union
 import json
-import tensorflow as tf
-from tensorflow.keras.applications import EfficientNetB0
-from tensorflow.keras.layers import Dense, GlobalAveragePooling2D
-from tensorflow.keras.models import Model
+import hashlib
+import logging
+import time
 import requests
 from io import BytesIO
+from models.knowledge_base import KnowledgeBase
+from models.runtimes import load_runtime
+
+logger = logging.getLogger(__name__)
+
+# An image can be given as a path, raw encoded bytes or an open binary file
+ImageSource = Union[str, os.PathLike, bytes, bytearray, memoryview, BinaryIO]
+
+# Input size expected by MobileNetV2, as (width, height)
+IMAGE_SIZE = (224, 224)
 
 class PlantDiseaseModel:
-    def __init__(self):
+    def __init__(
+        self,
+        backend: Optional[str] = None,
+        model_path: Optional[str] = None,
+        quantization: Optional[str] = None,
+        temperature: Optional[float] = None
+    ):
+        """
+        Args:
+            backend: Serving runtime, one of ``keras``, ``savedmodel``,
+                ``tflite`` or ``remote`` (a separate inference_server.py
+                process). Defaults to the MODEL_BACKEND environment
+                variable, or ``keras``.
+            model_path: Model artifact to load instead of the default one
+                for the backend (MODEL_PATH environment variable)
+            quantization: ``dynamic`` or ``int8`` to load a quantized TFLite
+                model (MODEL_QUANTIZATION environment variable)
+            temperature: Calibration temperature applied to the model's
+                probabilities; 1.0 leaves them unchanged
+                (MODEL_CALIBRATION_TEMPERATURE environment variable)
+        """
+        self.backend = backend or os.getenv("MODEL_BACKEND", "keras")
+        self.model_path = model_path or os.getenv("MODEL_PATH")
+        self.quantization = quantization or os.getenv("MODEL_QUANTIZATION", "none")
+        self.temperature = temperature or float(os.getenv("MODEL_CALIBRATION_TEMPERATURE", 1.0))
+        if self.temperature <= 0:
+            raise ValueError(f"Calibration temperature must be positive, got {self.temperature}")
+        
         # Initialize the pre-trained model
         self.model = self._load_pretrained_model()
-        self.disease_db = self._load_disease_database()
+        self.version = self._model_version()
         self.class_names = self._load_class_names()
+        if len(self.class_names) != self.model.num_classes:
+            raise ValueError(
+                f"The label map has {len(self.class_names)} classes but the model "
+                f"outputs {self.model.num_classes}"
+            )
+        self.knowledge_base = KnowledgeBase(
+            self.class_names,
+            path=os.getenv("KNOWLEDGE_BASE_PATH"),
+            check_interval=float(os.getenv("KNOWLEDGE_BASE_RELOAD_INTERVAL", 5))
+        )
         
-    def _load_pretrained_model(self) -> Model:
-        """Load the pre-trained model."""
+    def _model_version(self) -> str:
+        """
+        Identify the loaded model artifact and calibration.
+        
+        Cached analyses are keyed on this, so results produced by a different
+        model file, runtime or temperature are never served.
+        """
+        server_version = getattr(self.model, "server_version", None)
+        if server_version is not None:
+            # The inference server identifies the artifact it runs
+            version = f"{self.backend}-{server_version}"
+        else:
+            path = self.model.model_path
+            stat = os.stat(path)
+            fingerprint = hashlib.sha1(
+                f"{os.path.abspath(path)}:{stat.st_size}:{stat.st_mtime_ns}".encode()
+            ).hexdigest()[:12]
+            version = f"{self.backend}-{self.quantization}-{fingerprint}"
+        if self.temperature != 1.0:
+            version += f"-t{self.temperature:g}"
+        return version
+        
+    def _load_pretrained_model(self):
+        """Load the pre-trained model with the configured serving runtime."""
         try:
-            # Load the saved model
-            model_path = os.path.join(os.path.dirname(__file__), 'plant_disease_model.h5')
-            if not os.path.exists(model_path):
-                raise FileNotFoundError(
-                    "Model not found. Please run setup_model.py to create the model."
-                )
-            
-            model = tf.keras.models.load_model(model_path)
-            return model
+            logger.info(f"Loading model with the {self.backend} backend (quantization: {self.quantization})")
+            return load_runtime(self.backend, self.model_path, self.quantization)
         except Exception as e:
-            print(f"Error loading model: {str(e)}")
+            logger.error(f"Error loading model: {str(e)}")
             raise
         
     def _load_class_names(self) -> List[str]:
-        """Load the class names for the PlantVillage dataset."""
+        """
+        Load the class names for the PlantVillage dataset.
+        
+        These are the 38 PlantVillage classes in the order of the model's
+        outputs (the alphabetical order of the dataset's folders).
+        """
         return [
             'Apple___Apple_scab',
             'Apple___Black_rot',
             'Apple___Cedar_apple_rust',
             'Apple___healthy',
+            'Blueberry___healthy',
+            'Cherry_(including_sour)___Powdery_mildew',
+            'Cherry_(including_sour)___healthy',
             'Corn_(maize)___Cercospora_leaf_spot',
             'Corn_(maize)___Common_rust',
             'Corn_(maize)___Northern_Leaf_Blight',
@@ -48,9 +117,19 @@ class PlantDiseaseModel:
             'Grape___Esca_(Black_Measles)',
             'Grape___Leaf_blight_(Isariopsis_Leaf_Spot)',
             'Grape___healthy',
+            'Orange___Haunglongbing_(Citrus_greening)',
+            'Peach___Bacterial_spot',
+            'Peach___healthy',
+            'Pepper,_bell___Bacterial_spot',
+            'Pepper,_bell___healthy',
             'Potato___Early_blight',
             'Potato___Late_blight',
             'Potato___healthy',
+            'Raspberry___healthy',
+            'Soybean___healthy',
+            'Squash___Powdery_mildew',
+            'Strawberry___Leaf_scorch',
+            'Strawberry___healthy',
             'Tomato___Bacterial_spot',
             'Tomato___Early_blight',
             'Tomato___Late_blight',
@@ -63,156 +142,219 @@ class PlantDiseaseModel:
             'Tomato___healthy'
         ]
         
-    def preprocess_image(self, image: Image.Image) -> np.ndarray:
-        """Preprocess the image for the model."""
+    @staticmethod
+    def preprocess_image(image: Image.Image) -> np.ndarray:
+        """
+        Preprocess the image for the model.
+        
+        Args:
+            image: RGB image, ideally already draft-decoded by load_image
+                
+        Returns:
+            A (1, 224, 224, 3) float32 array
+        """
         try:
-            # Resize image to 224x224 (required by MobileNetV2)
-            image = image.resize((224, 224))
-            
-            # Convert to numpy array and normalize
-            image_array = np.array(image)
-            image_array = image_array / 255.0
+            # Resize image to 224x224 (required by MobileNetV2). reducing_gap
+            # lets Pillow shrink large images by an integer factor first,
+            # which is much cheaper than filtering from full resolution.
+            if image.size != IMAGE_SIZE:
+                image = image.resize(IMAGE_SIZE, Image.Resampling.BILINEAR, reducing_gap=2.0)
             
-            # Add batch dimension
-            image_array = np.expand_dims(image_array, axis=0)
+            # Normalize straight into a float32 array, without float64 temporaries
+            batch = np.empty((1, IMAGE_SIZE[1], IMAGE_SIZE[0], 3), dtype=np.float32)
+            np.multiply(np.asarray(image, dtype=np.uint8), np.float32(1 / 255.0), out=batch[0])
             
-            return image_array
+            return batch
         except Exception as e:
-            print(f"Error in preprocess_image: {str(e)}")
+            logger.error(f"Error in preprocess_image: {str(e)}")
             raise
         
-    def analyze_image(self, image_path: str) -> Dict:
+    @staticmethod
+    def load_image(source: ImageSource) -> Image.Image:
+        """
+        Load an image and make sure it is in RGB mode.
+        
+        Args:
+            source: Path to an image file, the encoded image bytes (bytes,
+                bytearray or memoryview) or a binary file-like object
+                
+        Returns:
+            The decoded RGB image
+        """
+        if isinstance(source, (bytes, bytearray, memoryview)):
+            # Decode straight from the upload buffer, no temporary file needed
+            image = Image.open(BytesIO(source))
+        else:
+            if isinstance(source, (str, os.PathLike)):
+                logger.debug("Loading image from: %s", source)
+            image = Image.open(source)
+        
+        # For JPEGs, let the decoder downscale by up to 8x while decoding
+        # instead of materializing the full-resolution image
+        image.draft('RGB', IMAGE_SIZE)
+        
+        # Convert image to RGB if it's not
+        if image.mode != 'RGB':
+            logger.debug("Converting image from %s to RGB mode", image.mode)
+            image = image.convert('RGB')
+        return image
+        
+    @staticmethod
+    def prepare_image(source: ImageSource) -> np.ndarray:
+        """
+        Load and preprocess an image into a single-item model batch.
+        
+        This does not touch the model, so it can run in a worker thread or
+        process without loading TensorFlow there.
+        """
+        image = PlantDiseaseModel.load_image(source)
+        logger.debug("Preprocessing image")
+        return PlantDiseaseModel.preprocess_image(image)
+        
+    @staticmethod
+    def prepare_image_timed(source: ImageSource) -> Tuple[np.ndarray, float, float]:
+        """
+        Like prepare_image, also returning the decode and preprocess times.
+        
+        The timings are returned rather than recorded so the caller gets them
+        back from a worker process too.
+        
+        Returns:
+            Tuple of (batch, decode seconds, preprocess seconds)
+        """
+        started = time.perf_counter()
+        image = PlantDiseaseModel.load_image(source)
+        # Pillow decodes lazily; force it here so it is timed as decoding
+        image.load()
+        decoded = time.perf_counter()
+        batch = PlantDiseaseModel.preprocess_image(image)
+        return batch, decoded - started, time.perf_counter() - decoded
+        
+    def predict_batch(self, batch: np.ndarray) -> np.ndarray:
+        """
+        Run the model on a batch of preprocessed images.
+        
+        Args:
+            batch: Array of shape (N, 224, 224, 3)
+            
+        Returns:
+            Array of shape (N, num_classes) with the class probabilities
+        """
+        return self.model.predict(batch)
+        
+    def warm_up(self, batch_size: int = 1):
+        """
+        Run a dummy batch through the model.
+        
+        The first call pays for graph tracing and buffer allocation, so doing
+        it at startup keeps that cost away from the first real request.
+        """
+        dummy = np.zeros((batch_size, IMAGE_SIZE[1], IMAGE_SIZE[0], 3), dtype=np.float32)
+        self.predict_batch(dummy)
+        
+    def calibrate(self, predictions: np.ndarray) -> np.ndarray:
+        """
+        Apply temperature scaling to a batch of class probabilities.
+        
+        Equivalent to dividing the model's logits by the temperature before
+        the softmax, which makes over-confident models report probabilities
+        closer to their actual accuracy.
+        """
+        if self.temperature == 1.0:
+            return predictions
+        logits = np.log(np.maximum(predictions, np.float32(1e-12))) / np.float32(self.temperature)
+        logits -= logits.max(axis=1, keepdims=True)
+        scaled = np.exp(logits)
+        scaled /= scaled.sum(axis=1, keepdims=True)
+        return scaled
+        
+    def top_k(self, predictions: np.ndarray, k: int = 1) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Select the most likely classes for every row of a batch at once.
+        
+        Args:
+            predictions: Array of shape (N, num_classes) from predict_batch
+            k: Number of classes to keep per image
+            
+        Returns:
+            Tuple of (class indices, calibrated probabilities), both of shape
+            (N, k) and sorted by decreasing probability; k is capped at the
+            number of classes
+        """
+        if k < 1:
+            raise ValueError(f"k must be at least 1, got {k}")
+        probabilities = self.calibrate(predictions)
+        k = min(k, probabilities.shape[1])
+        top = np.argpartition(probabilities, -k, axis=1)[:, -k:]
+        top_probabilities = np.take_along_axis(probabilities, top, axis=1)
+        order = np.argsort(-top_probabilities, axis=1)
+        return np.take_along_axis(top, order, axis=1), np.take_along_axis(top_probabilities, order, axis=1)
+        
+    def build_analysis(self, prediction: np.ndarray, top_k: int = 1) -> Dict:
+        """
+        Build the analysis result for a single row of model output.
+        
+        Args:
+            prediction: Class probabilities for one image
+            top_k: Number of diagnoses; the ones after the first are returned
+                as ``alternatives``
+            
+        Returns:
+            Dictionary containing detailed analysis results. Its nested
+            values are shared with other results and must not be modified.
+        """
+        classes, confidences = self.top_k(prediction[np.newaxis], top_k)
+        return self.analysis_for(classes[0], confidences[0])
+        
+    def analysis_for(self, classes: Sequence[int], confidences: Sequence[float]) -> Dict:
+        """Build the analysis result from an image's top classes, most likely first."""
+        template, confidence, alternatives = self._resolve(classes, confidences)
+        return template.to_dict(confidence, alternatives)
+        
+    def render_analysis(self, classes: Sequence[int], confidences: Sequence[float]) -> bytes:
+        """Serialize the analysis for an image's top classes straight to JSON bytes."""
+        template, confidence, alternatives = self._resolve(classes, confidences)
+        return template.to_json(confidence, alternatives)
+        
+    def _resolve(self, classes: Sequence[int], confidences: Sequence[float]):
+        confidence = float(confidences[0])
+        template = self.knowledge_base.template(int(classes[0]), confidence)
+        alternatives = None
+        if len(classes) > 1:
+            labels = self.knowledge_base.templates.labels
+            alternatives = [
+                {**labels[int(index)], "confidence": float(probability)}
+                for index, probability in zip(classes[1:], confidences[1:])
+            ]
+        return template, confidence, alternatives
+        
+    def analyze_image(self, source: ImageSource) -> Dict:
         """
         Analyze a plant image using the pre-trained model.
         
         Args:
-            image_path: Path to the plant image
+            source: Path to the plant image, its encoded bytes or a binary
+                file-like object
             
         Returns:
             Dictionary containing detailed analysis results
         """
         try:
-            # Load and preprocess image
-            print(f"Loading image from: {image_path}")
-            image = Image.open(image_path)
-            
-            # Convert image to RGB if it's not
-            if image.mode != 'RGB':
-                print("Converting image to RGB mode")
-                image = image.convert('RGB')
-            
-            # Preprocess the image
-            print("Preprocessing image...")
-            processed_image = self.preprocess_image(image)
+            processed_image = self.prepare_image(source)
             
             # Get model predictions
-            print("Getting model predictions...")
-            predictions = self.model.predict(processed_image, verbose=0)
-            predicted_class = np.argmax(predictions[0])
-            confidence = float(predictions[0][predicted_class])
-            
-            # Get class name
-            class_name = self.class_names[predicted_class]
-            plant_type, disease = class_name.split('___')
+            logger.debug("Getting model predictions")
+            predictions = self.predict_batch(processed_image)
             
-            print(f"Detected: {plant_type} with {disease} (confidence: {confidence:.2f})")
-            
-            # Get detailed information
-            disease_info = self.get_disease_details(plant_type.lower(), disease.lower())
-            
-            return {
-                "plant_type": plant_type,
-                "disease": disease,
-                "confidence": confidence,
-                "severity": self._determine_severity(confidence),
-                "analysis": {
-                    "visual_symptoms": disease_info.get("symptoms", []),
-                    "stage": self._determine_stage(confidence),
-                    "risk_factors": disease_info.get("causes", []),
-                    "treatment_plan": {
-                        "immediate_actions": disease_info.get("treatment", []),
-                        "long_term_measures": disease_info.get("prevention", [])
-                    },
-                    "monitoring_schedule": self._get_monitoring_schedule(confidence),
-                    "prevention_measures": disease_info.get("prevention", [])
-                },
-                "recommendations": self._generate_recommendations(confidence, disease_info)
-            }
+            return self.build_analysis(predictions[0])
             
         except Exception as e:
-            print(f"Error in analyze_image: {str(e)}")
-            import traceback
-            traceback.print_exc()
+            logger.exception(f"Error in analyze_image: {str(e)}")
             return {
                 "error": f"Failed to analyze image: {str(e)}",
                 "status": "failed"
             }
             
-    def _determine_severity(self, confidence: float) -> str:
-        """Determine disease severity based on confidence score."""
-        if confidence > 0.9:
-            return "severe"
-        elif confidence > 0.7:
-            return "moderate"
-        else:
-            return "mild"
-            
-    def _determine_stage(self, confidence: float) -> str:
-        """Determine disease stage based on confidence score."""
-        if confidence > 0.9:
-            return "advanced"
-        elif confidence > 0.7:
-            return "mid-stage"
-        else:
-            return "early"
-            
-    def _get_monitoring_schedule(self, confidence: float) -> Dict:
-        """Generate monitoring schedule based on disease severity."""
-        if confidence > 0.9:
-            return {
-                "daily": "Check for new symptoms and document changes",
-                "weekly": "Apply treatment and assess effectiveness",
-                "monthly": "Evaluate overall plant health and recovery"
-            }
-        elif confidence > 0.7:
-            return {
-                "daily": "Monitor for symptom progression",
-                "weekly": "Apply preventive measures",
-                "monthly": "Assess treatment effectiveness"
-            }
-        else:
-            return {
-                "daily": "Check for new symptoms",
-                "weekly": "Apply preventive measures",
-                "monthly": "Monitor overall plant health"
-            }
-            
-    def _generate_recommendations(self, confidence: float, disease_info: Dict) -> List[str]:
-        """Generate recommendations based on disease severity and information."""
-        recommendations = []
-        
-        if confidence > 0.9:
-            recommendations.extend([
-                "Begin treatment immediately",
-                "Isolate affected plants if possible",
-                "Document symptom progression daily"
-            ])
-        elif confidence > 0.7:
-            recommendations.extend([
-                "Start treatment as soon as possible",
-                "Monitor plant health closely",
-                "Implement preventive measures"
-            ])
-        else:
-            recommendations.extend([
-                "Monitor for symptom progression",
-                "Implement preventive measures",
-                "Consider early treatment options"
-            ])
-            
-        recommendations.extend(disease_info.get("treatment", []))
-        return recommendations
-
     def get_disease_details(self, plant_type: str, disease: str) -> Dict:
         """
         Get detailed information about a specific plant disease.
@@ -225,7 +367,13 @@ class PlantDiseaseModel:
             Dictionary containing detailed disease information
         """
         try:
-            return self.disease_db.get(plant_type, {}).get(disease, {})
+            # Lookups by name are for callers outside the request path; the
+            # analysis itself indexes the knowledge base by class
+            class_name = f"{plant_type}___{disease}".lower()
+            for index, name in enumerate(self.class_names):
+                if name.lower() == class_name:
+                    return self.knowledge_base.get(index)
+            return {}
         except Exception as e:
             return {"error": f"Error retrieving disease details: {str(e)}"}
 
@@ -245,185 +393,5 @@ class PlantDiseaseModel:
                 json.dump(analysis, f, indent=4)
             return True
         except Exception as e:
-            print(f"Error saving analysis: {str(e)}")
+            logger.error(f"Error saving analysis: {str(e)}")
             return False
-
-    def _load_disease_database(self) -> Dict:
-        """Load the comprehensive plant disease database."""
-        return {
-            "apple": {
-                "apple_scab": {
-                    "symptoms": [
-                        "Olive-green to black spots on leaves",
-                        "Velvety texture on spots",
-                        "Yellowing and premature leaf drop",
-                        "Lesions on fruit and twigs",
-                        "Corky, scabby spots on fruit"
-                    ],
-                    "causes": [
-                        "Fungus Venturia inaequalis",
-                        "Wet spring weather",
-                        "Poor air circulation",
-                        "Overhead watering"
-                    ],
-                    "treatment": [
-                        "Apply fungicides in early spring",
-                        "Remove and destroy infected leaves",
-                        "Prune for better air circulation",
-                        "Use resistant varieties"
-                    ],
-                    "prevention": [
-                        "Plant resistant varieties",
-                        "Space trees properly",
-                        "Prune for good air flow",
-                        "Clean up fallen leaves",
-                        "Avoid overhead watering"
-                    ]
-                },
-                "black_rot": {
-                    "symptoms": [
-                        "Purple spots on leaves",
-                        "Fruit rot with concentric rings",
-                        "Cankers on branches",
-                        "Premature fruit drop",
-                        "Leaf yellowing and wilting"
-                    ],
-                    "causes": [
-                        "Fungus Botryosphaeria obtusa",
-                        "Warm, wet weather",
-                        "Poor sanitation",
-                        "Wounded tissue"
-                    ],
-                    "treatment": [
-                        "Remove infected fruit and branches",
-                        "Apply fungicides during bloom",
-                        "Prune out cankers",
-                        "Improve air circulation"
-                    ],
-                    "prevention": [
-                        "Plant resistant varieties",
-                        "Remove mummified fruit",
-                        "Prune properly",
-                        "Avoid wounding trees",
-                        "Clean up fallen debris"
-                    ]
-                }
-            },
-            "tomato": {
-                "early_blight": {
-                    "symptoms": [
-                        "Small, dark brown to black spots on lower leaves",
-                        "Concentric rings in the spots",
-                        "Yellow halos around the spots",
-                        "Leaves turning yellow and dropping",
-                        "Lesions on stems and fruits"
-                    ],
-                    "causes": [
-                        "Fungus Alternaria solani",
-                        "Warm, humid weather",
-                        "Poor air circulation",
-                        "Overhead watering"
-                    ],
-                    "treatment": [
-                        "Remove and destroy infected leaves",
-                        "Apply copper-based fungicides",
-                        "Improve air circulation",
-                        "Water at the base of plants",
-                        "Rotate crops annually"
-                    ],
-                    "prevention": [
-                        "Use disease-resistant varieties",
-                        "Space plants properly",
-                        "Mulch around plants",
-                        "Avoid overhead watering",
-                        "Clean garden tools regularly"
-                    ]
-                },
-                "late_blight": {
-                    "symptoms": [
-                        "Large, irregular brown spots on leaves",
-                        "White fungal growth on undersides",
-                        "Dark lesions on stems",
-                        "Rapid plant collapse",
-                        "Fruit rot with firm, brown spots"
-                    ],
-                    "causes": [
-                        "Phytophthora infestans fungus",
-                        "Cool, wet weather",
-                        "High humidity",
-                        "Poor drainage"
-                    ],
-                    "treatment": [
-                        "Remove infected plants immediately",
-                        "Apply fungicides preventatively",
-                        "Improve soil drainage",
-                        "Use drip irrigation"
-                    ],
-                    "prevention": [
-                        "Plant resistant varieties",
-                        "Space plants for good air flow",
-                        "Water in the morning",
-                        "Remove plant debris",
-                        "Rotate crops"
-                    ]
-                }
-            },
-            "potato": {
-                "early_blight": {
-                    "symptoms": [
-                        "Small, dark spots on leaves",
-                        "Concentric rings in spots",
-                        "Yellowing of leaves",
-                        "Premature defoliation",
-                        "Lesions on stems"
-                    ],
-                    "causes": [
-                        "Fungus Alternaria solani",
-                        "Warm, humid conditions",
-                        "Poor air circulation",
-                        "Overhead watering"
-                    ],
-                    "treatment": [
-                        "Remove infected leaves",
-                        "Apply fungicides",
-                        "Improve air circulation",
-                        "Water at soil level"
-                    ],
-                    "prevention": [
-                        "Use certified seed potatoes",
-                        "Rotate crops",
-                        "Space plants properly",
-                        "Remove plant debris",
-                        "Avoid overhead watering"
-                    ]
-                },
-                "late_blight": {
-                    "symptoms": [
-                        "Dark, water-soaked spots on leaves",
-                        "White fungal growth on undersides",
-                        "Rapid plant collapse",
-                        "Brown lesions on stems",
-                        "Rotting tubers"
-                    ],
-                    "causes": [
-                        "Phytophthora infestans",
-                        "Cool, wet weather",
-                        "High humidity",
-                        "Poor drainage"
-                    ],
-                    "treatment": [
-                        "Remove infected plants",
-                        "Apply fungicides",
-                        "Improve drainage",
-                        "Harvest early if necessary"
-                    ],
-                    "prevention": [
-                        "Use resistant varieties",
-                        "Plant certified seed",
-                        "Rotate crops",
-                        "Improve drainage",
-                        "Monitor weather conditions"
-                    ]
-                }
-            }
-        } 
\ No newline at end of file
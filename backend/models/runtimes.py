@@ -0,0 +1,321 @@
+import os
+import socket
+import struct
+import threading
+import time
+from typing import Optional, Tuple
+
+import numpy as np
+
+# TensorFlow is imported inside the runtimes rather than at module level, so
+# importing this module (and the API that uses it) stays fast; the cost is
+# paid when the model is actually loaded.
+
+MODELS_DIR = os.path.dirname(__file__)
+
+# Default artifact locations, relative to the models directory
+MODEL_PATHS = {
+    "keras": "plant_disease_model.h5",
+    "savedmodel": "plant_disease_savedmodel",
+    "tflite": "plant_disease_model.tflite",
+}
+
+# Quantized TFLite variants produced by quantize_model.py
+QUANTIZED_PATHS = {
+    "dynamic": "plant_disease_model_dynamic.tflite",
+    "int8": "plant_disease_model_int8.tflite",
+}
+
+# Wire format shared with inference_server.py. Both ends run on the same
+# host, so headers and tensors use native byte order.
+INFERENCE_SOCKET = "/tmp/greenbot-inference.sock"
+INFERENCE_MAGIC = b"GBI1"
+# magic, images, height, width, channels; followed by the float32 images.
+# A request with no images asks for the server's class count and version.
+REQUEST_HEADER = struct.Struct("=4sIIII")
+# magic, status, rows, columns, text length; followed by the float32
+# predictions and then UTF-8 text (the model version or an error message)
+RESPONSE_HEADER = struct.Struct("=4sIIII")
+STATUS_OK = 0
+STATUS_ERROR = 1
+
+
+class KerasRuntime:
+    """Run the full Keras model, as saved by setup_model.py."""
+
+    name = "keras"
+
+    def __init__(self, model_path: str):
+        import tensorflow as tf
+
+        self.model_path = model_path
+        # The optimizer state is only needed for training
+        self.model = tf.keras.models.load_model(model_path, compile=False)
+
+    @property
+    def num_classes(self) -> int:
+        return int(self.model.output_shape[-1])
+
+    def predict(self, batch: np.ndarray) -> np.ndarray:
+        return self.model.predict(batch, verbose=0)
+
+
+class SavedModelRuntime:
+    """Call the frozen ``serving_default`` signature exported by export_model.py."""
+
+    name = "savedmodel"
+
+    def __init__(self, model_path: str):
+        import tensorflow as tf
+
+        self.tf = tf
+        self.model_path = model_path
+        self.model = tf.saved_model.load(model_path)
+        self.signature = self.model.signatures["serving_default"]
+
+    @property
+    def num_classes(self) -> int:
+        return int(next(iter(self.signature.structured_outputs.values())).shape[-1])
+
+    def predict(self, batch: np.ndarray) -> np.ndarray:
+        outputs = self.signature(self.tf.constant(batch, dtype=self.tf.float32))
+        return next(iter(outputs.values())).numpy()
+
+
+class TFLiteRuntime:
+    """
+    Run a TensorFlow Lite flatbuffer.
+
+    Float models use the XNNPACK delegate, which TensorFlow Lite applies by
+    default on CPU. The lighter ``tflite_runtime`` package is used when it is
+    installed, otherwise the interpreter bundled with TensorFlow.
+
+    Full-integer models take and return quantized tensors; inputs are
+    quantized and outputs dequantized here so callers always deal with
+    float32 images and probabilities.
+    """
+
+    name = "tflite"
+
+    def __init__(self, model_path: str, num_threads: Optional[int] = None):
+        try:
+            from tflite_runtime.interpreter import Interpreter
+        except ImportError:
+            import tensorflow as tf
+            Interpreter = tf.lite.Interpreter
+
+        self.model_path = model_path
+        self.interpreter = Interpreter(
+            model_path=model_path,
+            num_threads=num_threads or os.cpu_count()
+        )
+        self.interpreter.allocate_tensors()
+        self.input_detail = self.interpreter.get_input_details()[0]
+        self.output_detail = self.interpreter.get_output_details()[0]
+        self._batch_size = int(self.input_detail["shape"][0])
+        # The interpreter is stateful and not safe to share between threads
+        self._lock = threading.Lock()
+
+    @property
+    def num_classes(self) -> int:
+        return int(self.output_detail["shape"][-1])
+
+    def _resize(self, batch_size: int):
+        if batch_size == self._batch_size:
+            return
+        shape = list(self.input_detail["shape"])
+        shape[0] = batch_size
+        self.interpreter.resize_tensor_input(self.input_detail["index"], shape)
+        self.interpreter.allocate_tensors()
+        self._batch_size = batch_size
+
+    def predict(self, batch: np.ndarray) -> np.ndarray:
+        with self._lock:
+            self._resize(len(batch))
+            self.interpreter.set_tensor(self.input_detail["index"], self._quantize(batch))
+            self.interpreter.invoke()
+            # get_tensor returns a copy, so it is safe to use after the lock
+            output = self.interpreter.get_tensor(self.output_detail["index"])
+        return self._dequantize(output)
+
+    def _quantize(self, batch: np.ndarray) -> np.ndarray:
+        dtype = self.input_detail["dtype"]
+        if not np.issubdtype(dtype, np.integer):
+            return batch.astype(dtype, copy=False)
+        scale, zero_point = self.input_detail["quantization"]
+        info = np.iinfo(dtype)
+        quantized = np.round(batch / scale + zero_point)
+        return np.clip(quantized, info.min, info.max).astype(dtype)
+
+    def _dequantize(self, output: np.ndarray) -> np.ndarray:
+        if not np.issubdtype(output.dtype, np.integer):
+            return output
+        scale, zero_point = self.output_detail["quantization"]
+        return ((output.astype(np.float32) - zero_point) * scale).astype(np.float32)
+
+
+def _recv_into(sock: socket.socket, view: memoryview):
+    """Fill ``view`` from the socket, straight into its memory."""
+    while view:
+        received = sock.recv_into(view)
+        if not received:
+            raise ConnectionError("Inference server closed the connection")
+        view = view[received:]
+
+
+class RemoteRuntime:
+    """
+    Run the model in a separate inference server (inference_server.py).
+
+    Batches go over a Unix socket: the images are sent from the batch's own
+    memory and the predictions received straight into a new array, so no
+    serialized copies are made on either side. The API process never loads
+    TensorFlow, and one server can batch requests from every worker.
+
+    Requests are sent one at a time over a single connection, which is
+    reopened if the server restarts.
+    """
+
+    name = "remote"
+
+    def __init__(self, socket_path: str, timeout: float = 30.0, connect_timeout: float = 60.0):
+        self.model_path = socket_path
+        self.timeout = timeout
+        self._sock: Optional[socket.socket] = None
+        self._header = bytearray(RESPONSE_HEADER.size)
+        self._lock = threading.Lock()
+        # The server only listens once its model is loaded, so wait for it
+        self._connect(wait=connect_timeout)
+        with self._lock:
+            info, version = self._exchange(np.empty((0, 0, 0, 0), dtype=np.float32))
+        self.num_classes = int(info.shape[1])
+        # Identifies the artifact the server runs, for cache keys
+        self.server_version = version
+
+    def _connect(self, wait: float = 0.0) -> socket.socket:
+        deadline = time.monotonic() + wait
+        while True:
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            sock.settimeout(self.timeout)
+            try:
+                sock.connect(self.model_path)
+            except (FileNotFoundError, ConnectionRefusedError) as e:
+                sock.close()
+                if time.monotonic() >= deadline:
+                    raise ConnectionError(
+                        f"No inference server at {self.model_path}. Start it with inference_server.py."
+                    ) from e
+                time.sleep(0.5)
+                continue
+            self._sock = sock
+            return sock
+
+    def _close(self):
+        if self._sock is not None:
+            self._sock.close()
+            self._sock = None
+
+    def _exchange(self, batch: np.ndarray) -> Tuple[np.ndarray, str]:
+        sock = self._sock or self._connect()
+        sock.sendall(REQUEST_HEADER.pack(INFERENCE_MAGIC, *batch.shape))
+        if batch.size:
+            sock.sendall(memoryview(batch).cast("B"))
+
+        _recv_into(sock, memoryview(self._header))
+        magic, status, rows, columns, text_length = RESPONSE_HEADER.unpack(self._header)
+        if magic != INFERENCE_MAGIC:
+            self._close()
+            raise ConnectionError("Unexpected reply from the inference server")
+        output = np.empty((rows, columns), dtype=np.float32)
+        if output.size:
+            _recv_into(sock, memoryview(output).cast("B"))
+        text = bytearray(text_length)
+        _recv_into(sock, memoryview(text))
+
+        if status != STATUS_OK:
+            raise RuntimeError(f"Inference server error: {text.decode()}")
+        return output, text.decode()
+
+    def predict(self, batch: np.ndarray) -> np.ndarray:
+        batch = np.ascontiguousarray(batch, dtype=np.float32)
+        with self._lock:
+            try:
+                return self._exchange(batch)[0]
+            except socket.timeout:
+                # A late reply would be read as the answer to the next request
+                self._close()
+                raise
+            except OSError:
+                # Most likely a connection left over from before a server
+                # restart; predictions are safe to repeat, so retry once
+                self._close()
+                try:
+                    return self._exchange(batch)[0]
+                except OSError:
+                    self._close()
+                    raise
+
+
+RUNTIMES = {
+    "keras": KerasRuntime,
+    "savedmodel": SavedModelRuntime,
+    "tflite": TFLiteRuntime,
+    "remote": RemoteRuntime,
+}
+
+
+def load_runtime(backend: str, model_path: Optional[str] = None, quantization: Optional[str] = None):
+    """
+    Load the model for the given serving backend.
+
+    Args:
+        backend: One of ``keras``, ``savedmodel``, ``tflite`` or ``remote``
+        model_path: Artifact to load; defaults to the standard location in
+            the models directory. For ``remote``, the inference server's
+            socket (default: INFERENCE_SOCKET environment variable).
+        quantization: For ``tflite``, load the ``dynamic`` or ``int8``
+            quantized variant instead of the float model
+
+    Returns:
+        A runtime exposing ``predict(batch) -> probabilities`` and
+        ``num_classes``
+    """
+    if backend not in RUNTIMES:
+        raise ValueError(f"Unknown model backend: {backend}. Expected one of {sorted(RUNTIMES)}")
+
+    if backend == "remote":
+        if quantization and quantization != "none":
+            raise ValueError("With the remote backend, quantization is chosen by the inference server")
+        return RemoteRuntime(
+            model_path or os.getenv("INFERENCE_SOCKET", INFERENCE_SOCKET),
+            timeout=float(os.getenv("INFERENCE_TIMEOUT", 30)),
+            connect_timeout=float(os.getenv("INFERENCE_CONNECT_TIMEOUT", 60)),
+        )
+
+    if quantization and quantization != "none":
+        if backend != "tflite":
+            raise ValueError("Quantized models are only available with the tflite backend")
+        if quantization not in QUANTIZED_PATHS:
+            raise ValueError(f"Unknown quantization: {quantization}. Expected one of {sorted(QUANTIZED_PATHS)}")
+        default_path = QUANTIZED_PATHS[quantization]
+    else:
+        default_path = MODEL_PATHS[backend]
+
+    model_path = model_path or os.path.join(MODELS_DIR, default_path)
+    if not os.path.exists(model_path):
+        if quantization and quantization != "none":
+            raise FileNotFoundError(
+                f"Model not found at {model_path}. Please run quantize_model.py first."
+            )
+        if backend == "keras":
+            raise FileNotFoundError(
+                "Model not found. Please run setup_model.py to create the model."
+            )
+        raise FileNotFoundError(
+            f"Model not found at {model_path}. Please run export_model.py --format {backend} first."
+        )
+
+    if backend == "tflite":
+        threads = int(os.getenv("MODEL_NUM_THREADS", 0)) or None
+        return TFLiteRuntime(model_path, num_threads=threads)
+    return RUNTIMES[backend](model_path)
@@ -0,0 +1,173 @@
+import argparse
+import json
+import os
+import sys
+import time
+
+import numpy as np
+import tensorflow as tf
+
+from export_model import export_tflite, load_keras_model
+from models.plant_disease_model import PlantDiseaseModel
+from models.runtimes import MODEL_PATHS, MODELS_DIR, QUANTIZED_PATHS, load_runtime
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png")
+
+
+def find_images(image_dir, limit):
+    """Collect up to ``limit`` image paths from ``image_dir`` and its subfolders."""
+    paths = []
+    for root, _, files in sorted(os.walk(image_dir)):
+        for name in sorted(files):
+            if name.lower().endswith(IMAGE_EXTENSIONS):
+                paths.append(os.path.join(root, name))
+                if len(paths) >= limit:
+                    return paths
+    return paths
+
+
+def load_images(paths):
+    """
+    Preprocess images into a (N, 224, 224, 3) float32 batch.
+
+    Images that can't be read are skipped with a warning; it is an error
+    only if none are left.
+    """
+    images = []
+    for path in paths:
+        try:
+            images.append(PlantDiseaseModel.prepare_image(path))
+        except Exception as e:
+            print(f"Skipping unreadable image {path}: {str(e)}", file=sys.stderr)
+    if not images:
+        raise SystemExit("None of the images could be read")
+    if len(images) < len(paths):
+        print(f"Skipped {len(paths) - len(images)} of {len(paths)} images", file=sys.stderr)
+    return np.concatenate(images)
+
+
+def dynamic_range(converter):
+    """Weights stored as int8, activations computed in float."""
+    converter.optimizations = [tf.lite.Optimize.DEFAULT]
+
+
+def full_integer(calibration):
+    """Weights and activations in int8, calibrated on ``calibration`` images."""
+    def configure(converter):
+        def representative_dataset():
+            for image in calibration:
+                yield [image[np.newaxis]]
+
+        converter.optimizations = [tf.lite.Optimize.DEFAULT]
+        converter.representative_dataset = representative_dataset
+        converter.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS_INT8]
+        converter.inference_input_type = tf.int8
+        converter.inference_output_type = tf.int8
+    return configure
+
+
+def artifact_size(path):
+    if os.path.isdir(path):
+        return sum(
+            os.path.getsize(os.path.join(root, name))
+            for root, _, files in os.walk(path) for name in files
+        )
+    return os.path.getsize(path)
+
+
+def measure(runtime, images, runs):
+    """Return (per-image latency in ms at batch size 1, predicted classes)."""
+    runtime.predict(images[:1])  # warm-up
+    timings = []
+    for i in range(runs):
+        image = images[i % len(images)][np.newaxis]
+        start = time.perf_counter()
+        runtime.predict(image)
+        timings.append(time.perf_counter() - start)
+    predictions = np.concatenate([
+        runtime.predict(images[i:i + 32]) for i in range(0, len(images), 32)
+    ])
+    return float(np.median(timings) * 1000), np.argmax(predictions, axis=1)
+
+
+def build_report(variants, images, runs):
+    """Compare each variant with the float Keras model."""
+    reference = None
+    report = []
+    for name, backend, quantization, path in variants:
+        runtime = load_runtime(backend, path, quantization)
+        latency_ms, classes = measure(runtime, images, runs)
+        if reference is None:
+            reference = classes
+        report.append({
+            "variant": name,
+            "path": path,
+            "size_mb": round(artifact_size(path) / 1e6, 2),
+            "latency_ms": round(latency_ms, 2),
+            "top1_agreement": round(float(np.mean(classes == reference)), 4),
+        })
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Quantize the plant disease model and compare the variants."
+    )
+    parser.add_argument("--calibration-dir", required=True,
+                        help="Directory of representative leaf images (searched recursively)")
+    parser.add_argument("--calibration-size", type=int, default=200,
+                        help="Number of images used to calibrate int8 activations")
+    parser.add_argument("--eval-dir",
+                        help="Images used for the report (defaults to the calibration images)")
+    parser.add_argument("--eval-size", type=int, default=500)
+    parser.add_argument("--runs", type=int, default=50, help="Timed single-image runs per variant")
+    parser.add_argument("--variants", nargs="+", choices=sorted(QUANTIZED_PATHS),
+                        default=sorted(QUANTIZED_PATHS))
+    parser.add_argument("--report", default=os.path.join(MODELS_DIR, "quantization_report.json"))
+    args = parser.parse_args()
+
+    calibration_paths = find_images(args.calibration_dir, args.calibration_size)
+    if not calibration_paths:
+        raise SystemExit(f"No images found in {args.calibration_dir}")
+    calibration = load_images(calibration_paths)
+    print(f"Using {len(calibration)} calibration images")
+
+    model = load_keras_model()
+    float_path = os.path.join(MODELS_DIR, MODEL_PATHS["tflite"])
+    if not os.path.exists(float_path):
+        print(f"Exporting float TFLite model to: {float_path}")
+        export_tflite(model, float_path)
+
+    for variant in args.variants:
+        path = os.path.join(MODELS_DIR, QUANTIZED_PATHS[variant])
+        print(f"Exporting {variant} quantized model to: {path}")
+        hook = dynamic_range if variant == "dynamic" else full_integer(calibration)
+        export_tflite(model, path, converter_hook=hook)
+
+    if args.eval_dir:
+        images = load_images(find_images(args.eval_dir, args.eval_size))
+    else:
+        images = calibration
+    print(f"Comparing variants on {len(images)} images...")
+
+    variants = [
+        ("keras", "keras", None, os.path.join(MODELS_DIR, MODEL_PATHS["keras"])),
+        ("tflite-float32", "tflite", None, float_path),
+    ] + [
+        (f"tflite-{variant}", "tflite", variant, os.path.join(MODELS_DIR, QUANTIZED_PATHS[variant]))
+        for variant in args.variants
+    ]
+    report = build_report(variants, images, args.runs)
+
+    print(f"\n{'variant':<16}{'size (MB)':>11}{'latency (ms)':>14}{'top-1 agreement':>17}")
+    for row in report:
+        print(f"{row['variant']:<16}{row['size_mb']:>11.2f}{row['latency_ms']:>14.2f}"
+              f"{row['top1_agreement']:>17.2%}")
+
+    with open(args.report, "w") as f:
+        json.dump({"images": len(images), "variants": report}, f, indent=4)
+    print(f"\nReport saved to: {args.report}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,241 @@
+import asyncio
+import logging
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from services.inference_pool import QueueFullError
+from services.metrics import BATCH_SIZE, STAGE_SECONDS
+
+logger = logging.getLogger(__name__)
+
+
+class BatchScheduler:
+    """
+    Collect concurrent inference requests into a single model batch.
+
+    Callers submit preprocessed arrays and await their own slice of the
+    predictions. A background task drains the queue, waiting at most
+    ``max_wait_ms`` for more work once the first item has arrived, and runs
+    ``predict_fn`` on the stacked batch in a dedicated thread so the event
+    loop stays responsive. When ``max_queue_size`` is set, submissions
+    beyond that many waiting requests fail fast with :class:`QueueFullError`.
+
+    Each batch is stacked into a buffer of ``max_batch_size`` rows that is
+    allocated once and reused, rather than a fresh array per batch; the
+    per-image arrays passed to submit() are still the caller's own.
+    """
+
+    def __init__(
+        self,
+        predict_fn: Callable[[np.ndarray], np.ndarray],
+        max_batch_size: int = 16,
+        max_wait_ms: float = 10.0,
+        max_queue_size: Optional[int] = None,
+    ):
+        if max_batch_size < 1:
+            raise ValueError("max_batch_size must be at least 1")
+        self.predict_fn = predict_fn
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self.max_queue_size = max_queue_size
+
+        self._batches = 0
+        self._batched_items = 0
+        self._wait_times = deque(maxlen=1000)
+        self._buffer: Optional[np.ndarray] = None
+        self._wait_histogram = STAGE_SECONDS.labels("batch_wait")
+        self._predict_histogram = STAGE_SECONDS.labels("predict")
+
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker: Optional[asyncio.Task] = None
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._stopping = False
+        # Requests taken off the queue for the batch being collected or run
+        self._current: List[Tuple[np.ndarray, asyncio.Future, float]] = []
+
+    @property
+    def running(self) -> bool:
+        return self._worker is not None and not self._worker.done()
+
+    async def start(self):
+        """Start the background batching task."""
+        if self.running:
+            return
+        self._queue = asyncio.Queue()
+        self._stopping = False
+        self._current = []
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="batch-predict")
+        self._worker = asyncio.create_task(self._run())
+        logger.info(
+            f"Batch scheduler started (max_batch_size={self.max_batch_size}, "
+            f"max_wait_ms={self.max_wait * 1000:.1f})"
+        )
+
+    async def stop(self, timeout: float = 30.0):
+        """
+        Stop accepting requests and let the queued ones finish.
+
+        Requests already queued or in the batch being run are still
+        answered, for up to ``timeout`` seconds; after that, the ones left
+        fail with RuntimeError so no caller is left waiting.
+        """
+        if self._worker is not None:
+            self._stopping = True
+            # Wakes the worker if it is waiting for work; nothing can be
+            # queued behind it
+            self._queue.put_nowait(None)
+            try:
+                await asyncio.wait_for(asyncio.shield(self._worker), timeout)
+            except asyncio.TimeoutError:
+                logger.warning(f"Batch scheduler still busy after {timeout:g}s, failing pending requests")
+                self._worker.cancel()
+                try:
+                    await self._worker
+                except asyncio.CancelledError:
+                    pass
+            self._worker = None
+
+        error = RuntimeError("Batch scheduler stopped")
+        for _, future, _ in self._current:
+            if not future.done():
+                future.set_exception(error)
+        self._current = []
+        if self._queue is not None:
+            while not self._queue.empty():
+                item = self._queue.get_nowait()
+                if item is not None and not item[1].done():
+                    item[1].set_exception(error)
+            self._queue = None
+
+        if self._executor is not None:
+            # Don't block the event loop on a prediction that timed out
+            self._executor.shutdown(wait=False)
+            self._executor = None
+
+    async def submit(self, batch: np.ndarray) -> np.ndarray:
+        """
+        Queue preprocessed images for inference.
+
+        Args:
+            batch: Array of shape (N, ...) holding one or more images
+
+        Returns:
+            Array of shape (N, num_classes) with the predictions for ``batch``
+
+        Raises:
+            QueueFullError: If the queue is full or the scheduler is stopping,
+                so callers answer "busy, retry" either way
+        """
+        if self._stopping:
+            raise QueueFullError("Batch scheduler is stopping")
+        if not self.running:
+            await self.start()
+        if self.max_queue_size is not None and self._queue.qsize() >= self.max_queue_size:
+            raise QueueFullError("Batch queue is full")
+
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((batch, future, time.monotonic()))
+        return await future
+
+    def stats(self) -> Dict:
+        waits = self._wait_times
+        return {
+            "queue_depth": self._queue.qsize() if self._queue is not None else 0,
+            "max_batch_size": self.max_batch_size,
+            "batches": self._batches,
+            "avg_batch_size": round(self._batched_items / self._batches, 2) if self._batches else 0.0,
+            "avg_wait_ms": round(sum(waits) / len(waits) * 1000, 3) if waits else 0.0,
+            "max_wait_ms": round(max(waits) * 1000, 3) if waits else 0.0,
+        }
+
+    def _stack(self, arrays: List[np.ndarray]) -> np.ndarray:
+        """Stack arrays into the preallocated batch buffer when they fit."""
+        count = sum(len(array) for array in arrays)
+        first = arrays[0]
+        if (
+            self._buffer is None
+            or self._buffer.shape[1:] != first.shape[1:]
+            or self._buffer.dtype != first.dtype
+        ):
+            self._buffer = np.empty((self.max_batch_size, *first.shape[1:]), dtype=first.dtype)
+        if count > len(self._buffer):
+            return np.concatenate(arrays, axis=0)
+        # Only one batch is in flight at a time, so the buffer can be reused
+        return np.concatenate(arrays, axis=0, out=self._buffer[:count])
+
+    async def _collect(self) -> List[Tuple[np.ndarray, asyncio.Future, float]]:
+        """
+        Wait for the first request, then gather more until full or timed out.
+
+        Requests are gathered into ``_current``, so stop() can fail them if
+        it has to give up waiting. Returns nothing once stop() was called
+        and the queue is empty.
+        """
+        first = await self._queue.get()
+        if first is None:
+            return []
+        items = self._current = [first]
+        size = len(first[0])
+        deadline = time.monotonic() + self.max_wait
+
+        while size < self.max_batch_size:
+            # Take whatever is already waiting before considering the deadline
+            if self._queue.empty():
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = await asyncio.wait_for(self._queue.get(), timeout=remaining)
+                except asyncio.TimeoutError:
+                    break
+            else:
+                item = self._queue.get_nowait()
+            if item is None:
+                # stop() was called and this was the last request
+                break
+            items.append(item)
+            size += len(item[0])
+
+        return items
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while not (self._stopping and self._queue.empty()):
+            items = await self._collect()
+
+            # Drop requests whose callers have gone away
+            items = [item for item in items if not item[1].done()]
+            if not items:
+                continue
+
+            now = time.monotonic()
+            for _, _, submitted in items:
+                self._wait_times.append(now - submitted)
+                self._wait_histogram.observe(now - submitted)
+            try:
+                batch = self._stack([batch for batch, _, _ in items])
+                started = time.perf_counter()
+                predictions = await loop.run_in_executor(self._executor, self.predict_fn, batch)
+                self._predict_histogram.observe(time.perf_counter() - started)
+                BATCH_SIZE.observe(len(batch))
+            except Exception as e:
+                logger.error(f"Batch inference failed: {str(e)}")
+                for _, future, _ in items:
+                    if not future.done():
+                        future.set_exception(e)
+                self._current = []
+                continue
+
+            self._batches += 1
+            self._batched_items += len(predictions)
+            offset = 0
+            for batch, future, _ in items:
+                count = len(batch)
+                if not future.done():
+                    future.set_result(predictions[offset:offset + count])
+                offset += count
+            self._current = []
@@ -0,0 +1,312 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Iterator, Optional, Tuple
+
+
+class CacheBackend:
+    """
+    Key-value store with LRU and TTL eviction.
+
+    Values must be JSON serializable so every backend can hold the same data.
+    Hit and miss counters are kept per backend instance.
+
+    Every write bumps the entry's version, so a read-modify-write can check
+    with set_if_version() that nobody wrote the entry in between.
+    """
+
+    def __init__(self, max_entries: int = 1024, ttl: Optional[float] = 3600):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+
+    def _expires_at(self) -> Optional[float]:
+        return time.time() + self.ttl if self.ttl else None
+
+    def get(self, key: str) -> Optional[Any]:
+        raise NotImplementedError
+
+    def set(self, key: str, value: Any):
+        raise NotImplementedError
+
+    def get_versioned(self, key: str) -> Tuple[Optional[Any], int]:
+        """Return the value and its version, or ``(None, 0)`` if there is none."""
+        raise NotImplementedError
+
+    def set_if_version(self, key: str, value: Any, version: int) -> bool:
+        """
+        Store ``value`` only if the entry is still at ``version``.
+
+        Args:
+            key: Entry to write
+            value: New value
+            version: Version returned by get_versioned(), 0 if the entry
+                should not exist yet
+
+        Returns:
+            Whether the value was stored; False if the entry was written
+            (or created) since it was read
+        """
+        raise NotImplementedError
+
+    def delete(self, key: str):
+        raise NotImplementedError
+
+    def items(self) -> Iterator[Tuple[str, Any]]:
+        """Iterate over live entries, least recently used first."""
+        raise NotImplementedError
+
+    def clear(self):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+    def __len__(self) -> int:
+        raise NotImplementedError
+
+    def stats(self) -> Dict:
+        lookups = self.hits + self.misses
+        return {
+            "backend": type(self).__name__,
+            "entries": len(self),
+            "max_entries": self.max_entries,
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+
+class MemoryCache(CacheBackend):
+    """In-process LRU cache with per-entry expiry."""
+
+    def __init__(self, max_entries: int = 1024, ttl: Optional[float] = 3600):
+        super().__init__(max_entries, ttl)
+        # Value, expiry time and version of each entry
+        self._entries: "OrderedDict[str, Tuple[Any, Optional[float], int]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _live(self, key: str) -> Optional[Tuple[Any, Optional[float], int]]:
+        """Return the entry for ``key`` unless it has expired. Call with the lock held."""
+        entry = self._entries.get(key)
+        if entry is not None and entry[1] is not None and entry[1] <= time.time():
+            del self._entries[key]
+            entry = None
+        return entry
+
+    def get(self, key: str) -> Optional[Any]:
+        return self.get_versioned(key)[0]
+
+    def get_versioned(self, key: str) -> Tuple[Optional[Any], int]:
+        with self._lock:
+            entry = self._live(key)
+            if entry is None:
+                self.misses += 1
+                return None, 0
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0], entry[2]
+
+    def set(self, key: str, value: Any):
+        with self._lock:
+            entry = self._live(key)
+            self._store(key, value, entry[2] + 1 if entry is not None else 1)
+
+    def set_if_version(self, key: str, value: Any, version: int) -> bool:
+        with self._lock:
+            entry = self._live(key)
+            if (entry[2] if entry is not None else 0) != version:
+                return False
+            self._store(key, value, version + 1)
+            return True
+
+    def _store(self, key: str, value: Any, version: int):
+        self._entries[key] = (value, self._expires_at(), version)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def delete(self, key: str):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def items(self) -> Iterator[Tuple[str, Any]]:
+        now = time.time()
+        with self._lock:
+            entries = list(self._entries.items())
+        for key, (value, expires_at, _) in entries:
+            if expires_at is None or expires_at > now:
+                yield key, value
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class SQLiteCache(CacheBackend):
+    """
+    File-backed LRU cache that survives restarts.
+
+    The number of rows is tracked in memory rather than counted on every
+    write. Once an insert takes the table over ``max_entries``, the least
+    recently used tenth is evicted, so the count is only checked every so
+    many inserts.
+    Other processes sharing the file count their own inserts the same way.
+    """
+
+    def __init__(self, path: str, max_entries: int = 10000, ttl: Optional[float] = 3600):
+        super().__init__(max_entries, ttl)
+        self.path = path
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS entries (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL,
+                expires_at REAL,
+                accessed_at REAL NOT NULL,
+                version INTEGER NOT NULL DEFAULT 1
+            )"""
+        )
+        # Files created before entries were versioned
+        columns = [row[1] for row in self._conn.execute("PRAGMA table_info(entries)")]
+        if "version" not in columns:
+            self._conn.execute("ALTER TABLE entries ADD COLUMN version INTEGER NOT NULL DEFAULT 1")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS entries_accessed ON entries (accessed_at)")
+        self._purge_expired()
+        # Room made when the table is full, so it isn't counted on every insert
+        self._eviction_batch = max(max_entries // 10, 1)
+        self._count = self._count_rows()
+
+    def _count_rows(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+
+    def _purge_expired(self):
+        with self._lock:
+            self._conn.execute(
+                "DELETE FROM entries WHERE expires_at IS NOT NULL AND expires_at <= ?",
+                (time.time(),)
+            )
+
+    def get(self, key: str) -> Optional[Any]:
+        return self.get_versioned(key)[0]
+
+    def get_versioned(self, key: str) -> Tuple[Optional[Any], int]:
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, expires_at, version FROM entries WHERE key = ?", (key,)
+            ).fetchone()
+            if row is not None and row[1] is not None and row[1] <= now:
+                self._conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+                row = None
+            if row is None:
+                self.misses += 1
+                return None, 0
+            self._conn.execute("UPDATE entries SET accessed_at = ? WHERE key = ?", (now, key))
+            self.hits += 1
+        return json.loads(row[0]), row[2]
+
+    def set(self, key: str, value: Any):
+        self._write(key, json.dumps(value))
+
+    def set_if_version(self, key: str, value: Any, version: int) -> bool:
+        return self._write(key, json.dumps(value), version)
+
+    def _write(self, key: str, data: str, expected_version: Optional[int] = None) -> bool:
+        """
+        Insert or update an entry, bumping its version.
+
+        The version is checked in the same transaction as the write, so
+        concurrent writers in other processes can't both succeed.
+        """
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute(
+                    "SELECT expires_at, version FROM entries WHERE key = ?", (key,)
+                ).fetchone()
+                # An expired entry reads as missing, so it counts as version 0
+                live = row is not None and (row[0] is None or row[0] > now)
+                version = row[1] if live else 0
+                if expected_version is not None and version != expected_version:
+                    self._conn.execute("ROLLBACK")
+                    return False
+                if row is None:
+                    self._conn.execute(
+                        "INSERT INTO entries (key, value, expires_at, accessed_at, version) VALUES (?, ?, ?, ?, ?)",
+                        (key, data, self._expires_at(), now, version + 1)
+                    )
+                    self._count += 1
+                    if self._count > self.max_entries:
+                        self._evict()
+                else:
+                    self._conn.execute(
+                        "UPDATE entries SET value = ?, expires_at = ?, accessed_at = ?, version = ? WHERE key = ?",
+                        (data, self._expires_at(), now, version + 1, key)
+                    )
+                self._conn.execute("COMMIT")
+                return True
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def _evict(self):
+        """
+        Evict least recently used rows down to ``max_entries - eviction batch``.
+
+        Called within the insert's transaction. Leaving that much room means
+        the next check is at least a batch of inserts away.
+        """
+        count = self._conn.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+        overflow = count - (self.max_entries - self._eviction_batch)
+        if overflow > 0:
+            self._conn.execute(
+                "DELETE FROM entries WHERE key IN "
+                "(SELECT key FROM entries ORDER BY accessed_at LIMIT ?)",
+                (overflow,)
+            )
+            count -= overflow
+        self._count = count
+
+    def delete(self, key: str):
+        with self._lock:
+            deleted = self._conn.execute("DELETE FROM entries WHERE key = ?", (key,)).rowcount
+            self._count -= deleted
+
+    def items(self) -> Iterator[Tuple[str, Any]]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT key, value FROM entries "
+                "WHERE expires_at IS NULL OR expires_at > ? ORDER BY accessed_at",
+                (time.time(),)
+            ).fetchall()
+        for key, value in rows:
+            yield key, json.loads(value)
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM entries")
+            self._count = 0
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def __len__(self) -> int:
+        return self._count_rows()
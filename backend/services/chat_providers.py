@@ -0,0 +1,330 @@
+import asyncio
+import logging
+import os
+import threading
+import zlib
+from typing import AsyncIterator, Dict, List, Optional
+
+import anyio
+import httpx
+
+from services.metrics import CHAT_TOKENS
+from services.resilience import is_transient
+
+logger = logging.getLogger(__name__)
+
+Messages = List[Dict[str, str]]
+
+
+class ChatProvider:
+    """
+    A language model backend for the chat service.
+
+    Providers only generate text; prompts, caching and concurrency limits
+    are handled by ChatService, the same way whichever provider is used.
+    """
+
+    name = ""
+
+    def __init__(self, model: str):
+        self.model = model
+
+    async def complete(self, messages: Messages, temperature: float, max_tokens: int) -> str:
+        """Return the whole response to ``messages``."""
+        raise NotImplementedError
+
+    def stream(self, messages: Messages, temperature: float, max_tokens: int) -> AsyncIterator[str]:
+        """
+        Yield the response to ``messages`` in chunks as it is generated.
+
+        Closing the generator early stops the generation.
+        """
+        raise NotImplementedError
+
+    async def aclose(self):
+        """Release connections or memory held by the provider."""
+
+    def is_transient(self, error: BaseException) -> bool:
+        """Whether a failed call is worth retrying (see services/resilience.py)."""
+        return is_transient(error)
+
+    def _record_usage(self, prompt_tokens: int, completion_tokens: int):
+        CHAT_TOKENS.labels(self.name, "prompt").inc(prompt_tokens)
+        CHAT_TOKENS.labels(self.name, "completion").inc(completion_tokens)
+
+
+class OpenAIProvider(ChatProvider):
+    """
+    The OpenAI chat completions API.
+
+    Also works with other servers implementing that API (e.g. a local
+    llama.cpp or Ollama server) by setting OPENAI_BASE_URL.
+    """
+
+    name = "openai"
+
+    def __init__(self, model: str):
+        from openai import APIConnectionError, AsyncOpenAI
+
+        api_key = os.getenv("OPENAI_API_KEY")
+        if not api_key:
+            raise ValueError("OPENAI_API_KEY environment variable is not set")
+        super().__init__(model)
+
+        # Share one pooled, keep-alive HTTP client across all chat requests
+        limits = httpx.Limits(
+            max_connections=int(os.getenv("CHAT_MAX_CONNECTIONS", 100)),
+            max_keepalive_connections=int(os.getenv("CHAT_MAX_KEEPALIVE", 20)),
+            keepalive_expiry=float(os.getenv("CHAT_KEEPALIVE_EXPIRY", 30))
+        )
+        self.http_client = httpx.AsyncClient(
+            timeout=float(os.getenv("CHAT_TIMEOUT", 30)),
+            limits=limits
+        )
+        # Retries are done by ChatService, with the rate limiter and circuit
+        # breaker in the loop, so the client's own are turned off
+        self.client = AsyncOpenAI(api_key=api_key, http_client=self.http_client, max_retries=0)
+        self._connection_errors = (APIConnectionError,)
+
+    async def aclose(self):
+        """Close the pooled HTTP connections to the OpenAI API."""
+        await self.client.close()
+
+    def is_transient(self, error: BaseException) -> bool:
+        # Includes timeouts, which the client raises as APITimeoutError
+        return isinstance(error, self._connection_errors) or super().is_transient(error)
+
+    def _usage(self, usage):
+        if usage is not None:
+            self._record_usage(usage.prompt_tokens, usage.completion_tokens)
+
+    async def complete(self, messages: Messages, temperature: float, max_tokens: int) -> str:
+        response = await self.client.chat.completions.create(
+            model=self.model,
+            messages=messages,
+            temperature=temperature,
+            max_tokens=max_tokens
+        )
+        self._usage(response.usage)
+        if not response.choices or not response.choices[0].message:
+            raise Exception("No response received from OpenAI")
+        return response.choices[0].message.content
+
+    async def stream(self, messages: Messages, temperature: float, max_tokens: int) -> AsyncIterator[str]:
+        stream = await self.client.chat.completions.create(
+            model=self.model,
+            messages=messages,
+            temperature=temperature,
+            max_tokens=max_tokens,
+            stream=True,
+            # Ask for a final chunk with the token usage of the whole stream
+            extra_body={"stream_options": {"include_usage": True}}
+        )
+        try:
+            async for chunk in stream:
+                self._usage(getattr(chunk, "usage", None))
+                if chunk.choices and chunk.choices[0].delta.content:
+                    yield chunk.choices[0].delta.content
+        finally:
+            # Closing the HTTP response makes OpenAI stop generating tokens.
+            # Shield it so it still runs when the request is cancelled.
+            with anyio.CancelScope(shield=True):
+                await stream.response.aclose()
+
+
+class StubProvider(ChatProvider):
+    """
+    A deterministic local stand-in for a language model.
+
+    The same question always gets the same answer, built from canned plant
+    care advice, after a configurable delay. Useful to develop and load
+    test the chat path offline, without API keys or cost.
+
+    Args:
+        latency: Seconds before the first word
+        token_delay: Seconds between words
+        tokens: Words per response
+    """
+
+    name = "stub"
+
+    SENTENCES = (
+        "Remove and destroy the affected leaves to slow the spread.",
+        "Water at the base of the plant in the morning so the foliage dries quickly.",
+        "Improve air circulation by pruning crowded growth.",
+        "Apply a copper-based fungicide if the symptoms keep spreading.",
+        "Rotate crops each season and avoid planting in the same spot.",
+        "Mulch around the plant to stop soil splashing onto the leaves.",
+        "Check the plant every few days and note any new spots or wilting.",
+    )
+
+    def __init__(self, model: str = "stub", latency: float = 0.0, token_delay: float = 0.0, tokens: int = 40):
+        super().__init__(model)
+        self.latency = latency
+        self.token_delay = token_delay
+        self.tokens = tokens
+
+    def _words(self, messages: Messages) -> List[str]:
+        # Seeded by the question, so answers are repeatable
+        seed = zlib.crc32(messages[-1]["content"].encode()) if messages else 0
+        words = []
+        index = seed
+        while len(words) < self.tokens:
+            words.extend(self.SENTENCES[index % len(self.SENTENCES)].split())
+            index += 1
+        return words[:self.tokens]
+
+    def _prompt_tokens(self, messages: Messages) -> int:
+        return sum(len(message["content"].split()) for message in messages)
+
+    async def complete(self, messages: Messages, temperature: float, max_tokens: int) -> str:
+        words = self._words(messages)[:max_tokens]
+        await asyncio.sleep(self.latency + self.token_delay * len(words))
+        self._record_usage(self._prompt_tokens(messages), len(words))
+        return " ".join(words)
+
+    async def stream(self, messages: Messages, temperature: float, max_tokens: int) -> AsyncIterator[str]:
+        words = self._words(messages)[:max_tokens]
+        await asyncio.sleep(self.latency)
+        for i, word in enumerate(words):
+            if i and self.token_delay:
+                await asyncio.sleep(self.token_delay)
+            yield word if i == 0 else " " + word
+        self._record_usage(self._prompt_tokens(messages), len(words))
+
+
+class _StopOnEvent:
+    """Generation stopping criterion that ends generation once ``event`` is set."""
+
+    def __init__(self, event: threading.Event):
+        self.event = event
+
+    def __call__(self, input_ids, scores, **kwargs) -> bool:
+        return self.event.is_set()
+
+
+class LocalProvider(ChatProvider):
+    """
+    A small instruction-tuned model run in-process with Hugging Face
+    ``transformers`` (an optional dependency, with ``torch``).
+
+    The model is downloaded and loaded on the first request, not at
+    startup, and generates one response at a time in a worker thread.
+    Every API worker loads its own copy.
+    """
+
+    name = "local"
+
+    def __init__(self, model: str):
+        try:
+            import transformers
+        except ImportError:
+            raise ImportError(
+                "The local chat provider requires transformers: pip install transformers torch"
+            ) from None
+        super().__init__(model)
+        self._transformers = transformers
+        self.tokenizer = None
+        self.lm = None
+        self._load_lock = threading.Lock()
+        # generate() is not safe to run concurrently on one model
+        self._generate_lock = threading.Lock()
+        self.timeout = float(os.getenv("CHAT_TIMEOUT", 30))
+
+    def _load(self):
+        with self._load_lock:
+            if self.lm is None:
+                logger.info(f"Loading local chat model {self.model}")
+                self.tokenizer = self._transformers.AutoTokenizer.from_pretrained(self.model)
+                self.lm = self._transformers.AutoModelForCausalLM.from_pretrained(self.model)
+                self.lm.eval()
+
+    def _generate(self, messages: Messages, temperature: float, max_tokens: int,
+                  streamer=None, stop: Optional[threading.Event] = None) -> str:
+        try:
+            with self._generate_lock:
+                inputs = self.tokenizer.apply_chat_template(
+                    messages, add_generation_prompt=True, return_tensors="pt", return_dict=True
+                )
+                options = {"do_sample": True, "temperature": temperature} if temperature > 0 else {"do_sample": False}
+                output = self.lm.generate(
+                    **inputs,
+                    max_new_tokens=max_tokens,
+                    streamer=streamer,
+                    stopping_criteria=[_StopOnEvent(stop)] if stop is not None else None,
+                    pad_token_id=self.tokenizer.eos_token_id,
+                    **options
+                )
+        except Exception:
+            if streamer is not None:
+                # Unblock the reader waiting for the next chunk
+                streamer.end()
+            raise
+        prompt_length = inputs["input_ids"].shape[-1]
+        completion = output[0, prompt_length:]
+        self._record_usage(int(prompt_length), int(completion.shape[-1]))
+        return self.tokenizer.decode(completion, skip_special_tokens=True)
+
+    async def complete(self, messages: Messages, temperature: float, max_tokens: int) -> str:
+        await asyncio.to_thread(self._load)
+        return await asyncio.to_thread(self._generate, messages, temperature, max_tokens)
+
+    async def stream(self, messages: Messages, temperature: float, max_tokens: int) -> AsyncIterator[str]:
+        await asyncio.to_thread(self._load)
+        streamer = self._transformers.TextIteratorStreamer(
+            self.tokenizer, skip_prompt=True, skip_special_tokens=True, timeout=self.timeout
+        )
+        stop = threading.Event()
+        generation = asyncio.ensure_future(
+            asyncio.to_thread(self._generate, messages, temperature, max_tokens, streamer, stop)
+        )
+        try:
+            while True:
+                text = await asyncio.to_thread(next, streamer, None)
+                if text is None:
+                    break
+                if text:
+                    yield text
+            await generation
+        finally:
+            # Stop generating if the client went away mid-stream
+            stop.set()
+
+
+PROVIDERS = {
+    "openai": OpenAIProvider,
+    "stub": StubProvider,
+    "local": LocalProvider,
+}
+
+DEFAULT_MODELS = {
+    "openai": "gpt-3.5-turbo",
+    "stub": "stub",
+    "local": "Qwen/Qwen2.5-0.5B-Instruct",
+}
+
+
+def create_chat_provider(name: Optional[str] = None) -> ChatProvider:
+    """
+    Build the chat provider selected by configuration.
+
+    Args:
+        name: ``openai``, ``stub`` or ``local``; defaults to the
+            CHAT_PROVIDER environment variable, or ``openai``
+
+    The model comes from CHAT_MODEL, defaulting to one suited to the
+    provider.
+    """
+    name = (name or os.getenv("CHAT_PROVIDER", "openai")).lower()
+    if name not in PROVIDERS:
+        raise ValueError(f"Unknown chat provider: {name}. Expected one of {sorted(PROVIDERS)}")
+    model = os.getenv("CHAT_MODEL") or DEFAULT_MODELS[name]
+
+    if name == "stub":
+        return StubProvider(
+            model,
+            latency=float(os.getenv("CHAT_STUB_LATENCY_MS", 0)) / 1000,
+            token_delay=float(os.getenv("CHAT_STUB_TOKEN_DELAY_MS", 0)) / 1000,
+            tokens=int(os.getenv("CHAT_STUB_TOKENS", 40)),
+        )
+    return PROVIDERS[name](model)
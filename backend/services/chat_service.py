@@ -1,29 +1,56 @@
 import os
-from openai import OpenAI
+import asyncio
+import time
 from dotenv import load_dotenv
 import logging
-import httpx
+import anyio
+from typing import AsyncIterator, Dict, List, Optional
+from services.chat_providers import ChatProvider, create_chat_provider
+from services.chat_sessions import ChatSession, create_session_store, estimate_tokens
+from services.metrics import STAGE_SECONDS
+from services.resilience import CircuitOpenError, RateLimitedError, create_upstream_guard
+from services.response_cache import create_response_cache, normalize_message
+from services.single_flight import SingleFlight
 
-# Configure logging
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 load_dotenv()
 
+# Times an exchange is added to a session that another worker keeps saving first
+SESSION_SAVE_ATTEMPTS = 3
+
 class ChatService:
-    def __init__(self):
-        """Initialize the chat service with OpenAI API key."""
-        api_key = os.getenv("OPENAI_API_KEY")
-        if not api_key:
-            raise ValueError("OPENAI_API_KEY environment variable is not set")
+    def __init__(self, provider: Optional[ChatProvider] = None):
+        """
+        Initialize the chat service.
         
+        Args:
+            provider: Language model backend; defaults to the one selected
+                by the CHAT_PROVIDER environment variable (see
+                services/chat_providers.py)
+        """
         try:
-            # Initialize OpenAI client with custom HTTP client
-            http_client = httpx.Client(timeout=30.0)
-            self.client = OpenAI(
-                api_key=api_key,
-                http_client=http_client
-            )
+            self.provider = provider or create_chat_provider()
+            self.model = self.provider.model
+            
+            # Cap the number of requests in flight to the provider
+            self.max_concurrency = int(os.getenv("CHAT_MAX_CONCURRENCY", 20))
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+            
+            # Rate limits, retries and a circuit breaker around provider calls
+            self.guard = create_upstream_guard(self.provider.is_transient)
+            
+            self.temperature = 0.7
+            self.max_tokens = 500
+            
+            # Reuse answers to repeated questions instead of paying for a round trip
+            self.cache = create_response_cache()
+            
+            # Identical questions asked at the same time share one provider call
+            self.single_flight = SingleFlight("chat")
+            
+            # Conversation history, trimmed to a token budget
+            self.sessions = create_session_store()
             
             # Set up the system message for plant care advice
             self.system_message = {
@@ -34,35 +61,268 @@ class ChatService:
                 Consider environmental factors and provide practical recommendations."""
             }
             
-            logger.info("OpenAI client initialized successfully")
+            logger.info(f"Chat service initialized with the {self.provider.name} provider (model: {self.model})")
         except Exception as e:
-            logger.error(f"Error initializing OpenAI client: {str(e)}")
+            logger.error(f"Error initializing chat service: {str(e)}")
             raise
 
-    async def get_response(self, message: str, language: str = "en") -> str:
-        try:
-            logger.info(f"Sending message to OpenAI: {message[:50]}...")
-            response = self.client.chat.completions.create(
-                model="gpt-3.5-turbo",
-                messages=[
-                    self.system_message,
-                    {"role": "user", "content": message}
-                ],
-                temperature=0.7,
-                max_tokens=500
-            )
-            
-            if not response.choices or not response.choices[0].message:
-                raise Exception("No response received from OpenAI")
+    async def aclose(self):
+        """Release the provider's connections and close the cache and session store."""
+        await self.provider.aclose()
+        if self.cache is not None:
+            self.cache.close()
+        if self.sessions is not None:
+            self.sessions.close()
+        logger.info("Chat service closed")
+
+    def _build_messages(self, message: str, session: Optional[ChatSession] = None) -> List[Dict]:
+        history = session.messages() if session is not None else []
+        return [
+            self.system_message,
+            *history,
+            {"role": "user", "content": message}
+        ]
+
+    def _estimate_tokens(self, messages: List[Dict]) -> int:
+        """
+        Tokens a request counts against the tokens-per-minute limit.
+        
+        Like OpenAI's own accounting, this is the prompt (roughly four
+        characters per token) plus the most the completion may use.
+        """
+        return sum(estimate_tokens(message["content"]) for message in messages) + self.max_tokens
+
+    def error_message(self, error: Exception) -> str:
+        """Translate an upstream error into a message suitable for the user."""
+        logger.error(f"Error in chat service: {str(error)}")
+        
+        if getattr(error, "code", None) == "insufficient_quota":
+            return "I apologize, but I'm currently unable to process your request due to service limitations. Please try again later or contact the system administrator."
+        elif isinstance(error, RateLimitedError) or getattr(error, "status_code", None) == 429:
+            return "I'm receiving too many requests at the moment. Please wait a few seconds and try again."
+        elif isinstance(error, CircuitOpenError):
+            return "The assistant is temporarily unavailable. Please try again in a minute."
+        else:
+            return "I'm sorry, but I encountered an error while processing your request. Please try again later."
+
+    def _cached(self, message: str, language: str):
+        if self.cache is None:
+            return None
+        return self.cache.get(message, language, self.model, self.temperature)
+
+    def _store(self, message: str, language: str, response: str):
+        if self.cache is not None and response:
+            self.cache.set(message, language, self.model, self.temperature, response)
+
+    async def get_response(self, message: str, language: str = "en", session_id: Optional[str] = None) -> str:
+        """
+        Answer a message.
+        
+        Args:
+            message: The user's message
+            language: Language of the conversation
+            session_id: Conversation the message belongs to; its earlier
+                turns are sent along and this exchange is added to them
                 
-            return response.choices[0].message.content
+        Returns:
+            The response, or a message explaining why there is none
+        """
+        try:
+            if session_id is None or self.sessions is None:
+                return await self._answer(message, language)
+            async with self.sessions.lock(session_id):
+                session = await self.sessions.load(session_id)
+                content = await self._answer(message, language, session)
+                await self._remember(session, message, content)
+                return content
         except Exception as e:
-            error_message = str(e)
-            logger.error(f"Error in chat service: {error_message}")
+            return self.error_message(e)
+
+    async def _answer(self, message: str, language: str, session: Optional[ChatSession] = None) -> str:
+        # Earlier turns change the answer, so only the first message of a
+        # conversation can come from the cache or be shared with others
+        stateless = session is None or session.is_empty
+        if stateless:
+            cached = self._cached(message, language)
+            if cached is not None:
+                logger.info(f"Cache hit for message: {message[:50]}...")
+                return cached
+        
+        messages = self._build_messages(message, session)
+        
+        async def complete() -> str:
+            async with self._semaphore:
+                started = time.perf_counter()
+                content = await self.provider.complete(
+                    messages,
+                    temperature=self.temperature,
+                    max_tokens=self.max_tokens
+                )
+                STAGE_SECONDS.labels("chat_request").observe(time.perf_counter() - started)
+                return content
+        
+        async def fetch() -> str:
+            logger.info(f"Sending message to the {self.provider.name} provider: {message[:50]}...")
+            content = await self.guard.call(complete, tokens=self._estimate_tokens(messages))
+            if stateless:
+                self._store(message, language, content)
+            return content
+        
+        if not stateless:
+            return await fetch()
+        return await self.single_flight.do((normalize_message(message), language), fetch)
+
+    async def _remember(self, session: ChatSession, message: str, response: str):
+        """
+        Add an exchange to the session, trim its history and save it.
+        
+        If another worker saved the session in the meantime, the exchange is
+        added to its latest version instead, so neither worker's turns are lost.
+        """
+        for attempt in range(SESSION_SAVE_ATTEMPTS):
+            if attempt:
+                session = await self.sessions.load(session.id)
+            session.add_exchange(message, response)
+            budget = self.sessions.max_history_tokens
+            if not self.sessions.summarize:
+                session.trim(budget)
+            elif session.history_tokens > budget:
+                # Trim well below the budget, so the history is summarized every
+                # few turns rather than on every turn once it is full
+                dropped = session.trim(budget // 2)
+                if dropped:
+                    session.summary = await self._summarize(session.summary, dropped)
+            if await self.sessions.save(session):
+                return
+            logger.info(f"Session {session.id} was saved by another worker, adding the exchange again")
+        logger.warning(f"Could not save session {session.id} after {SESSION_SAVE_ATTEMPTS} attempts, "
+                       f"dropping the exchange")
+
+    async def _summarize(self, summary: str, turns: List[Dict]) -> str:
+        """
+        Fold trimmed turns into the conversation summary.
+        
+        If the provider fails, the previous summary is kept and the turns
+        are dropped.
+        """
+        transcript = "\n".join(f"{turn['role'].capitalize()}: {turn['content']}" for turn in turns)
+        if summary:
+            transcript = f"Summary so far: {summary}\n\n{transcript}"
+        messages = [
+            {
+                "role": "system",
+                "content": "Summarize this conversation between a user and a plant care assistant in a few "
+                           "sentences. Keep the plants, symptoms, diagnoses and advice that later questions "
+                           "may refer to."
+            },
+            {"role": "user", "content": transcript}
+        ]
+        
+        async def complete() -> str:
+            async with self._semaphore:
+                return await self.provider.complete(
+                    messages,
+                    temperature=0,
+                    max_tokens=self.sessions.summary_max_tokens
+                )
+        
+        tokens = sum(estimate_tokens(message["content"]) for message in messages) + self.sessions.summary_max_tokens
+        started = time.perf_counter()
+        try:
+            updated = await self.guard.call(complete, tokens=tokens)
+        except Exception as e:
+            logger.warning(f"Could not summarize the conversation, dropping {len(turns)} old turns: {str(e)}")
+            return summary
+        STAGE_SECONDS.labels("chat_summary").observe(time.perf_counter() - started)
+        return updated.strip()
+
+    async def stream_response(self, message: str, language: str = "en",
+                              session_id: Optional[str] = None) -> AsyncIterator[str]:
+        """
+        Stream the response from the provider as it is generated.
+        
+        Args:
+            message: The user's message
+            language: Language of the conversation
+            session_id: Conversation the message belongs to, as in get_response
+            
+        Yields:
+            Chunks of response text, in order
             
-            if "insufficient_quota" in error_message:
-                return "I apologize, but I'm currently unable to process your request due to service limitations. Please try again later or contact the system administrator."
-            elif "rate_limit_exceeded" in error_message:
-                return "I'm receiving too many requests at the moment. Please wait a few seconds and try again."
-            else:
-                return "I'm sorry, but I encountered an error while processing your request. Please try again later." 
\ No newline at end of file
+        Closing the generator early (e.g. when the client disconnects)
+        closes the provider's stream, so it stops generating tokens. The
+        exchange is then not added to the session.
+        """
+        if session_id is None or self.sessions is None:
+            stream = self._stream(message, language)
+            try:
+                async for chunk in stream:
+                    yield chunk
+            finally:
+                with anyio.CancelScope(shield=True):
+                    await stream.aclose()
+            return
+        
+        async with self.sessions.lock(session_id):
+            session = await self.sessions.load(session_id)
+            chunks = []
+            stream = self._stream(message, language, session)
+            try:
+                async for chunk in stream:
+                    chunks.append(chunk)
+                    yield chunk
+            finally:
+                with anyio.CancelScope(shield=True):
+                    await stream.aclose()
+            # Only reached when the stream completed without being cancelled
+            await self._remember(session, message, "".join(chunks))
+
+    async def _stream(self, message: str, language: str, session: Optional[ChatSession] = None) -> AsyncIterator[str]:
+        stateless = session is None or session.is_empty
+        if stateless:
+            cached = self._cached(message, language)
+            if cached is not None:
+                logger.info(f"Cache hit for message: {message[:50]}...")
+                yield cached
+                return
+        
+        chunks = []
+        logger.info(f"Streaming message from the {self.provider.name} provider: {message[:50]}...")
+        messages = self._build_messages(message, session)
+        
+        async def open_stream():
+            # Opening the stream and reading its first chunk is what gets
+            # retried; a stream that fails midway can't be resumed
+            await self._semaphore.acquire()
+            stream = self.provider.stream(messages, temperature=self.temperature, max_tokens=self.max_tokens)
+            try:
+                first = await stream.__anext__()
+            except StopAsyncIteration:
+                first = None
+            except BaseException:
+                with anyio.CancelScope(shield=True):
+                    await stream.aclose()
+                self._semaphore.release()
+                raise
+            return stream, first
+        
+        started = time.perf_counter()
+        stream, first = await self.guard.call(open_stream, tokens=self._estimate_tokens(messages))
+        try:
+            if first is not None:
+                STAGE_SECONDS.labels("chat_first_token").observe(time.perf_counter() - started)
+                chunks.append(first)
+                yield first
+                async for chunk in stream:
+                    chunks.append(chunk)
+                    yield chunk
+            STAGE_SECONDS.labels("chat_stream").observe(time.perf_counter() - started)
+        finally:
+            # Shield the close so it still runs when the request is cancelled
+            with anyio.CancelScope(shield=True):
+                await stream.aclose()
+            self._semaphore.release()
+        
+        # Only reached when the stream completed without being cancelled
+        if stateless:
+            self._store(message, language, "".join(chunks))
@@ -0,0 +1,184 @@
+import asyncio
+import logging
+import os
+import secrets
+import weakref
+from typing import Dict, List, Optional
+
+from services.cache import CacheBackend, MemoryCache, SQLiteCache
+
+logger = logging.getLogger(__name__)
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count of ``text``: about four characters per token for English."""
+    return len(text) // 4 + 1
+
+
+class ChatSession:
+    """
+    The history of one conversation: its most recent turns, verbatim, and
+    optionally a summary of the turns trimmed before them.
+
+    Turns are stored with their estimated token counts so trimming doesn't
+    have to count them again. ``version`` is the stored version the session
+    was loaded at, 0 for a new one.
+    """
+
+    def __init__(self, session_id: str, turns: Optional[List[Dict]] = None, summary: str = "",
+                 version: int = 0):
+        self.id = session_id
+        self.turns = turns or []
+        self.summary = summary
+        self.version = version
+
+    @property
+    def is_empty(self) -> bool:
+        return not self.turns and not self.summary
+
+    @property
+    def history_tokens(self) -> int:
+        return sum(turn["tokens"] for turn in self.turns)
+
+    def add_exchange(self, message: str, response: str):
+        self.turns.append({"role": "user", "content": message, "tokens": estimate_tokens(message)})
+        self.turns.append({"role": "assistant", "content": response, "tokens": estimate_tokens(response)})
+
+    def trim(self, max_tokens: int) -> List[Dict]:
+        """
+        Drop the oldest exchanges until the turns fit in ``max_tokens``.
+
+        The latest exchange is always kept, so a follow-up question still
+        has its context even when that exchange alone is over the budget.
+
+        Returns:
+            The dropped turns, oldest first
+        """
+        dropped = []
+        tokens = self.history_tokens
+        while tokens > max_tokens and len(self.turns) > 2:
+            exchange, self.turns = self.turns[:2], self.turns[2:]
+            tokens -= sum(turn["tokens"] for turn in exchange)
+            dropped.extend(exchange)
+        return dropped
+
+    def messages(self) -> List[Dict]:
+        """The history as chat messages, to go between the system prompt and the new message."""
+        messages = []
+        if self.summary:
+            messages.append({"role": "system", "content": f"Summary of the earlier conversation: {self.summary}"})
+        messages.extend({"role": turn["role"], "content": turn["content"]} for turn in self.turns)
+        return messages
+
+    def to_dict(self) -> Dict:
+        return {"turns": self.turns, "summary": self.summary}
+
+    @classmethod
+    def from_dict(cls, session_id: str, data: Dict, version: int = 0) -> "ChatSession":
+        return cls(session_id, turns=list(data["turns"]), summary=data["summary"], version=version)
+
+
+class SessionStore:
+    """
+    Chat sessions kept in a cache backend, keyed by session ID.
+
+    Sessions idle for longer than the backend's TTL expire, and the least
+    recently used ones are evicted once there are ``max_entries`` of them.
+    Since each session's history is trimmed to ``max_history_tokens``, the
+    memory used by the store stays bounded.
+
+    The per-session lock only serializes requests within one process.
+    Across gunicorn workers, save() is a compare-and-set on the version the
+    session was loaded at, so a worker that lost the race finds out and can
+    reload instead of overwriting the other worker's turns.
+
+    Args:
+        backend: Where the sessions are stored
+        max_history_tokens: Token budget for the turns kept verbatim
+        summarize: Fold trimmed turns into a running summary instead of
+            dropping them
+        summary_max_tokens: Longest summary the model may write
+    """
+
+    def __init__(self, backend: CacheBackend, max_history_tokens: int = 1500, summarize: bool = False,
+                 summary_max_tokens: int = 200):
+        self.backend = backend
+        self.max_history_tokens = max_history_tokens
+        self.summarize = summarize
+        self.summary_max_tokens = summary_max_tokens
+        # Requests for a session are handled one at a time, so every message
+        # sees the previous answer; locks go away with their last user
+        self._locks: "weakref.WeakValueDictionary[str, asyncio.Lock]" = weakref.WeakValueDictionary()
+
+    @staticmethod
+    def new_id() -> str:
+        return secrets.token_urlsafe(16)
+
+    def lock(self, session_id: str) -> asyncio.Lock:
+        lock = self._locks.get(session_id)
+        if lock is None:
+            lock = asyncio.Lock()
+            self._locks[session_id] = lock
+        return lock
+
+    async def load(self, session_id: str) -> ChatSession:
+        """Return the session, or a new empty one if it is unknown or expired."""
+        data, version = await asyncio.to_thread(self.backend.get_versioned, session_id)
+        if data is None:
+            return ChatSession(session_id)
+        return ChatSession.from_dict(session_id, data, version)
+
+    async def save(self, session: ChatSession) -> bool:
+        """
+        Store the session unless it was saved elsewhere since it was loaded.
+
+        Returns:
+            Whether it was stored; on False, reload the session and apply
+            the change again
+        """
+        saved = await asyncio.to_thread(self.backend.set_if_version, session.id, session.to_dict(), session.version)
+        if saved:
+            session.version += 1
+        return saved
+
+    async def delete(self, session_id: str):
+        await asyncio.to_thread(self.backend.delete, session_id)
+
+    def close(self):
+        self.backend.close()
+
+    def stats(self) -> Dict:
+        return {
+            **self.backend.stats(),
+            "max_history_tokens": self.max_history_tokens,
+            "summarize": self.summarize,
+        }
+
+
+def create_session_store() -> Optional[SessionStore]:
+    """Build the chat session store from environment variables."""
+    # SQLite by default, so every gunicorn worker sees the same sessions
+    kind = os.getenv("CHAT_SESSION_BACKEND", "file").lower()
+    if kind in ("", "none", "off"):
+        return None
+
+    max_entries = int(os.getenv("CHAT_SESSION_MAX_ENTRIES", 10000))
+    ttl = float(os.getenv("CHAT_SESSION_TTL", 3600)) or None
+    if kind == "memory":
+        backend = MemoryCache(max_entries=max_entries, ttl=ttl)
+    elif kind == "file":
+        path = os.getenv("CHAT_SESSION_PATH", "chat_sessions.sqlite3")
+        backend = SQLiteCache(path, max_entries=max_entries, ttl=ttl)
+    else:
+        raise ValueError(f"Unknown CHAT_SESSION_BACKEND: {kind}")
+
+    max_history_tokens = int(os.getenv("CHAT_HISTORY_MAX_TOKENS", 1500))
+    summarize = os.getenv("CHAT_HISTORY_SUMMARY", "false").lower() in ("1", "true", "yes")
+    logger.info(f"Chat sessions enabled ({kind}, max_entries={max_entries}, "
+                f"max_history_tokens={max_history_tokens}, summarize={summarize})")
+    return SessionStore(
+        backend,
+        max_history_tokens=max_history_tokens,
+        summarize=summarize,
+        summary_max_tokens=int(os.getenv("CHAT_HISTORY_SUMMARY_TOKENS", 200)),
+    )
@@ -0,0 +1,85 @@
+import hashlib
+import logging
+import os
+from typing import Dict, Optional
+
+from services.cache import MemoryCache, SQLiteCache
+
+logger = logging.getLogger(__name__)
+
+
+def content_hash(data: bytes) -> str:
+    """Hash the raw bytes of an uploaded image."""
+    return hashlib.blake2b(data, digest_size=20).hexdigest()
+
+
+class ImageResultCache:
+    """
+    Cache of analysis results keyed on image content and model version.
+
+    Lookups hit the in-process LRU first and then the optional on-disk tier;
+    disk hits are promoted back into memory. Results are returned as stored,
+    so callers must treat them as read-only.
+    """
+
+    def __init__(self, memory: MemoryCache, disk: Optional[SQLiteCache] = None):
+        self.memory = memory
+        self.disk = disk
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def make_key(digest: str, model_version: str) -> str:
+        return f"{model_version}:{digest}"
+
+    def get(self, digest: str, model_version: str) -> Optional[Dict]:
+        key = self.make_key(digest, model_version)
+        result = self.memory.get(key)
+        if result is None and self.disk is not None:
+            result = self.disk.get(key)
+            if result is not None:
+                self.memory.set(key, result)
+        if result is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return result
+
+    def set(self, digest: str, model_version: str, result: Dict):
+        key = self.make_key(digest, model_version)
+        self.memory.set(key, result)
+        if self.disk is not None:
+            self.disk.set(key, result)
+
+    def close(self):
+        if self.disk is not None:
+            self.disk.close()
+
+    def stats(self) -> Dict:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "memory": self.memory.stats(),
+            "disk": self.disk.stats() if self.disk is not None else None,
+        }
+
+
+def create_image_cache() -> Optional[ImageResultCache]:
+    """Build the image result cache from environment variables."""
+    max_entries = int(os.getenv("IMAGE_CACHE_MAX_ENTRIES", 2048))
+    if max_entries <= 0:
+        return None
+
+    ttl = float(os.getenv("IMAGE_CACHE_TTL", 86400)) or None
+    memory = MemoryCache(max_entries=max_entries, ttl=ttl)
+
+    disk = None
+    path = os.getenv("IMAGE_CACHE_PATH")
+    if path:
+        disk_entries = int(os.getenv("IMAGE_CACHE_DISK_MAX_ENTRIES", 100000))
+        disk = SQLiteCache(path, max_entries=disk_entries, ttl=ttl)
+
+    logger.info(f"Image result cache enabled (max_entries={max_entries}, disk={path or 'off'})")
+    return ImageResultCache(memory, disk)
@@ -0,0 +1,128 @@
+import asyncio
+import contextvars
+import logging
+import multiprocessing
+import os
+import time
+from collections import deque
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from services.metrics import STAGE_SECONDS
+
+logger = logging.getLogger(__name__)
+
+
+class QueueFullError(Exception):
+    """Raised when the inference queue cannot accept more work."""
+
+
+def _timed_call(fn: Callable, args: Tuple) -> Tuple[float, Any]:
+    """Run ``fn`` and report when it actually started (used across processes)."""
+    started = time.monotonic()
+    return started, fn(*args)
+
+
+class InferencePool:
+    """
+    Bounded executor for blocking image work (decoding, preprocessing).
+
+    Work is dispatched to a thread or process pool so the event loop is never
+    blocked. At most ``max_workers + max_queue_size`` calls may be pending at
+    once; further calls fail immediately with :class:`QueueFullError` so the
+    API can shed load instead of piling up requests.
+    """
+
+    def __init__(
+        self,
+        kind: str = "thread",
+        max_workers: Optional[int] = None,
+        max_queue_size: int = 64,
+    ):
+        if kind not in ("thread", "process"):
+            raise ValueError(f"Unknown executor kind: {kind}")
+        self.kind = kind
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.max_queue_size = max_queue_size
+        self.max_pending = self.max_workers + max_queue_size
+
+        self._executor: Optional[Executor] = None
+        self._pending = 0
+        self._completed = 0
+        self._rejected = 0
+        self._wait_times = deque(maxlen=1000)
+        self._wait_histogram = STAGE_SECONDS.labels("pool_wait")
+
+    def start(self):
+        if self._executor is not None:
+            return
+        if self.kind == "process":
+            # Workers are created on the first submit, by which time the model
+            # may be loading in another thread; forking a process running
+            # TensorFlow's thread pools is unsafe, so start them fresh instead
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.max_workers, mp_context=multiprocessing.get_context("spawn")
+            )
+            # Start the workers now rather than on the first requests, since
+            # spawning them takes a second
+            for _ in range(self.max_workers):
+                self._executor.submit(os.getpid)
+        else:
+            self._executor = ThreadPoolExecutor(
+                max_workers=self.max_workers, thread_name_prefix="inference"
+            )
+        logger.info(
+            f"Inference pool started ({self.kind}, workers={self.max_workers}, "
+            f"queue_size={self.max_queue_size})"
+        )
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=True, cancel_futures=True)
+            self._executor = None
+
+    async def run(self, fn: Callable, *args) -> Any:
+        """
+        Run ``fn(*args)`` in the pool.
+
+        Raises:
+            QueueFullError: If the pool already has ``max_pending`` calls queued
+        """
+        if self._pending >= self.max_pending:
+            self._rejected += 1
+            raise QueueFullError("Inference queue is full")
+        if self._executor is None:
+            self.start()
+
+        self._pending += 1
+        submitted = time.monotonic()
+        try:
+            loop = asyncio.get_running_loop()
+            if self.kind == "thread":
+                # Carry context variables (e.g. the request ID for logging) into the worker
+                context = contextvars.copy_context()
+                call = loop.run_in_executor(self._executor, context.run, _timed_call, fn, args)
+            else:
+                call = loop.run_in_executor(self._executor, _timed_call, fn, args)
+            started, result = await call
+            wait = max(started - submitted, 0.0)
+            self._wait_times.append(wait)
+            self._wait_histogram.observe(wait)
+            self._completed += 1
+            return result
+        finally:
+            self._pending -= 1
+
+    def stats(self) -> Dict:
+        waits = self._wait_times
+        return {
+            "executor": self.kind,
+            "workers": self.max_workers,
+            "pending": self._pending,
+            "queue_depth": max(self._pending - self.max_workers, 0),
+            "max_queue_size": self.max_queue_size,
+            "completed": self._completed,
+            "rejected": self._rejected,
+            "avg_wait_ms": round(sum(waits) / len(waits) * 1000, 3) if waits else 0.0,
+            "max_wait_ms": round(max(waits) * 1000, 3) if waits else 0.0,
+        }
@@ -0,0 +1,204 @@
+import atexit
+import contextvars
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import sys
+import uuid
+from datetime import datetime, timezone
+from typing import Dict, Optional
+
+# ID of the request being handled, attached to every log record emitted
+# while handling it (including from threads started with the context copied)
+request_id: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("request_id", default=None)
+
+# Attributes every LogRecord has; anything else was passed through ``extra``
+_RECORD_ATTRIBUTES = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {
+    "message", "asctime",
+    # uvicorn adds a copy of the message with terminal colour codes
+    "color_message",
+}
+
+_listener: Optional[logging.handlers.QueueListener] = None
+_registered_at_fork = False
+
+
+class JsonFormatter(logging.Formatter):
+    """Format records as one JSON object per line."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRIBUTES and value is not None:
+                entry[key] = value
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry["exception"] = record.exc_text
+        return json.dumps(entry, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    def __init__(self):
+        super().__init__("%(asctime)s %(levelname)s %(name)s [%(request_id)s] %(message)s")
+
+    def format(self, record: logging.LogRecord) -> str:
+        if not hasattr(record, "request_id"):
+            record.request_id = "-"
+        return super().format(record)
+
+
+class ContextFilter(logging.Filter):
+    """Attach the current request ID, and sample DEBUG records."""
+
+    def __init__(self, debug_sample_rate: float = 1.0):
+        super().__init__()
+        self.debug_sample_rate = debug_sample_rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno <= logging.DEBUG and self.debug_sample_rate < 1.0:
+            if random.random() >= self.debug_sample_rate:
+                return False
+        current = request_id.get()
+        if current is not None:
+            record.request_id = current
+        return True
+
+
+class _QueueHandler(logging.handlers.QueueHandler):
+    """
+    Queue records for the listener thread without formatting them here.
+
+    The stock handler formats the message on the calling thread and drops
+    the exception; this only resolves the message arguments and renders the
+    traceback text, leaving the formatting to the listener.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = logging.makeLogRecord(vars(record))
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+def _parse_levels(spec: str) -> Dict[str, str]:
+    """Parse ``"services.chat_service=DEBUG,uvicorn.access=WARNING"``."""
+    levels = {}
+    for item in spec.split(","):
+        if "=" in item:
+            name, level = item.split("=", 1)
+            levels[name.strip()] = level.strip().upper()
+    return levels
+
+
+def configure_logging():
+    """
+    Send all logging through a queue to a background writer thread.
+
+    Configured from environment variables:
+        LOG_FORMAT: ``json`` (default) or ``text``
+        LOG_LEVEL: Root level (default: INFO)
+        LOG_LEVELS: Per-logger levels, e.g. ``models=DEBUG,uvicorn.access=WARNING``
+        LOG_DEBUG_SAMPLE_RATE: Fraction of DEBUG records kept (default: 1)
+
+    Calling it again replaces the previous configuration.
+    """
+    global _listener, _registered_at_fork
+    if _listener is not None:
+        _listener.stop()
+    if not _registered_at_fork:
+        # The writer thread does not survive a fork (gunicorn workers,
+        # process pools), so forked children start their own
+        os.register_at_fork(after_in_child=_reconfigure_in_child)
+        _registered_at_fork = True
+
+    output = logging.StreamHandler(sys.stdout)
+    if os.getenv("LOG_FORMAT", "json").lower() == "text":
+        output.setFormatter(TextFormatter())
+    else:
+        output.setFormatter(JsonFormatter())
+
+    log_queue = queue.SimpleQueue()
+    handler = _QueueHandler(log_queue)
+    handler.addFilter(ContextFilter(float(os.getenv("LOG_DEBUG_SAMPLE_RATE", 1.0))))
+
+    root = logging.getLogger()
+    for existing in list(root.handlers):
+        root.removeHandler(existing)
+    root.addHandler(handler)
+    root.setLevel(os.getenv("LOG_LEVEL", "INFO").upper())
+
+    # Route uvicorn's own loggers through the same queue
+    for name in ("uvicorn", "uvicorn.error", "uvicorn.access"):
+        uvicorn_logger = logging.getLogger(name)
+        uvicorn_logger.handlers.clear()
+        uvicorn_logger.propagate = True
+
+    for name, level in _parse_levels(os.getenv("LOG_LEVELS", "")).items():
+        logging.getLogger(name).setLevel(level)
+
+    _listener = logging.handlers.QueueListener(log_queue, output, respect_handler_level=True)
+    _listener.start()
+
+
+def _reconfigure_in_child():
+    if _listener is not None:
+        configure_logging()
+
+
+def shutdown_logging():
+    """Flush queued records and stop the writer thread."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+atexit.register(shutdown_logging)
+
+
+class RequestIdMiddleware:
+    """
+    ASGI middleware giving every request an ID for its log records.
+
+    An incoming ``X-Request-ID`` header is reused, so IDs can be followed
+    across services; otherwise a new one is generated. The ID is echoed in
+    the response's ``X-Request-ID`` header.
+    """
+
+    header = b"x-request-id"
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        incoming = dict(scope["headers"]).get(self.header)
+        current = incoming.decode("latin-1")[:128] if incoming else uuid.uuid4().hex
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                message["headers"] = list(message.get("headers", [])) + [
+                    (self.header, current.encode("latin-1"))
+                ]
+            await send(message)
+
+        token = request_id.set(current)
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            request_id.reset(token)
@@ -0,0 +1,318 @@
+import asyncio
+import logging
+import os
+import random
+import time
+from typing import Awaitable, Callable, Optional, TypeVar
+
+import httpx
+
+from services.metrics import CHAT_CIRCUIT_OPEN, CHAT_UPSTREAM_EVENTS
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# Guards for calls to a rate-limited, sometimes unreliable upstream API:
+# a client-side rate limiter, retries with jittered exponential backoff and
+# a circuit breaker. They share one event loop and are not thread-safe.
+
+
+class RateLimitedError(Exception):
+    """The rate limiter could not admit a request within the allowed wait."""
+
+    def __init__(self, wait: float):
+        super().__init__(f"Rate limit reached, capacity available in {wait:.1f}s")
+        self.wait = wait
+
+
+class CircuitOpenError(Exception):
+    """The circuit breaker is open, so the upstream is not being called."""
+
+    def __init__(self, retry_after: float):
+        super().__init__(f"Upstream circuit open, retrying in {retry_after:.0f}s")
+        self.retry_after = retry_after
+
+
+def is_transient(error: BaseException) -> bool:
+    """
+    Whether an error is worth retrying: timeouts, connection failures,
+    429 and 5xx responses. Exhausted quotas are reported as 429 too, but
+    retrying those can't help.
+    """
+    if isinstance(error, (asyncio.TimeoutError, httpx.TimeoutException, httpx.TransportError, ConnectionError)):
+        return True
+    if getattr(error, "code", None) == "insufficient_quota":
+        return False
+    status = getattr(error, "status_code", None)
+    return status is not None and (status in (408, 409, 429) or status >= 500)
+
+
+def retry_after(error: BaseException) -> Optional[float]:
+    """Seconds the upstream asked us to wait, from a Retry-After header."""
+    headers = getattr(getattr(error, "response", None), "headers", None)
+    if not headers:
+        return None
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+
+class TokenBucket:
+    """
+    Refill ``rate_per_minute`` units a minute, up to ``capacity``.
+
+    The capacity defaults to ten seconds' worth, since upstream limits are
+    usually enforced over windows shorter than the minute they are quoted in.
+    """
+
+    def __init__(self, rate_per_minute: float, capacity: Optional[float] = None):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = capacity or max(rate_per_minute / 6.0, 1.0)
+        self.available = self.capacity
+        self._updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.available = min(self.capacity, self.available + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def wait_time(self, amount: float) -> float:
+        """Seconds until ``amount`` units are available."""
+        self._refill()
+        # A request larger than the bucket waits for a full bucket
+        deficit = min(amount, self.capacity) - self.available
+        return max(deficit / self.rate, 0.0)
+
+    def take(self, amount: float):
+        self._refill()
+        self.available -= min(amount, self.capacity)
+
+
+class RateLimiter:
+    """
+    Client-side requests-per-minute and tokens-per-minute limits.
+
+    Requests are admitted in arrival order. A request that would have to
+    wait longer than ``max_wait`` seconds fails with RateLimitedError
+    instead, so callers aren't queued behind a backlog they can't clear.
+
+    Args:
+        requests_per_minute: Request limit, or 0 for none
+        tokens_per_minute: Token limit, or 0 for none
+        max_wait: Longest a request may wait for capacity
+    """
+
+    def __init__(self, requests_per_minute: float = 0, tokens_per_minute: float = 0, max_wait: float = 10.0):
+        self.requests = TokenBucket(requests_per_minute) if requests_per_minute > 0 else None
+        self.tokens = TokenBucket(tokens_per_minute) if tokens_per_minute > 0 else None
+        self.max_wait = max_wait
+        self._lock = asyncio.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.requests is not None or self.tokens is not None
+
+    def _wait_time(self, tokens: int) -> float:
+        waits = [0.0]
+        if self.requests is not None:
+            waits.append(self.requests.wait_time(1))
+        if self.tokens is not None:
+            waits.append(self.tokens.wait_time(tokens))
+        return max(waits)
+
+    async def acquire(self, tokens: int = 0):
+        """
+        Wait until one request using ``tokens`` tokens fits in the limits.
+
+        Raises:
+            RateLimitedError: If that would take longer than ``max_wait``
+        """
+        if not self.enabled:
+            return
+        deadline = time.monotonic() + self.max_wait
+        try:
+            await asyncio.wait_for(self._lock.acquire(), self.max_wait)
+        except asyncio.TimeoutError:
+            CHAT_UPSTREAM_EVENTS.labels("rate_limit_rejected").inc()
+            raise RateLimitedError(self.max_wait) from None
+        try:
+            wait = self._wait_time(tokens)
+            if wait > deadline - time.monotonic():
+                CHAT_UPSTREAM_EVENTS.labels("rate_limit_rejected").inc()
+                raise RateLimitedError(wait)
+            if wait > 0:
+                CHAT_UPSTREAM_EVENTS.labels("rate_limit_wait").inc()
+                await asyncio.sleep(wait)
+            if self.requests is not None:
+                self.requests.take(1)
+            if self.tokens is not None:
+                self.tokens.take(tokens)
+        finally:
+            self._lock.release()
+
+
+class RetryPolicy:
+    """
+    Exponential backoff with full jitter.
+
+    Attempt ``n`` (from 0) is retried after a random delay between 0 and
+    ``base_delay * 2**n``, capped at ``max_delay``; spreading the retries
+    out keeps clients from retrying in lockstep. A Retry-After header from
+    the upstream takes precedence, within the same cap.
+    """
+
+    def __init__(self, max_attempts: int = 3, base_delay: float = 0.5, max_delay: float = 8.0):
+        self.max_attempts = max(max_attempts, 1)
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    def delay(self, attempt: int, error: Optional[BaseException] = None) -> float:
+        requested = retry_after(error) if error is not None else None
+        if requested is not None:
+            return min(requested, self.max_delay)
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+
+class CircuitBreaker:
+    """
+    Stop calling an upstream that keeps failing.
+
+    After ``failure_threshold`` consecutive transient failures the circuit
+    opens and calls fail immediately with CircuitOpenError, instead of each
+    holding a worker until it times out. After ``reset_timeout`` seconds a
+    single trial call is let through: success closes the circuit, failure
+    opens it again.
+    """
+
+    CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self._opened_at = 0.0
+        self._trial_in_flight = False
+
+    def before_call(self):
+        """Raise CircuitOpenError unless a call may go through now."""
+        if self.state == self.OPEN:
+            remaining = self._opened_at + self.reset_timeout - time.monotonic()
+            if remaining > 0:
+                CHAT_UPSTREAM_EVENTS.labels("circuit_rejected").inc()
+                raise CircuitOpenError(remaining)
+            self.state = self.HALF_OPEN
+        if self.state == self.HALF_OPEN:
+            if self._trial_in_flight:
+                CHAT_UPSTREAM_EVENTS.labels("circuit_rejected").inc()
+                raise CircuitOpenError(self.reset_timeout)
+            self._trial_in_flight = True
+
+    def record_success(self):
+        if self.state != self.CLOSED:
+            logger.info("Upstream recovered, circuit closed")
+            CHAT_CIRCUIT_OPEN.set(0)
+        self.state = self.CLOSED
+        self.failures = 0
+        self._trial_in_flight = False
+
+    def record_failure(self):
+        self._trial_in_flight = False
+        self.failures += 1
+        if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+            if self.state != self.OPEN:
+                logger.warning(f"Upstream failing ({self.failures} consecutive failures), "
+                               f"circuit open for {self.reset_timeout:g}s")
+                CHAT_UPSTREAM_EVENTS.labels("circuit_opened").inc()
+                CHAT_CIRCUIT_OPEN.set(1)
+            self.state = self.OPEN
+            self._opened_at = time.monotonic()
+
+    def release(self):
+        """Give up a call without an outcome (e.g. it was cancelled)."""
+        self._trial_in_flight = False
+
+    def stats(self) -> dict:
+        return {"state": self.state, "consecutive_failures": self.failures}
+
+
+class UpstreamGuard:
+    """
+    Run upstream calls through the circuit breaker, rate limiter and retry
+    policy, in that order.
+
+    Only transient errors (see ``is_transient``) are retried and count as
+    failures for the breaker; other errors are returned to the caller as is.
+    """
+
+    def __init__(
+        self,
+        limiter: RateLimiter,
+        retry: RetryPolicy,
+        breaker: CircuitBreaker,
+        is_transient: Callable[[BaseException], bool] = is_transient,
+    ):
+        self.limiter = limiter
+        self.retry = retry
+        self.breaker = breaker
+        self.is_transient = is_transient
+
+    async def call(self, fn: Callable[[], Awaitable[T]], tokens: int = 0) -> T:
+        """
+        Call ``fn`` (an async function without arguments) until it succeeds
+        or the retries run out.
+
+        Args:
+            fn: The upstream call
+            tokens: Tokens the call counts against the tokens-per-minute limit
+        """
+        attempt = 0
+        while True:
+            self.breaker.before_call()
+            try:
+                await self.limiter.acquire(tokens)
+            except BaseException:
+                self.breaker.release()
+                raise
+            try:
+                result = await fn()
+            except Exception as e:
+                if not self.is_transient(e):
+                    # The upstream answered, so it is up
+                    self.breaker.record_success()
+                    raise
+                self.breaker.record_failure()
+                attempt += 1
+                if attempt >= self.retry.max_attempts or self.breaker.state == CircuitBreaker.OPEN:
+                    raise
+                delay = self.retry.delay(attempt - 1, e)
+                logger.warning(f"Upstream call failed ({str(e)}), retry {attempt} in {delay:.2f}s")
+                CHAT_UPSTREAM_EVENTS.labels("retry").inc()
+                await asyncio.sleep(delay)
+            except BaseException:
+                self.breaker.release()
+                raise
+            else:
+                self.breaker.record_success()
+                return result
+
+
+def create_upstream_guard(is_transient: Callable[[BaseException], bool] = is_transient) -> UpstreamGuard:
+    """Build the chat upstream guards from environment variables."""
+    limiter = RateLimiter(
+        requests_per_minute=float(os.getenv("CHAT_RATE_LIMIT_RPM", 0)),
+        tokens_per_minute=float(os.getenv("CHAT_RATE_LIMIT_TPM", 0)),
+        max_wait=float(os.getenv("CHAT_RATE_LIMIT_MAX_WAIT", 10)),
+    )
+    retry = RetryPolicy(
+        max_attempts=int(os.getenv("CHAT_RETRY_ATTEMPTS", 3)),
+        base_delay=float(os.getenv("CHAT_RETRY_BASE_DELAY", 0.5)),
+        max_delay=float(os.getenv("CHAT_RETRY_MAX_DELAY", 8)),
+    )
+    breaker = CircuitBreaker(
+        failure_threshold=int(os.getenv("CHAT_BREAKER_FAILURES", 5)),
+        reset_timeout=float(os.getenv("CHAT_BREAKER_RESET", 30)),
+    )
+    return UpstreamGuard(limiter, retry, breaker, is_transient)
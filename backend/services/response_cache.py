@@ -0,0 +1,148 @@
+import hashlib
+import json
+import logging
+import os
+import re
+import unicodedata
+import zlib
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+
+from services.cache import CacheBackend, MemoryCache, SQLiteCache
+
+logger = logging.getLogger(__name__)
+
+EMBEDDING_DIM = 512
+
+
+def normalize_message(message: str) -> str:
+    """Normalize a chat message so trivially different phrasings share a key."""
+    text = unicodedata.normalize("NFKC", message).lower()
+    text = re.sub(r"[^\w\s]", " ", text)
+    return " ".join(text.split())
+
+
+def embed(text: str) -> np.ndarray:
+    """
+    Compute a small, local embedding of normalized text.
+
+    Words and character trigrams are hashed into a fixed number of buckets
+    and the vector is L2-normalized, so the dot product of two embeddings is
+    their cosine similarity. No model or network call is needed.
+    """
+    vector = np.zeros(EMBEDDING_DIM, dtype=np.float32)
+    for word in text.split():
+        vector[zlib.crc32(word.encode()) % EMBEDDING_DIM] += 2.0
+        padded = f" {word} "
+        for i in range(len(padded) - 2):
+            vector[zlib.crc32(padded[i:i + 3].encode()) % EMBEDDING_DIM] += 1.0
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+class ResponseCache:
+    """
+    Cache of chat responses keyed on (message, language, model, temperature).
+
+    Messages are normalized before hashing. When ``similarity_threshold`` is
+    set, a miss on the exact key falls back to the most similar cached
+    message for the same language/model/temperature, using local embeddings.
+    """
+
+    def __init__(self, backend: CacheBackend, similarity_threshold: float = 0.0):
+        self.backend = backend
+        self.similarity_threshold = similarity_threshold
+        self.semantic_hits = 0
+
+        # Embeddings of cached messages, grouped by (language, model, temperature)
+        self._index: Dict[Tuple, "OrderedDict[str, np.ndarray]"] = {}
+        if similarity_threshold > 0:
+            for key, value in backend.items():
+                self._add_to_index(key, tuple(value["context"]), value["message"])
+
+    @staticmethod
+    def make_key(message: str, context: Tuple) -> str:
+        payload = json.dumps([message, *context])
+        return hashlib.sha256(payload.encode()).hexdigest()
+
+    def _add_to_index(self, key: str, context: Tuple, message: str):
+        entries = self._index.setdefault(context, OrderedDict())
+        entries[key] = embed(message)
+        entries.move_to_end(key)
+        while len(entries) > self.backend.max_entries:
+            entries.popitem(last=False)
+
+    def _find_similar(self, context: Tuple, message: str) -> Optional[str]:
+        entries = self._index.get(context)
+        if not entries:
+            return None
+        keys = list(entries.keys())
+        scores = np.stack(list(entries.values())) @ embed(message)
+        best = int(np.argmax(scores))
+        if scores[best] >= self.similarity_threshold:
+            return keys[best]
+        return None
+
+    def get(self, message: str, language: str, model: str, temperature: float) -> Optional[str]:
+        normalized = normalize_message(message)
+        context = (language, model, temperature)
+        value = self.backend.get(self.make_key(normalized, context))
+
+        if value is None and self.similarity_threshold > 0:
+            similar_key = self._find_similar(context, normalized)
+            if similar_key is not None:
+                value = self.backend.get(similar_key)
+                if value is None:
+                    # Evicted or expired from the backend since it was indexed
+                    self._index[context].pop(similar_key, None)
+                else:
+                    self.semantic_hits += 1
+                    logger.info(f"Semantic cache hit for: {message[:50]}...")
+
+        return value["response"] if value is not None else None
+
+    def set(self, message: str, language: str, model: str, temperature: float, response: str):
+        normalized = normalize_message(message)
+        context = (language, model, temperature)
+        key = self.make_key(normalized, context)
+        self.backend.set(key, {
+            "message": normalized,
+            "context": list(context),
+            "response": response
+        })
+        if self.similarity_threshold > 0:
+            self._add_to_index(key, context, normalized)
+
+    def close(self):
+        self.backend.close()
+
+    def stats(self) -> Dict:
+        stats = self.backend.stats()
+        # A semantic hit is also counted as a miss on the exact key
+        stats["misses"] -= self.semantic_hits
+        stats["semantic_hits"] = self.semantic_hits
+        stats["similarity_threshold"] = self.similarity_threshold
+        return stats
+
+
+def create_response_cache() -> Optional[ResponseCache]:
+    """Build the chat response cache from environment variables."""
+    kind = os.getenv("CHAT_CACHE_BACKEND", "memory").lower()
+    if kind in ("", "none", "off"):
+        return None
+
+    max_entries = int(os.getenv("CHAT_CACHE_MAX_ENTRIES", 1024))
+    ttl = float(os.getenv("CHAT_CACHE_TTL", 3600)) or None
+    if kind == "memory":
+        backend = MemoryCache(max_entries=max_entries, ttl=ttl)
+    elif kind == "file":
+        path = os.getenv("CHAT_CACHE_PATH", "chat_cache.sqlite3")
+        backend = SQLiteCache(path, max_entries=max_entries, ttl=ttl)
+    else:
+        raise ValueError(f"Unknown CHAT_CACHE_BACKEND: {kind}")
+
+    threshold = float(os.getenv("CHAT_CACHE_SIMILARITY", 0))
+    logger.info(f"Chat response cache enabled ({kind}, max_entries={max_entries}, similarity={threshold})")
+    return ResponseCache(backend, similarity_threshold=threshold)
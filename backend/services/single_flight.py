@@ -0,0 +1,62 @@
+import asyncio
+import logging
+from typing import Awaitable, Callable, Dict, Hashable, TypeVar
+
+from services.metrics import COALESCED_REQUESTS
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+class SingleFlight:
+    """
+    Coalesce concurrent calls for the same key into one computation.
+
+    The first caller for a key starts the work; callers arriving while it
+    is still running wait for the same result (or exception) instead of
+    repeating it. Nothing is kept once the work finishes, so this only
+    removes duplicate work in flight and complements, rather than
+    replaces, the result caches.
+
+    The work runs in its own task, so a caller that goes away (e.g. a
+    disconnected client) doesn't cancel it for the others.
+
+    Args:
+        name: Label for the coalesced requests metric, e.g. ``chat``
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self.coalesced = 0
+        self._calls: Dict[Hashable, asyncio.Task] = {}
+        self._coalesced_metric = COALESCED_REQUESTS.labels(name)
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[T]]) -> T:
+        """
+        Return the result of ``fn()``, shared with concurrent calls for ``key``.
+
+        Args:
+            key: Identifies requests that would compute the same result
+            fn: Async function without arguments doing the work
+        """
+        task = self._calls.get(key)
+        if task is None:
+            task = asyncio.ensure_future(fn())
+            self._calls[key] = task
+            task.add_done_callback(lambda done: self._finished(key, done))
+        else:
+            self.coalesced += 1
+            self._coalesced_metric.inc()
+            logger.debug(f"Coalesced a {self.name} request with one in flight")
+        return await asyncio.shield(task)
+
+    def _finished(self, key: Hashable, task: asyncio.Task):
+        if self._calls.get(key) is task:
+            del self._calls[key]
+        # Mark the exception as retrieved in case every caller went away
+        if not task.cancelled():
+            task.exception()
+
+    def stats(self) -> Dict:
+        return {"in_flight": len(self._calls), "coalesced": self.coalesced}
@@ -62,7 +62,7 @@ def setup_model():
         
         # Save the model
         model_path = os.path.join('models', 'plant_disease_model.h5')
-        model.save(model_path, include_optimizer=True)
+        model.save(model_path, include_optimizer=False)
         
         print("Model setup completed successfully!")
         print(f"Model saved to: {model_path}")
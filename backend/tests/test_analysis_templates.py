@@ -0,0 +1,63 @@
+import json
+
+import pytest
+
+from models.analysis_templates import AnalysisTemplates, severity_band
+
+CLASS_NAMES = ["Tomato___Late_blight", "Tomato___healthy"]
+DISEASE_INFO = [
+    {
+        "symptoms": ["Dark lesions on leaves"],
+        "causes": ["Cool, wet weather"],
+        "treatment": ["Remove infected leaves", "Apply fungicide"],
+        "prevention": ["Water at the base"],
+    },
+    {},
+]
+
+
+@pytest.fixture(scope="module")
+def templates():
+    return AnalysisTemplates(CLASS_NAMES, DISEASE_INFO)
+
+
+@pytest.mark.parametrize("confidence, band", [(0.99, 0), (0.9, 1), (0.75, 1), (0.7, 2), (0.1, 2), (0.0, 2)])
+def test_severity_band(confidence, band):
+    assert severity_band(confidence) == band
+
+
+def test_labels_split_plant_and_disease(templates):
+    assert templates.labels == [
+        {"plant_type": "Tomato", "disease": "Late_blight"},
+        {"plant_type": "Tomato", "disease": "healthy"},
+    ]
+
+
+def test_template_depends_on_the_confidence_band(templates):
+    severe = templates.get(0, 0.95).to_dict(0.95)
+    mild = templates.get(0, 0.5).to_dict(0.5)
+
+    assert severe["severity"] == "severe"
+    assert severe["analysis"]["stage"] == "advanced"
+    assert mild["severity"] == "mild"
+    assert severe["analysis"]["visual_symptoms"] == ("Dark lesions on leaves",)
+    assert severe["recommendations"][-2:] == ("Remove infected leaves", "Apply fungicide")
+
+
+def test_missing_knowledge_gives_empty_sections(templates):
+    result = templates.get(1, 0.8).to_dict(0.8)
+
+    assert result["analysis"]["visual_symptoms"] == ()
+    assert result["analysis"]["treatment_plan"] == {"immediate_actions": (), "long_term_measures": ()}
+
+
+@pytest.mark.parametrize("alternatives", [None, [{"plant_type": "Tomato", "disease": "healthy", "confidence": 0.1}]])
+@pytest.mark.parametrize("confidence", [0.95, 0.8, 0.123456789])
+def test_to_json_matches_to_dict(templates, confidence, alternatives):
+    template = templates.get(0, confidence)
+
+    rendered = json.loads(template.to_json(confidence, alternatives))
+    expected = json.loads(json.dumps(template.to_dict(confidence, alternatives)))
+
+    assert rendered == expected
+    assert list(rendered) == list(expected)
@@ -0,0 +1,155 @@
+import asyncio
+import threading
+import time
+
+import numpy as np
+import pytest
+
+from services.batch_scheduler import BatchScheduler
+from services.inference_pool import QueueFullError
+
+
+class RecordingPredict:
+    """predict_fn that sums each image and records the batch sizes it saw."""
+
+    def __init__(self, delay: float = 0.0):
+        self.delay = delay
+        self.batch_sizes = []
+        self.started = threading.Event()
+        self.release = threading.Event()
+        self.release.set()
+
+    def __call__(self, batch: np.ndarray) -> np.ndarray:
+        self.batch_sizes.append(len(batch))
+        self.started.set()
+        self.release.wait(5)
+        time.sleep(self.delay)
+        return batch.reshape(len(batch), -1).sum(axis=1, keepdims=True)
+
+
+def image(value: float) -> np.ndarray:
+    return np.full((1, 2, 2, 3), value, dtype=np.float32)
+
+
+def test_full_batch_runs_without_waiting():
+    predict = RecordingPredict()
+
+    async def run():
+        scheduler = BatchScheduler(predict, max_batch_size=4, max_wait_ms=5000)
+        started = time.monotonic()
+        results = await asyncio.gather(*(scheduler.submit(image(i)) for i in range(4)))
+        elapsed = time.monotonic() - started
+        await scheduler.stop()
+        return results, elapsed
+
+    results, elapsed = asyncio.run(run())
+
+    assert predict.batch_sizes == [4]
+    assert elapsed < 1
+    # Each caller gets the predictions for its own image
+    assert [float(result[0, 0]) for result in results] == [0.0, 12.0, 24.0, 36.0]
+
+
+def test_partial_batch_runs_after_max_wait():
+    predict = RecordingPredict()
+
+    async def run():
+        scheduler = BatchScheduler(predict, max_batch_size=8, max_wait_ms=50)
+        started = time.monotonic()
+        results = await asyncio.gather(scheduler.submit(image(1)), scheduler.submit(image(2)))
+        elapsed = time.monotonic() - started
+        await scheduler.stop()
+        return results, elapsed
+
+    results, elapsed = asyncio.run(run())
+
+    assert predict.batch_sizes == [2]
+    assert 0.04 <= elapsed < 1
+    assert [float(result[0, 0]) for result in results] == [12.0, 24.0]
+
+
+def test_multi_image_submission_gets_its_rows():
+    predict = RecordingPredict()
+
+    async def run():
+        scheduler = BatchScheduler(predict, max_batch_size=8, max_wait_ms=10)
+        result = await scheduler.submit(np.concatenate([image(1), image(2), image(3)]))
+        await scheduler.stop()
+        return result
+
+    assert asyncio.run(run())[:, 0].tolist() == [12.0, 24.0, 36.0]
+
+
+def test_queue_full_at_capacity():
+    predict = RecordingPredict()
+    predict.release.clear()
+
+    async def run():
+        scheduler = BatchScheduler(predict, max_batch_size=1, max_wait_ms=0, max_queue_size=2)
+        running = asyncio.ensure_future(scheduler.submit(image(1)))
+        # Wait for the first request to be taken off the queue and predicted
+        await asyncio.get_running_loop().run_in_executor(None, predict.started.wait, 5)
+        queued = [asyncio.ensure_future(scheduler.submit(image(i))) for i in (2, 3)]
+        await asyncio.sleep(0)
+
+        with pytest.raises(QueueFullError):
+            await scheduler.submit(image(4))
+
+        predict.release.set()
+        results = await asyncio.gather(running, *queued)
+        await scheduler.stop()
+        return results
+
+    results = asyncio.run(run())
+
+    assert [float(result[0, 0]) for result in results] == [12.0, 24.0, 36.0]
+
+
+def test_prediction_error_fails_every_caller_in_the_batch():
+    def predict(batch):
+        raise ValueError("bad batch")
+
+    async def run():
+        scheduler = BatchScheduler(predict, max_batch_size=2, max_wait_ms=1000)
+        results = await asyncio.gather(
+            scheduler.submit(image(1)), scheduler.submit(image(2)), return_exceptions=True
+        )
+        await scheduler.stop()
+        return results
+
+    results = asyncio.run(run())
+
+    assert all(isinstance(result, ValueError) for result in results)
+
+
+def test_stop_finishes_pending_requests_and_rejects_new_ones():
+    predict = RecordingPredict(delay=0.1)
+
+    async def run():
+        scheduler = BatchScheduler(predict, max_batch_size=2, max_wait_ms=10)
+        pending = [asyncio.ensure_future(scheduler.submit(image(i))) for i in range(5)]
+        await asyncio.sleep(0.02)
+        await scheduler.stop()
+
+        with pytest.raises(QueueFullError):
+            await scheduler.submit(image(9))
+        return [task.result() for task in pending]
+
+    results = asyncio.run(run())
+
+    assert [float(result[0, 0]) for result in results] == [0.0, 12.0, 24.0, 36.0, 48.0]
+
+
+def test_stop_fails_requests_still_pending_after_the_timeout():
+    predict = RecordingPredict(delay=0.3)
+
+    async def run():
+        scheduler = BatchScheduler(predict, max_batch_size=1, max_wait_ms=0)
+        pending = [asyncio.ensure_future(scheduler.submit(image(i))) for i in range(3)]
+        await asyncio.sleep(0.02)
+        await scheduler.stop(timeout=0.05)
+        return await asyncio.gather(*pending, return_exceptions=True)
+
+    results = asyncio.run(run())
+
+    assert all(isinstance(result, RuntimeError) for result in results)
@@ -0,0 +1,183 @@
+import sqlite3
+
+import pytest
+
+from services.cache import MemoryCache, SQLiteCache
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1_000_000.0
+
+    def __call__(self) -> float:
+        # Every call moves on a little, so access times never tie
+        self.now += 0.001
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr("services.cache.time.time", clock)
+    return clock
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def make_cache(request, tmp_path):
+    caches = []
+
+    def make(**kwargs):
+        if request.param == "memory":
+            cache = MemoryCache(**kwargs)
+        else:
+            cache = SQLiteCache(str(tmp_path / "cache.sqlite3"), **kwargs)
+        caches.append(cache)
+        return cache
+
+    yield make
+    for cache in caches:
+        cache.close()
+
+
+def test_get_returns_what_was_set(make_cache, clock):
+    cache = make_cache(max_entries=10)
+    cache.set("a", {"response": "hello"})
+
+    assert cache.get("a") == {"response": "hello"}
+    assert cache.get("b") is None
+    assert cache.stats()["hits"] == 1
+    assert cache.stats()["misses"] == 1
+
+
+def test_entries_expire_after_ttl(make_cache, clock):
+    cache = make_cache(max_entries=10, ttl=60)
+    cache.set("a", 1)
+
+    clock.now += 59
+    assert cache.get("a") == 1
+    clock.now += 2
+    assert cache.get("a") is None
+
+
+def test_entries_without_ttl_do_not_expire(make_cache, clock):
+    cache = make_cache(max_entries=10, ttl=None)
+    cache.set("a", 1)
+
+    clock.now += 10 ** 6
+    assert cache.get("a") == 1
+
+
+def test_memory_cache_evicts_least_recently_used(clock):
+    cache = MemoryCache(max_entries=2)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")
+    cache.set("c", 3)
+
+    assert len(cache) == 2
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    assert cache.get("c") == 3
+
+
+def test_sqlite_cache_evicts_least_recently_used_in_batches(tmp_path, clock):
+    # With ten entries, a full table makes room for one more insert
+    cache = SQLiteCache(str(tmp_path / "cache.sqlite3"), max_entries=10)
+    for i in range(10):
+        cache.set(f"k{i}", i)
+    cache.get("k0")
+    cache.set("k10", 10)
+
+    assert len(cache) == 9
+    assert cache.get("k0") == 0
+    assert cache.get("k1") is None
+    assert cache.get("k2") is None
+    assert cache.get("k10") == 10
+
+
+def test_sqlite_cache_replacing_keys_does_not_evict(tmp_path, clock):
+    cache = SQLiteCache(str(tmp_path / "cache.sqlite3"), max_entries=10)
+    for i in range(10):
+        cache.set(f"k{i}", i)
+    for _ in range(5):
+        cache.set("k9", "new")
+
+    assert len(cache) == 10
+    assert cache.get("k0") == 0
+
+
+def test_sqlite_cache_survives_reopening(tmp_path, clock):
+    path = str(tmp_path / "cache.sqlite3")
+    cache = SQLiteCache(path)
+    cache.set("a", [1, 2])
+    cache.close()
+
+    reopened = SQLiteCache(path)
+    assert reopened.get("a") == [1, 2]
+    assert len(reopened) == 1
+    reopened.close()
+
+
+def test_delete_and_clear(make_cache, clock):
+    cache = make_cache(max_entries=10)
+    for key in "abc":
+        cache.set(key, key)
+
+    cache.delete("a")
+    assert cache.get("a") is None
+    assert len(cache) == 2
+
+    cache.clear()
+    assert len(cache) == 0
+    assert list(cache.items()) == []
+
+
+def test_items_are_least_recently_used_first(make_cache, clock):
+    cache = make_cache(max_entries=10)
+    for key in "abc":
+        cache.set(key, key)
+    cache.get("a")
+
+    assert [key for key, _ in cache.items()] == ["b", "c", "a"]
+
+
+def test_set_if_version_rejects_stale_writes(make_cache, clock):
+    cache = make_cache(max_entries=10)
+    assert cache.get_versioned("a") == (None, 0)
+
+    assert cache.set_if_version("a", "first", 0)
+    # A second writer that also read the entry as missing loses
+    assert not cache.set_if_version("a", "second", 0)
+    assert cache.get_versioned("a") == ("first", 1)
+
+    assert cache.set_if_version("a", "second", 1)
+    cache.set("a", "third")
+    assert cache.get_versioned("a") == ("third", 3)
+    assert not cache.set_if_version("a", "stale", 2)
+
+
+def test_expired_entry_reads_as_version_zero(make_cache, clock):
+    cache = make_cache(max_entries=10, ttl=60)
+    cache.set("a", "old")
+    clock.now += 61
+
+    assert cache.get_versioned("a") == (None, 0)
+    assert cache.set_if_version("a", "new", 0)
+    assert cache.get_versioned("a") == ("new", 1)
+
+
+def test_sqlite_cache_adds_the_version_column_to_old_files(tmp_path, clock):
+    path = str(tmp_path / "cache.sqlite3")
+    conn = sqlite3.connect(path)
+    conn.execute(
+        "CREATE TABLE entries (key TEXT PRIMARY KEY, value TEXT NOT NULL, "
+        "expires_at REAL, accessed_at REAL NOT NULL)"
+    )
+    conn.execute("INSERT INTO entries VALUES ('a', '\"old\"', NULL, 0)")
+    conn.commit()
+    conn.close()
+
+    cache = SQLiteCache(path)
+    assert cache.get_versioned("a") == ("old", 1)
+    assert cache.set_if_version("a", "new", 1)
+    cache.close()
@@ -0,0 +1,113 @@
+import asyncio
+
+import pytest
+
+from services.cache import MemoryCache
+from services.chat_sessions import ChatSession, SessionStore, estimate_tokens
+
+
+def session_with(*exchanges) -> ChatSession:
+    session = ChatSession("s")
+    for message, response in exchanges:
+        session.add_exchange(message, response)
+    return session
+
+
+def contents(session: ChatSession):
+    return [turn["content"] for turn in session.turns]
+
+
+def test_add_exchange_records_token_counts():
+    session = session_with(("hello there", "hi"))
+
+    assert session.history_tokens == estimate_tokens("hello there") + estimate_tokens("hi")
+    assert not session.is_empty
+
+
+def test_trim_drops_oldest_exchanges_first():
+    session = session_with(("a" * 40, "b" * 40), ("c" * 40, "d" * 40), ("e" * 40, "f" * 40))
+
+    dropped = session.trim(25)
+
+    assert [turn["content"] for turn in dropped] == ["a" * 40, "b" * 40, "c" * 40, "d" * 40]
+    assert contents(session) == ["e" * 40, "f" * 40]
+
+
+def test_trim_keeps_the_latest_exchange_over_budget():
+    session = session_with(("a" * 40, "b" * 40), ("c" * 400, "d" * 400))
+
+    session.trim(10)
+
+    assert contents(session) == ["c" * 400, "d" * 400]
+    assert session.trim(10) == []
+
+
+def test_trim_within_budget_keeps_everything():
+    session = session_with(("a", "b"), ("c", "d"))
+
+    assert session.trim(1000) == []
+    assert contents(session) == ["a", "b", "c", "d"]
+
+
+def test_messages_start_with_the_summary():
+    session = session_with(("a", "b"))
+    session.summary = "Talked about tomatoes."
+
+    assert session.messages() == [
+        {"role": "system", "content": "Summary of the earlier conversation: Talked about tomatoes."},
+        {"role": "user", "content": "a"},
+        {"role": "assistant", "content": "b"},
+    ]
+
+
+def test_from_dict_does_not_share_turns():
+    data = session_with(("a", "b")).to_dict()
+    session = ChatSession.from_dict("s", data)
+    session.add_exchange("c", "d")
+
+    assert len(data["turns"]) == 2
+
+
+def test_store_round_trip_and_stale_save():
+    async def run():
+        store = SessionStore(MemoryCache())
+        first = await store.load("s")
+        second = await store.load("s")
+        assert first.is_empty and first.version == 0
+
+        first.add_exchange("a", "b")
+        assert await store.save(first)
+        second.add_exchange("c", "d")
+        # Saved elsewhere since it was loaded
+        assert not await store.save(second)
+
+        return await store.load("s")
+
+    loaded = asyncio.run(run())
+
+    assert contents(loaded) == ["a", "b"]
+    assert loaded.version == 1
+
+
+@pytest.fixture
+def chat_service(monkeypatch):
+    monkeypatch.setenv("CHAT_PROVIDER", "stub")
+    monkeypatch.setenv("CHAT_CACHE_BACKEND", "none")
+    monkeypatch.setenv("CHAT_SESSION_BACKEND", "memory")
+    from services.chat_service import ChatService
+    return ChatService
+
+
+def test_concurrent_exchanges_from_two_workers_are_both_kept(chat_service):
+    async def run():
+        first, second = chat_service(), chat_service()
+        # Two workers sharing one store, each with its own session locks
+        second.sessions = SessionStore(first.sessions.backend)
+        stale_first = await first.sessions.load("s")
+        stale_second = await second.sessions.load("s")
+
+        await first._remember(stale_first, "m1", "r1")
+        await second._remember(stale_second, "m2", "r2")
+        return await first.sessions.load("s")
+
+    assert contents(asyncio.run(run())) == ["m1", "r1", "m2", "r2"]
@@ -0,0 +1,54 @@
+import pytest
+
+tf = pytest.importorskip("tensorflow")
+
+from export_model import export_savedmodel, export_tflite, sample_batch, verify_parity  # noqa: E402
+from models.plant_disease_model import IMAGE_SIZE  # noqa: E402
+
+
+def tiny_model(seed=0):
+    """A small classifier with the served model's input shape."""
+    tf.keras.utils.set_random_seed(seed)
+    return tf.keras.Sequential([
+        tf.keras.layers.Input(shape=(IMAGE_SIZE[1], IMAGE_SIZE[0], 3)),
+        tf.keras.layers.Conv2D(4, 3, strides=4, activation="relu"),
+        tf.keras.layers.GlobalAveragePooling2D(),
+        tf.keras.layers.Dense(5, activation="softmax"),
+    ])
+
+
+@pytest.fixture(scope="module")
+def model():
+    return tiny_model()
+
+
+@pytest.fixture(scope="module")
+def batch():
+    return sample_batch(count=4)
+
+
+def test_tflite_matches_keras(model, batch, tmp_path):
+    path = export_tflite(model, str(tmp_path / "model.tflite"))
+
+    passed, max_diff, agreement = verify_parity(model, "tflite", path, batch, tolerance=1e-4)
+
+    assert passed, f"max difference {max_diff:.2e}"
+    assert agreement == 1.0
+
+
+def test_savedmodel_matches_keras(model, batch, tmp_path):
+    path = export_savedmodel(model, str(tmp_path / "savedmodel"))
+
+    passed, max_diff, agreement = verify_parity(model, "savedmodel", path, batch, tolerance=1e-4)
+
+    assert passed, f"max difference {max_diff:.2e}"
+    assert agreement == 1.0
+
+
+def test_parity_fails_for_a_different_model(model, batch, tmp_path):
+    path = export_tflite(tiny_model(seed=1), str(tmp_path / "other.tflite"))
+
+    passed, max_diff, _ = verify_parity(model, "tflite", path, batch, tolerance=1e-4)
+
+    assert not passed
+    assert max_diff > 1e-4
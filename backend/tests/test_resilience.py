@@ -0,0 +1,225 @@
+import asyncio
+import random
+
+import pytest
+
+from services.resilience import (
+    CircuitBreaker,
+    CircuitOpenError,
+    RateLimitedError,
+    RateLimiter,
+    RetryPolicy,
+    TokenBucket,
+    UpstreamGuard,
+    is_transient,
+)
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr("services.resilience.time.monotonic", clock)
+    return clock
+
+
+class UpstreamError(Exception):
+    def __init__(self, status_code, headers=None):
+        super().__init__(f"HTTP {status_code}")
+        self.status_code = status_code
+        self.response = type("Response", (), {"headers": headers or {}})()
+
+
+def test_is_transient():
+    assert is_transient(UpstreamError(429))
+    assert is_transient(UpstreamError(503))
+    assert is_transient(asyncio.TimeoutError())
+    assert not is_transient(UpstreamError(400))
+    assert not is_transient(ValueError("bad request"))
+
+
+def test_token_bucket_refills_at_its_rate(clock):
+    bucket = TokenBucket(rate_per_minute=60, capacity=10)
+    assert bucket.wait_time(10) == 0
+
+    bucket.take(10)
+    assert bucket.wait_time(1) == pytest.approx(1.0)
+    assert bucket.wait_time(5) == pytest.approx(5.0)
+
+    clock.now += 3
+    assert bucket.wait_time(3) == 0
+    assert bucket.wait_time(4) == pytest.approx(1.0)
+
+
+def test_token_bucket_never_holds_more_than_its_capacity(clock):
+    bucket = TokenBucket(rate_per_minute=60, capacity=10)
+    clock.now += 3600
+
+    assert bucket.wait_time(10) == 0
+    # A request larger than the bucket waits for a full bucket, not forever
+    bucket.take(10)
+    assert bucket.wait_time(25) == pytest.approx(10.0)
+
+
+def test_token_bucket_capacity_defaults_to_ten_seconds_worth():
+    assert TokenBucket(rate_per_minute=600).capacity == 100
+
+
+def test_rate_limiter_rejects_requests_that_would_wait_too_long(clock):
+    limiter = RateLimiter(requests_per_minute=60, max_wait=0.5)
+    limiter.requests.available = 0
+
+    with pytest.raises(RateLimitedError):
+        asyncio.run(limiter.acquire())
+
+
+def test_retry_delays_use_full_jitter_up_to_the_cap():
+    random.seed(0)
+    policy = RetryPolicy(max_attempts=5, base_delay=0.5, max_delay=4)
+
+    for attempt, ceiling in enumerate([0.5, 1, 2, 4, 4, 4]):
+        delays = [policy.delay(attempt) for _ in range(200)]
+        assert all(0 <= delay <= ceiling for delay in delays)
+        assert max(delays) > ceiling / 2
+
+
+def test_retry_after_header_takes_precedence_within_the_cap():
+    policy = RetryPolicy(base_delay=0.5, max_delay=8)
+
+    assert policy.delay(0, UpstreamError(429, {"retry-after": "3"})) == 3
+    assert policy.delay(0, UpstreamError(429, {"retry-after": "60"})) == 8
+
+
+def test_retry_policy_makes_at_least_one_attempt():
+    assert RetryPolicy(max_attempts=0).max_attempts == 1
+
+
+def test_breaker_opens_after_consecutive_failures(clock):
+    breaker = CircuitBreaker(failure_threshold=3, reset_timeout=30)
+    for _ in range(2):
+        breaker.before_call()
+        breaker.record_failure()
+    assert breaker.state == CircuitBreaker.CLOSED
+
+    breaker.before_call()
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+
+
+def test_success_resets_the_failure_count(clock):
+    breaker = CircuitBreaker(failure_threshold=2)
+    breaker.record_failure()
+    breaker.record_success()
+    breaker.record_failure()
+
+    assert breaker.state == CircuitBreaker.CLOSED
+
+
+def test_breaker_lets_one_trial_call_through_after_the_timeout(clock):
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=30)
+    breaker.record_failure()
+    clock.now += 29
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+
+    clock.now += 1
+    breaker.before_call()
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    # Only one trial at a time
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+
+    breaker.record_success()
+    assert breaker.state == CircuitBreaker.CLOSED
+    breaker.before_call()
+
+
+def test_failed_trial_opens_the_breaker_again(clock):
+    breaker = CircuitBreaker(failure_threshold=3, reset_timeout=30)
+    for _ in range(3):
+        breaker.record_failure()
+    clock.now += 30
+    breaker.before_call()
+
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+
+
+def test_released_trial_lets_the_next_call_through(clock):
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=30)
+    breaker.record_failure()
+    clock.now += 30
+    breaker.before_call()
+
+    breaker.release()
+    breaker.before_call()
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+
+
+def guard(max_attempts=3, failure_threshold=5):
+    return UpstreamGuard(
+        RateLimiter(),
+        RetryPolicy(max_attempts=max_attempts, base_delay=0),
+        CircuitBreaker(failure_threshold=failure_threshold),
+    )
+
+
+def flaky(*outcomes):
+    """Async function raising or returning each of ``outcomes`` in turn."""
+    calls = []
+
+    async def call():
+        outcome = outcomes[len(calls)]
+        calls.append(outcome)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+    return call, calls
+
+
+def test_guard_retries_transient_errors():
+    call, calls = flaky(UpstreamError(503), UpstreamError(429), "answer")
+
+    assert asyncio.run(guard().call(call)) == "answer"
+    assert len(calls) == 3
+
+
+def test_guard_gives_up_after_max_attempts():
+    call, calls = flaky(UpstreamError(503), UpstreamError(503), "answer")
+
+    with pytest.raises(UpstreamError):
+        asyncio.run(guard(max_attempts=2).call(call))
+    assert len(calls) == 2
+
+
+def test_guard_does_not_retry_other_errors():
+    call, calls = flaky(UpstreamError(400), "answer")
+    upstream = guard()
+
+    with pytest.raises(UpstreamError):
+        asyncio.run(upstream.call(call))
+    assert len(calls) == 1
+    assert upstream.breaker.failures == 0
+
+
+def test_guard_stops_retrying_once_the_breaker_opens():
+    call, calls = flaky(UpstreamError(503), UpstreamError(503), "answer")
+    upstream = guard(max_attempts=5, failure_threshold=2)
+
+    with pytest.raises(UpstreamError):
+        asyncio.run(upstream.call(call))
+    assert len(calls) == 2
+    with pytest.raises(CircuitOpenError):
+        asyncio.run(upstream.call(call))
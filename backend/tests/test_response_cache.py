@@ -0,0 +1,64 @@
+import numpy as np
+import pytest
+
+from services.cache import MemoryCache
+from services.response_cache import ResponseCache, embed, normalize_message
+
+CONTEXT = ("en", "gpt-3.5-turbo", 0.7)
+
+
+def test_normalize_message_ignores_case_punctuation_and_spacing():
+    assert normalize_message("  How do I treat   LATE blight?! ") == "how do i treat late blight"
+
+
+def test_embeddings_are_unit_length():
+    assert np.linalg.norm(embed("tomato late blight")) == pytest.approx(1.0)
+    assert not embed("").any()
+
+
+def test_exact_hit_after_normalization():
+    cache = ResponseCache(MemoryCache())
+    cache.set("How do I treat late blight?", *CONTEXT, "Remove infected leaves.")
+
+    assert cache.get("how do i treat LATE BLIGHT", *CONTEXT) == "Remove infected leaves."
+    assert cache.get("How do I treat late blight?", "fr", *CONTEXT[1:]) is None
+
+
+def test_semantic_hit_for_a_similar_message():
+    cache = ResponseCache(MemoryCache(), similarity_threshold=0.7)
+    cache.set("how do i treat late blight on tomatoes", *CONTEXT, "Remove infected leaves.")
+
+    assert cache.get("how should i treat late blight on my tomatoes", *CONTEXT) == "Remove infected leaves."
+    assert cache.get("why are my cucumber leaves turning yellow", *CONTEXT) is None
+    # Similar messages are only shared within the same language and model
+    assert cache.get("how should i treat late blight on my tomatoes", "fr", *CONTEXT[1:]) is None
+
+    stats = cache.stats()
+    assert stats["semantic_hits"] == 1
+    assert stats["misses"] == 2
+
+
+def test_semantic_lookup_is_off_by_default():
+    cache = ResponseCache(MemoryCache())
+    cache.set("how do i treat late blight on tomatoes", *CONTEXT, "Remove infected leaves.")
+
+    assert cache.get("how should i treat late blight on my tomatoes", *CONTEXT) is None
+
+
+def test_index_is_rebuilt_from_the_backend():
+    backend = MemoryCache()
+    ResponseCache(backend, similarity_threshold=0.7).set(
+        "how do i treat late blight on tomatoes", *CONTEXT, "Remove infected leaves."
+    )
+
+    cache = ResponseCache(backend, similarity_threshold=0.7)
+    assert cache.get("how should i treat late blight on my tomatoes", *CONTEXT) == "Remove infected leaves."
+
+
+def test_evicted_entry_is_not_returned_as_similar():
+    backend = MemoryCache(max_entries=1)
+    cache = ResponseCache(backend, similarity_threshold=0.7)
+    cache.set("how do i treat late blight on tomatoes", *CONTEXT, "Remove infected leaves.")
+    cache.set("why are my cucumber leaves turning yellow", *CONTEXT, "Check the watering.")
+
+    assert cache.get("how should i treat late blight on my tomatoes", *CONTEXT) is None
@@ -0,0 +1,86 @@
+import asyncio
+
+import pytest
+
+from services.single_flight import SingleFlight
+
+
+def test_concurrent_calls_for_a_key_share_one_computation():
+    calls = []
+
+    async def fetch():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return "answer"
+
+    async def run():
+        flight = SingleFlight("test")
+        results = await asyncio.gather(*(flight.do("key", fetch) for _ in range(5)))
+        return flight, results
+
+    flight, results = asyncio.run(run())
+
+    assert results == ["answer"] * 5
+    assert len(calls) == 1
+    assert flight.stats() == {"in_flight": 0, "coalesced": 4}
+
+
+def test_different_keys_are_computed_separately():
+    calls = []
+
+    def fetch(value):
+        async def run():
+            calls.append(value)
+            await asyncio.sleep(0.01)
+            return value
+        return run
+
+    async def run():
+        flight = SingleFlight("test")
+        return await asyncio.gather(flight.do("a", fetch("a")), flight.do("b", fetch("b")))
+
+    assert asyncio.run(run()) == ["a", "b"]
+    assert sorted(calls) == ["a", "b"]
+
+
+def test_exception_reaches_every_caller_and_is_not_kept():
+    calls = []
+
+    async def fail():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        raise ValueError("upstream failed")
+
+    async def succeed():
+        return "answer"
+
+    async def run():
+        flight = SingleFlight("test")
+        results = await asyncio.gather(flight.do("key", fail), flight.do("key", fail), return_exceptions=True)
+        # Nothing is cached once the work finishes, so the next call runs again
+        after = await flight.do("key", succeed)
+        return results, after
+
+    results, after = asyncio.run(run())
+
+    assert len(calls) == 1
+    assert all(isinstance(result, ValueError) for result in results)
+    assert after == "answer"
+
+
+def test_cancelled_caller_does_not_cancel_the_others():
+    async def fetch():
+        await asyncio.sleep(0.05)
+        return "answer"
+
+    async def run():
+        flight = SingleFlight("test")
+        first = asyncio.ensure_future(flight.do("key", fetch))
+        second = asyncio.ensure_future(flight.do("key", fetch))
+        await asyncio.sleep(0.01)
+        first.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await first
+        return await second
+
+    assert asyncio.run(run()) == "answer"
@@ -19,7 +19,7 @@ import {
   Fade,
 } from '@mui/material';
 import SendIcon from '@mui/icons-material/Send';
-import { sendMessage } from '../services/chatService';
+import { startSession, streamMessage } from '../services/chatService';
 
 function ChatBot() {
   const [messages, setMessages] = useState([]);
@@ -28,6 +28,8 @@ function ChatBot() {
   const [loading, setLoading] = useState(false);
   const [error, setError] = useState(null);
   const messagesEndRef = useRef(null);
+  // Server-side conversation, so follow-up questions keep their context
+  const sessionIdRef = useRef(null);
 
   const scrollToBottom = () => {
     messagesEndRef.current?.scrollIntoView({ behavior: 'smooth' });
@@ -47,8 +49,32 @@ function ChatBot() {
     setError(null);
 
     try {
-      const response = await sendMessage(userMessage, language);
-      setMessages(prev => [...prev, { text: response.response, sender: 'bot' }]);
+      let started = false;
+      const appendToken = (token) => {
+        const first = !started;
+        started = true;
+        setMessages(prev => {
+          if (first) {
+            return [...prev, { text: token, sender: 'bot' }];
+          }
+          const last = prev[prev.length - 1];
+          return [...prev.slice(0, -1), { ...last, text: last.text + token }];
+        });
+        if (first) {
+          setLoading(false);
+        }
+      };
+
+      if (!sessionIdRef.current) {
+        sessionIdRef.current = await startSession();
+      }
+      const response = await streamMessage(userMessage, language, appendToken, sessionIdRef.current);
+      if (!started || (response && response.status === 'error')) {
+        const text = response ? response.response : 'Sorry, I encountered an error. Please try again.';
+        setMessages(prev => (started
+          ? [...prev.slice(0, -1), { text, sender: 'bot' }]
+          : [...prev, { text, sender: 'bot' }]));
+      }
     } catch (err) {
       setError('Failed to send message. Please try again.');
       setMessages(prev => [...prev, {
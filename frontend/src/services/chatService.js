@@ -3,11 +3,25 @@ import axios from 'axios';
 // Use environment variable for API URL, fallback to localhost for development
 const API_URL = process.env.REACT_APP_API_URL || 'http://localhost:8000';
 
-export const sendMessage = async (message, language = 'en') => {
+// Start a server-side conversation; resolves with its session_id, or null
+// when the server has sessions disabled.
+export const startSession = async () => {
+  try {
+    const response = await axios.post(`${API_URL}/chat/sessions`);
+    return response.data.session_id;
+  } catch (error) {
+    console.error('Error starting chat session:', error);
+    return null;
+  }
+};
+
+// Pass a session_id from startSession to continue that conversation.
+export const sendMessage = async (message, language = 'en', sessionId = null) => {
   try {
     const response = await axios.post(`${API_URL}/chat`, {
       message,
-      language
+      language,
+      session_id: sessionId
     }, {
       headers: {
         'Content-Type': 'application/json',
@@ -18,4 +32,49 @@ export const sendMessage = async (message, language = 'en') => {
     console.error('Error sending message:', error);
     throw error;
   }
-}; 
\ No newline at end of file
+}; 
+// Stream the response token by token from /chat/stream (Server-Sent Events).
+// onToken is called with each chunk of text; resolves with the final envelope.
+// Pass a session_id from startSession to continue that conversation.
+export const streamMessage = async (message, language = 'en', onToken = () => {}, sessionId = null) => {
+  const response = await fetch(`${API_URL}/chat/stream`, {
+    method: 'POST',
+    headers: {
+      'Content-Type': 'application/json',
+    },
+    body: JSON.stringify({ message, language, session_id: sessionId }),
+  });
+  if (!response.ok || !response.body) {
+    throw new Error(`Chat stream failed with status ${response.status}`);
+  }
+
+  const reader = response.body.getReader();
+  const decoder = new TextDecoder();
+  let buffer = '';
+  let result = null;
+
+  while (true) {
+    const { done, value } = await reader.read();
+    if (done) break;
+    buffer += decoder.decode(value, { stream: true });
+
+    const events = buffer.split('\n\n');
+    buffer = events.pop();
+    for (const raw of events) {
+      const lines = raw.split('\n');
+      const eventLine = lines.find(line => line.startsWith('event: '));
+      const data = JSON.parse(
+        lines
+          .filter(line => line.startsWith('data: '))
+          .map(line => line.slice(6))
+          .join('\n')
+      );
+      if (eventLine && eventLine.slice(7) === 'done') {
+        result = data;
+      } else {
+        onToken(data.token);
+      }
+    }
+  }
+  return result;
+};